@@ -0,0 +1,263 @@
+# stand-in for the bpy and bmesh modules, so the bpy dependent stages can be benchmarked without Blender.
+# Only the calls stl_to_tscn makes are provided: importing an .stl reads it with stl_io and exporting an .obj
+# writes its vertices and faces, so the file handling is real but Blender's mesh processing costs nothing.
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+
+class StandinObject:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.mode = 'OBJECT'
+        self.modifiers = StandinModifiers()
+        self.selected = True
+        self.matrix_world = np.eye(4)
+
+    def select_set(self, state):
+        self.selected = state
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+class StandinModifiers(list):
+    """ Modifiers are only recorded (the exported .obj files are never decimated) """
+    def new(self, name, type):
+        modifier = types.SimpleNamespace(name=name, type=type)
+        self.append(modifier)
+        return modifier
+
+class StandinMesh:
+    """ The triangles of one imported solid """
+    def __init__(self, positions, indices):
+        self.positions = positions
+        self.indices = indices
+        self.polygons = StandinPolygons(self)
+        self.vertices = StandinVertices(self)
+        self.loop_triangles = StandinLoopTriangles(self)
+        self.loops = StandinLoops(self)
+        self.uv_layers = types.SimpleNamespace(active=None)
+        self.materials = []
+
+    def from_pydata(self, vertices, edges, faces):
+        self.positions = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+        self.indices = np.array(faces, dtype=np.uint32).reshape(-1, 3)
+
+    def update(self):
+        pass
+
+    def calc_loop_triangles(self):
+        pass
+
+class StandinLoops:
+    """ Loop i is corner i % 3 of triangle i // 3 """
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def __len__(self):
+        return self.mesh.indices.size
+
+    def foreach_get(self, attribute, array):
+        array[:] = self.mesh.indices.reshape(-1)
+
+class StandinVertices:
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def __len__(self):
+        return len(self.mesh.positions)
+
+    def foreach_get(self, attribute, array):
+        array[:] = self.mesh.positions.reshape(-1)
+
+class StandinLoopTriangles:
+    """ The triangles are their own loop triangles, loop i being corner i % 3 of triangle i // 3 (there is no uv map) """
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def __len__(self):
+        return len(self.mesh.indices)
+
+    def foreach_get(self, attribute, array):
+        if attribute == "vertices":
+            array[:] = self.mesh.indices.reshape(-1)
+        elif attribute == "loops":
+            array[:] = np.arange(self.mesh.indices.size)
+        else:
+            corners = self.mesh.positions[self.mesh.indices].astype(np.float64)
+            normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            array[:] = (normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)).reshape(-1)
+
+class StandinPolygons:
+    """ Triangle faces of an imported mesh, as far as foreach_get("loop_total"), ("loop_start"), and ("center") are concerned """
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def __len__(self):
+        return len(self.mesh.indices)
+
+    def foreach_get(self, attribute, array):
+        if attribute == "center":
+            array[:] = self.mesh.positions[self.mesh.indices].mean(axis=1).reshape(-1)
+        elif attribute == "loop_start":
+            array[:] = 3 * np.arange(len(self.mesh.indices))
+        else:
+            array[:] = 3
+
+class StandinPixels:
+    def __init__(self, image):
+        self.image = image
+
+    def foreach_get(self, array):
+        array[:] = self.image.pixels_array.reshape(-1)
+
+    def foreach_set(self, array):
+        self.image.pixels_array = np.asarray(array, dtype=np.float32).reshape(-1, 4)
+
+class StandinImage:
+    """ An image of the size its file name ends with (ex: _64x32.jpg, 16x16 otherwise), saved as raw pixels """
+    def __init__(self, name, width, height):
+        self.name = name
+        self.size = (width, height)
+        self.pixels_array = np.full((width * height, 4), 0.5, dtype=np.float32)
+        self.pixels = StandinPixels(self)
+        self.filepath_raw = ""
+        self.file_format = 'PNG'
+        self.colorspace_settings = types.SimpleNamespace(name='sRGB')
+
+    def scale(self, width, height):
+        self.size = (width, height)
+        self.pixels_array = np.full((width * height, 4), 0.5, dtype=np.float32)
+
+    def save(self):
+        (np.clip(self.pixels_array, 0, 1) * 255).astype(np.uint8).tofile(self.filepath_raw)
+
+class StandinImages(list):
+    def load(self, filepath):
+        Path(filepath).stat()
+        size = Path(filepath).stem.rsplit("_", 1)[-1].split("x")
+        width, height = (int(size[0]), int(size[1])) if len(size) == 2 and all(n.isdigit() for n in size) else (16, 16)
+        image = StandinImage(Path(filepath).name, width, height)
+        self.append(image)
+        return image
+
+    def new(self, name, width, height, alpha=False):
+        image = StandinImage(name, width, height)
+        self.append(image)
+        return image
+
+class StandinObjects(list):
+    def new(self, name, data):
+        # linking it to the scene (context.collection.objects.link) adds it to the list
+        return StandinObject(name, data)
+
+class StandinMeshes(list):
+    def new(self, name):
+        mesh = StandinMesh(np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.uint32))
+        self.append(mesh)
+        return mesh
+
+class StandinData:
+    def __init__(self):
+        self.objects = StandinObjects()
+        self.meshes = StandinMeshes()
+        self.materials = []
+        self.images = StandinImages()
+        self.textures = []
+
+    def clear(self):
+        self.__init__()
+
+def install():
+    """ Registers the stand-in bpy and bmesh modules (only if Blender's aren't importable) and returns True if it did """
+    try:
+        import bpy # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    import stl_io
+
+    data = StandinData()
+    context = types.SimpleNamespace(selected_objects=[], object=None, view_layer=types.SimpleNamespace(objects=types.SimpleNamespace(active=None)))
+
+    def read_factory_settings(use_empty=True):
+        data.clear()
+        context.selected_objects = []
+        context.object = None
+
+    def import_stl(filepath):
+        objects = []
+        for solid in stl_io.read_stl(filepath):
+            mesh = StandinMesh(solid.positions, solid.indices)
+            obj = StandinObject(solid.name, mesh)
+            data.objects.append(obj)
+            data.meshes.append(mesh)
+            objects.append(obj)
+        context.selected_objects = objects
+        context.object = objects[0] if objects else None
+
+    def mode_set(mode):
+        if context.object is not None:
+            context.object.mode = mode
+
+    def select_all(action='TOGGLE'):
+        for obj in data.objects:
+            obj.select_set(action != 'DESELECT')
+
+    def obj_export(filepath, export_selected_objects=False):
+        with open(filepath, 'w') as f:
+            offset = 1
+            for obj in data.objects:
+                if export_selected_objects and not obj.selected:
+                    continue
+                f.write(f"o {obj.name}\n")
+                np.savetxt(f, obj.data.positions, fmt="v %.6f %.6f %.6f")
+                np.savetxt(f, obj.data.indices + offset, fmt="f %d %d %d")
+                offset += len(obj.data.positions)
+        Path(filepath).with_suffix('.mtl').write_text("")
+
+    def noop(*args, **kwargs):
+        pass
+
+    bpy = types.ModuleType("bpy")
+    bpy.data = data
+    bpy.context = context
+    context.evaluated_depsgraph_get = lambda: None
+    context.collection = types.SimpleNamespace(objects=types.SimpleNamespace(link=lambda obj: data.objects.append(obj)))
+    bpy.ops = types.SimpleNamespace(
+        wm=types.SimpleNamespace(read_factory_settings=read_factory_settings, obj_export=obj_export),
+        import_mesh=types.SimpleNamespace(stl=import_stl),
+        object=types.SimpleNamespace(mode_set=mode_set, select_all=select_all),
+        mesh=types.SimpleNamespace(select_all=noop, dissolve_limited=noop, tris_convert_to_quads=noop),
+        uv=types.SimpleNamespace(smart_project=noop, cube_project=noop, cylinder_project=noop, sphere_project=noop, unwrap=noop)
+    )
+
+    class StandinBMesh:
+        """ Compression is a no-op, so the mesh is never changed """
+        verts = edges = faces = ()
+
+        def from_mesh(self, mesh):
+            pass
+
+        def to_mesh(self, mesh):
+            pass
+
+        def free(self):
+            pass
+
+    bmesh = types.ModuleType("bmesh")
+    bmesh.new = StandinBMesh
+    bmesh.ops = types.SimpleNamespace(dissolve_limited=noop, join_triangles=noop)
+
+    sys.modules["bpy"] = bpy
+    sys.modules["bmesh"] = bmesh
+    return True
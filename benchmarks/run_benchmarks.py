@@ -0,0 +1,175 @@
+# times every stage of the stl_to_tscn, textures, and mcnp_to_csv pipelines on synthetic inputs
+# example run
+# python3 benchmarks/run_benchmarks.py --meshes 20 --triangles 100000 --voxels 1000000 --output results.json
+# python3 benchmarks/run_benchmarks.py --compare results.json --output new_results.json
+import argparse
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(REPO / "stl_to_obj"))
+
+import synthetic
+import blender_standin
+
+# must be installed before stl_to_tscn imports bpy
+STANDIN = blender_standin.install()
+
+import stl_to_tscn
+import textures
+import mcnp_to_csv
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Stage:
+    """ Context manager that records the wall time, cpu time, and peak memory of one stage.
+
+    The peak RSS of the process only ever grows, so stages are run from the smallest to the largest.
+    With trace_memory, the peak of the allocations made during the stage is also recorded with tracemalloc
+    (this slows down python heavy stages, so the times of such runs shouldn't be compared with untraced runs).
+
+    Attributes
+    ----------
+    name : str
+        name of the stage
+    results : dict
+        where the measurements are stored (under name)
+    trace_memory : bool
+        whether to trace the allocations of the stage
+    info : dict
+        extra values stored with the measurements (ex: the number of triangles)
+    """
+    trace_memory = False
+
+    def __init__(self, name, results, **info):
+        self.name = name
+        self.results = results
+        self.info = info
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        measurements = dict(wall_seconds=wall, cpu_seconds=cpu, peak_rss_mb=peak_rss_mb())
+        if self.trace_memory:
+            measurements["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            tracemalloc.stop()
+        self.results[self.name] = measurements | self.info
+        print(f"{self.name:>20}: {wall:8.3f} s wall {cpu:8.3f} s cpu {measurements['peak_rss_mb']:9.1f} MB peak RSS")
+        return False
+
+def run(args):
+    results = dict()
+    work = Path(tempfile.mkdtemp(prefix="level-gen-bench-"))
+    input_folder = work / "stl"
+    output_folder = work / "out"
+    input_folder.mkdir()
+    output_folder.mkdir()
+
+    # synthetic inputs (not timed)
+    stl_files = []
+    for i in range(args.meshes):
+        corners = synthetic.surface_triangles(args.triangles, seed=i)
+        stl_file = input_folder / f"mesh{i}.stl"
+        if args.ascii:
+            synthetic.write_ascii_stl(stl_file, corners, f"mesh{i}")
+        else:
+            synthetic.write_binary_stl(stl_file, corners)
+        stl_files.append(stl_file.name)
+    textures.load_textures(REPO / "stl_to_obj" / "textures.json")
+    textures.load_textures(REPO / "stl_to_obj" / "more_textures.json")
+    texture_names = list(textures.texture_dict) + list(textures.other_textures)
+    manifest = work / f"input{args.manifest_format}"
+    synthetic.write_manifest(manifest, input_folder, output_folder, stl_files, texture_names, args.collision_mode)
+    meshtal = work / "meshtal.txt"
+    shape = synthetic.write_meshtal(meshtal, args.voxels)
+
+    with Stage("manifest_parsing", results, meshes=args.meshes):
+        data = stl_to_tscn.load_manifest(manifest)
+
+    tscn = stl_to_tscn.TscnGenerator(str(input_folder), str(output_folder), data["header"]["scale"])
+    with Stage("texture_resolution", results, textures=len(texture_names)):
+        for m in data["meshes"]:
+            tscn.add_texture(m["texture"])
+
+    triangles = args.meshes * len(synthetic.surface_triangles(args.triangles))
+    with Stage("obj_generation", results, triangles=triangles, blender_standin=STANDIN):
+        for m in data["meshes"]:
+            stl_to_tscn.export_obj(str(input_folder), str(output_folder), Path(m["stl_file"]).stem, m["uv_map"], m["mesh_compression"])
+
+    collisions = []
+    with Stage("collisions", results, triangles=triangles, collision_mode=args.collision_mode):
+        for m in data["meshes"]:
+            collisions.append(stl_to_tscn.export_collisions(str(input_folder), str(output_folder), Path(m["stl_file"]).stem, m["collision_mode"]))
+
+    with Stage("tscn_writing", results, meshes=args.meshes):
+        for m, collision in zip(data["meshes"], collisions):
+            stl_file_extless = Path(m["stl_file"]).stem
+            tscn.add_obj_node(stl_file_extless, m["texture"])
+            if collision["shapes"]:
+                tscn.add_collision_shapes(stl_file_extless, collision["shapes"])
+            else:
+                tscn.add_collision_node(stl_file_extless)
+        with open(output_folder / "scene.tscn", 'w') as tscn_file:
+            tscn.scene.write(tscn_file)
+
+    with Stage("tally_parsing", results, voxels=shape[0] * shape[1] * shape[2], megabytes=meshtal.stat().st_size / (1 << 20)):
+        mcnp_to_csv.mcnp_to_csv(meshtal, work / "tally.csv", binary=True)
+
+    return {
+        "parameters": vars(args) | {"work_folder": str(work)},
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": results
+    }
+
+def compare(previous, current):
+    """ Prints the wall time and memory of every stage relative to a previous run """
+    for name, stage in current["stages"].items():
+        if name not in previous["stages"]:
+            continue
+        before = previous["stages"][name]
+        time_ratio = stage["wall_seconds"] / before["wall_seconds"] if before["wall_seconds"] else float('nan')
+        memory_ratio = stage["peak_rss_mb"] / before["peak_rss_mb"] if before["peak_rss_mb"] else float('nan')
+        print(f"{name:>20}: {time_ratio:6.2f}x time {memory_ratio:6.2f}x memory")
+
+def main():
+    parser = argparse.ArgumentParser(prog = "level-gen pipeline benchmarks")
+    parser.add_argument("--meshes", type = int, default = 10, help = "number of synthetic .stl files")
+    parser.add_argument("--triangles", type = int, default = 10000, help = "approximate triangles per .stl file")
+    parser.add_argument("--ascii", action = "store_true", help = "write ascii instead of binary .stl files")
+    parser.add_argument("--voxels", type = int, default = 100000, help = "approximate voxels of the synthetic mesh tally")
+    parser.add_argument("--collision-mode", type = str, default = "trimesh", help = "collision_mode of every mesh")
+    parser.add_argument("--manifest-format", type = str, default = ".json", choices = [".json", ".csv"], help = "format of the synthetic input file")
+    parser.add_argument("--trace-memory", action = "store_true", help = "also record the peak allocations of every stage (slows down the stages)")
+    parser.add_argument("--output", "-o", type = str, default = "bench_results.json", help = "where to write the results")
+    parser.add_argument("--compare", type = str, default = None, help = "results of a previous run to compare against")
+    args = parser.parse_args()
+
+    Stage.trace_memory = args.trace_memory
+    output = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent = 4)
+    print(f"peak RSS {output['peak_rss_mb']:.1f} MB, results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), output)
+
+if __name__ == "__main__":
+    main()
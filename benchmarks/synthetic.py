@@ -0,0 +1,122 @@
+# generators of synthetic inputs (.stl files, manifests, and mcnp mesh tallies) of any size for the benchmarks
+import csv
+import json
+import math
+import struct
+from pathlib import Path
+
+import numpy as np
+
+def surface_triangles(triangles, seed=0):
+    """
+    Returns the (m, 3, 3) corners of a bumpy height field surface with about the requested number of triangles.
+
+    Parameters
+    ----------
+    triangles : int
+        approximate number of triangles
+    seed : int
+        seed of the random bumps
+    """
+    n = max(int(math.sqrt(triangles / 2)), 1)
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.arange(n + 1, dtype=np.float32), np.arange(n + 1, dtype=np.float32), indexing='ij')
+    z = rng.random((n + 1, n + 1), dtype=np.float32)
+    grid = np.stack([x, y, z], axis=-1)
+    v00, v10, v01, v11 = grid[:-1, :-1], grid[1:, :-1], grid[:-1, 1:], grid[1:, 1:]
+    first = np.stack([v00, v10, v11], axis=-2).reshape(-1, 3, 3)
+    second = np.stack([v00, v11, v01], axis=-2).reshape(-1, 3, 3)
+    return np.concatenate([first, second])
+
+def write_binary_stl(filepath, corners):
+    """ Writes (m, 3, 3) triangle corners as a binary .stl """
+    triangles = np.zeros(len(corners), dtype=[("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+    triangles["vertices"] = corners
+    with open(filepath, 'wb') as f:
+        f.write(b'synthetic'.ljust(80, b'\0'))
+        f.write(struct.pack("<I", len(corners)))
+        triangles.tofile(f)
+
+def write_ascii_stl(filepath, corners, name="synthetic"):
+    """ Writes (m, 3, 3) triangle corners as an ascii .stl """
+    with open(filepath, 'w') as f:
+        f.write(f"solid {name}\n")
+        for triangle in corners:
+            f.write(" facet normal 0 0 0\n  outer loop\n")
+            for vertex in triangle:
+                f.write(f"   vertex {vertex[0]:e} {vertex[1]:e} {vertex[2]:e}\n")
+            f.write("  endloop\n endfacet\n")
+        f.write(f"endsolid {name}\n")
+
+def write_manifest(filepath, input_folder, output_folder, stl_files, textures, collision_mode="trimesh"):
+    """
+    Writes an input file for stl_to_tscn (.json or .csv, based on the extension of filepath).
+
+    Parameters
+    ----------
+    filepath : str
+        where to write the manifest
+    input_folder : str
+        location of the .stl files
+    output_folder : str
+        the output folder of stl_to_tscn
+    stl_files : list
+        names of the .stl files
+    textures : list
+        textures to cycle through
+    collision_mode : str
+        collision_mode of every mesh
+    """
+    header = {"input_folder": str(input_folder), "output_folder": str(output_folder), "scale": 0.01, "extra_textures": ""}
+    meshes = [{
+        "stl_file": stl_file,
+        "uv_map": "cube",
+        "texture": textures[i % len(textures)],
+        "collisions": True,
+        "collision_mode": collision_mode,
+        "mesh_compression": "limited_dissolve"
+    } for i, stl_file in enumerate(stl_files)]
+
+    if Path(filepath).suffix == ".json":
+        with open(filepath, 'w') as f:
+            json.dump({"header": header, "meshes": meshes}, f, indent = 4)
+        return
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(header))
+        writer.writeheader()
+        writer.writerow(header)
+        writer = csv.DictWriter(f, fieldnames=list(meshes[0]))
+        writer.writeheader()
+        writer.writerows(meshes)
+
+def write_meshtal(filepath, voxels, seed=0):
+    """
+    Writes an mcnp mesh tally (column format) with about the requested number of voxels.
+
+    Returns
+    -------
+    tuple
+        the number of voxels along x, y, z
+    """
+    n = max(round(voxels ** (1 / 3)), 1)
+    shape = (n, n, max(voxels // (n * n), 1))
+    boundaries = [np.linspace(-100.0, 100.0, count + 1) for count in shape]
+    centers = [(b[:-1] + b[1:]) / 2 for b in boundaries]
+
+    rng = np.random.default_rng(seed)
+    with open(filepath, 'w') as f:
+        f.write(" mcnp   version 6     ld=synthetic\n Mesh Tally Number        14\n")
+        f.write(" This is a neutron mesh tally.\n\n Tally bin boundaries:\n")
+        for axis, b in zip("XYZ", boundaries):
+            f.write(f"    {axis} direction: " + " ".join(f"{value:.2f}" for value in b) + "\n")
+        f.write("    Energy bin boundaries:  0.00E+00 1.00E+36\n\n")
+        f.write("   Energy         X         Y         Z     Result     Rel Error\n")
+        # write a plane of voxels at a time so memory stays bounded
+        y, z = np.meshgrid(centers[1], centers[2], indexing='ij')
+        for x in centers[0]:
+            plane = np.column_stack([
+                np.full(y.size, 1e36), np.full(y.size, x), y.reshape(-1), z.reshape(-1),
+                rng.random(y.size), rng.random(y.size)
+            ])
+            np.savetxt(f, plane, fmt=["%11.3E", "%10.3f", "%9.3f", "%9.3f", "%11.5E", "%11.5E"])
+    return shape
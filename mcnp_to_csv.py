@@ -1,48 +1,359 @@
 # 1. generate array of boundaries for x, y, and z
 # 2. generate array of centroid (x,y,z), result, relative error
 import argparse
+import glob
+import json
+import os
+import re
+import sys
+import resource
+import shutil
+import tempfile
+import time
+import warnings
+import zipfile
 from pathlib import Path, PurePath
 
-def mcnp_to_csv(mcnpFile, outputFile):
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "stl_to_obj"))
+
+from worker_pool import run_pool
+
+# size of the blocks the voxel section is read in, memory use is bounded by this instead of the file size
+CHUNK_SIZE = 64 << 20
+
+# leading column (energy) of a voxel line, and the whitespace between the other columns
+LEADING_COLUMN = re.compile(rb"^[ \t]*\S+[ \t]+", re.MULTILINE)
+COLUMN_SEPARATOR = re.compile(rb"[ \t]+")
+LINE_PADDING = re.compile(rb"[ \t]*\r?\n")
+BLANK_LINE = re.compile(rb"^\n", re.MULTILINE)
+
+# files written by the batch mode, skipped when looking for tallies
+OUTPUT_SUFFIXES = [".csv", ".npz"]
+SUMMARY_FILENAME = "summary.json"
+
+# arrays of the voxels in the .npz, and their number of columns
+VOXEL_ARRAYS = {"centroids": 3, "result": 1, "rel_error": 1}
+
+def read_header(mcnpFile):
+    """
+    Reads the mesh tally up to (and including) the column names of the voxel section.
+
+    Parameters
+    ----------
+    mcnpFile : file
+        mcnp file opened in binary mode
+
+    Returns
+    -------
+    list
+        the boundaries of each axis (x, y, z) as the strings written in the file
+    """
+    # 1a. find line that has x boundaries
+    mcnpLine = mcnpFile.readline()
+    while b"X direction:" not in mcnpLine:
+        if not mcnpLine:
+            raise ValueError("no X direction boundaries found in mcnp file")
+        mcnpLine = mcnpFile.readline()
+    # 1b. split line into all the boundaries, do this 3 times for the 3 axes
+    boundaries = []
+    for _ in range(3):
+        boundaries.append(mcnpLine.decode().strip().split()[2:])
+        mcnpLine = mcnpFile.readline()
+
+    # advance to the centroid and results section
+    while b"Result" not in mcnpLine:
+        if not mcnpLine:
+            raise ValueError("no Result section found in mcnp file")
+        mcnpLine = mcnpFile.readline()
+    return boundaries
+
+def read_voxel_chunks(mcnpFile, chunk_size=CHUNK_SIZE):
+    """
+    Yields the voxel section in blocks of about chunk_size bytes that always end on a full line.
+
+    Parameters
+    ----------
+    mcnpFile : file
+        mcnp file opened in binary mode, positioned after the column names (see read_header)
+    chunk_size : int
+        number of bytes to read at once
+    """
+    leftover = b''
+    while True:
+        block = mcnpFile.read(chunk_size)
+        if not block:
+            if leftover.strip():
+                yield leftover + b'\n'
+            return
+        block = leftover + block
+        cut = block.rfind(b'\n') + 1
+        leftover = block[cut:]
+        if cut:
+            yield block[:cut]
+
+def chunk_to_csv(chunk):
+    """ Converts a block of voxel lines into csv rows (every column except the energy, same formatting). """
+    chunk = LINE_PADDING.sub(b'\n', chunk)
+    chunk = LEADING_COLUMN.sub(b'', chunk)
+    return COLUMN_SEPARATOR.sub(b',', chunk)
+
+def chunk_to_array(chunk, columns):
+    """ Parses a block of voxel lines into a (rows, columns) float array. """
+    values = np.fromstring(chunk, sep=' ')
+    if values.size % columns:
+        raise ValueError(f"voxel section has lines that don't have {columns} columns")
+    return values.reshape(-1, columns)
+
+class VoxelArrays:
+    """ Centroids, results, and relative errors of the voxels (stored as float32), appended to temporary files as they are parsed.
+
+    Memory use is bounded by the chunks added, not by the number of voxels, the .npz is packed from the files by save.
+
+    Attributes
+    ----------
+    folder : tempfile.TemporaryDirectory
+        where the arrays are appended (raw little endian float32)
+    files : dict
+        open file of each array (centroids, result, rel_error)
+    count : int
+        number of voxels added so far
+    """
+    def __init__(self, folder):
+        """
+        Parameters
+        ----------
+        folder : str
+            folder of the temporary files (the output folder, so they are on the same disk as the .npz)
+        """
+        self.folder = tempfile.TemporaryDirectory(dir=folder)
+        self.files = {name: open(Path(self.folder.name) / f"{name}.raw", 'w+b') for name in VOXEL_ARRAYS}
+        self.count = 0
+
+    def add(self, rows):
+        """ Adds (n, 5+) rows of x, y, z, result, relative error """
+        self.files["centroids"].write(np.ascontiguousarray(rows[:, 0:3], dtype='<f4').tobytes())
+        self.files["result"].write(np.ascontiguousarray(rows[:, 3], dtype='<f4').tobytes())
+        self.files["rel_error"].write(np.ascontiguousarray(rows[:, 4], dtype='<f4').tobytes())
+        self.count += len(rows)
+
+    def save(self, filename, boundaries):
+        """ Writes the boundaries and voxel arrays to an .npz file (the same layout as np.savez), copying the arrays in blocks """
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED, allowZip64=True) as npz:
+            for axis, name in enumerate(["x", "y", "z"]):
+                with npz.open(f"{name}.npy", 'w') as f:
+                    np.lib.format.write_array(f, np.array(boundaries[axis], dtype=np.float64))
+            for name, columns in VOXEL_ARRAYS.items():
+                shape = (self.count, columns) if columns > 1 else (self.count,)
+                with npz.open(f"{name}.npy", 'w', force_zip64=True) as f:
+                    np.lib.format.write_array_header_1_0(f, {"descr": "<f4", "fortran_order": False, "shape": shape})
+                    self.files[name].seek(0)
+                    shutil.copyfileobj(self.files[name], f, CHUNK_SIZE)
+
+    def close(self):
+        """ Deletes the temporary files """
+        for f in self.files.values():
+            f.close()
+        self.folder.cleanup()
+
+def peak_rss_mb():
+    """ Returns the peak resident set size of this process in MB """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def mcnp_to_csv(mcnpFile, outputFile, binary=False, chunk_size=CHUNK_SIZE):
+    """
+    Converts an MCNP mesh tally to a .csv file (and optionally an .npz file).
+
+    The voxel section is processed in blocks of chunk_size bytes, so memory use doesn't grow with the file.
+
+    Parameters
+    ----------
+    mcnpFile : str
+        input mcnp mesh tally filename
+    outputFile : str
+        output filename (its extension is replaced with .csv and .npz, the files are written next to it)
+    binary : bool
+        whether to also write an .npz with the x/y/z boundaries and the centroid, result, and rel_error arrays
+    chunk_size : int
+        number of bytes of the voxel section to read at once
+
+    Returns
+    -------
+    dict
+        number of voxels, seconds taken, throughput in MB/s, and peak RSS in MB
+    """
+    start = time.perf_counter()
     # append output filename with .csv regardless of what its file extension is
     outputPath = PurePath(outputFile)
-    output_filename = f"{outputPath.stem}.csv"
+    output_filename = outputPath.with_suffix('.csv')
 
-    # open files
-    with open(mcnpFile, 'r') as mcnpFile, open(output_filename, 'w') as outputFile:
-        # get array of boundaries for x,y,z
-        # 1a. find line that has x boundaries
-        mcnpLine = mcnpFile.readline()
-        while "X direction:" not in mcnpLine:
-            mcnpLine = mcnpFile.readline()
-        # 1b. split line into all the boundaries, write to file with comma separation
-        # do this 3 times for the 3 axes
-        dims = ['x', 'y', 'z']
-        for dim in dims:
-            outputStr = ','.join(mcnpLine.strip().split()[2:]) + '\n'
-            outputFile.write(outputStr)
-            mcnpLine = mcnpFile.readline()
-
-        # advance to the centroid and results section
-        while "Result" not in mcnpLine:
-            mcnpLine = mcnpFile.readline()
-
-        # 2. write all the centroid and result info to the csv file
-        mcnpLine = mcnpFile.readline() # this will have the first centroid (x,y,z) and result
-        # iterate through all voxels
-        while mcnpLine:
-            outputStr = ','.join(mcnpLine.strip().split()[1:]) + '\n'
-            outputFile.write(outputStr)
-            mcnpLine = mcnpFile.readline()
+    # the .npz arrays are appended to temporary files next to the output while the .csv is written
+    voxels = VoxelArrays(Path(output_filename).parent) if binary else None
+    try:
+        # open files
+        with open(mcnpFile, 'rb') as mcnpFile, open(output_filename, 'wb') as outputFile:
+            # 1. get array of boundaries for x,y,z and write them with comma separation
+            boundaries = read_header(mcnpFile)
+            for axis in boundaries:
+                outputFile.write((','.join(axis) + '\n').encode())
+
+            voxel_count = 1
+            for axis in boundaries:
+                voxel_count *= max(len(axis) - 1, 0)
+            columns = None
+
+            # 2. write all the centroid and result info to the csv file, one block of voxels at a time
+            rows = 0
+            for chunk in read_voxel_chunks(mcnpFile, chunk_size):
+                csvChunk = chunk_to_csv(chunk)
+                outputFile.write(csvChunk)
+                rows += csvChunk.count(b'\n') - len(BLANK_LINE.findall(csvChunk))
+                if binary:
+                    if columns is None:
+                        columns = len(chunk.lstrip().split(b'\n', 1)[0].split())
+                    voxels.add(chunk_to_array(chunk, columns)[:, 1:])
+            inputBytes = mcnpFile.tell()
+
+        if binary:
+            voxels.save(outputPath.with_suffix('.npz'), boundaries)
+    finally:
+        if voxels is not None:
+            voxels.close()
+    if rows != voxel_count:
+        warnings.warn(f"{mcnpFile.name} has {rows} voxel lines but its boundaries describe {voxel_count} voxels", UserWarning)
+
+    seconds = time.perf_counter() - start
+    return {
+        "voxels": rows,
+        "seconds": seconds,
+        "mb_per_second": inputBytes / (1 << 20) / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def is_tally_file(path):
+    """ Returns False for the files this tool writes (.csv, .npz, summary.json), so converting a folder twice doesn't convert its outputs """
+    return path.is_file() and path.suffix.casefold() not in OUTPUT_SUFFIXES and path.name != SUMMARY_FILENAME
+
+def find_tally_files(pattern):
+    """ Returns the tally files of a directory, or the tally files matching a glob pattern, sorted by name """
+    if Path(pattern).is_dir():
+        return sorted(str(p) for p in Path(pattern).iterdir() if is_tally_file(p))
+    return sorted(p for p in glob.glob(pattern, recursive=True) if is_tally_file(Path(p)))
+
+def batch_output_names(mcnpFiles):
+    """
+    Names the output of each file by its path relative to the common folder of all files, extension included
+    (ex: run1/meshtal -> run1_meshtal, case.1 -> case.1), so files that only differ by extension get different outputs.
+
+    Raises
+    ------
+    ValueError
+        if two files would still get the same name (ex: run1/meshtal and run1_meshtal)
+    """
+    if not mcnpFiles:
+        return []
+    common = os.path.commonpath([str(Path(f).resolve().parent) for f in mcnpFiles])
+    names = dict()
+    for f in mcnpFiles:
+        name = '_'.join(Path(f).resolve().relative_to(common).parts)
+        if name in names:
+            raise ValueError(f"{names[name]} and {f} would both be converted to {name}.csv")
+        names[name] = f
+    return list(names)
+
+def is_up_to_date(mcnpFile, outputPaths):
+    """ Returns True if every output exists and is newer than the mcnp file """
+    inputTime = Path(mcnpFile).stat().st_mtime
+    return all(p.exists() and p.stat().st_mtime >= inputTime for p in outputPaths)
+
+def convert_one(mcnpFile, outputFile, binary, chunk_size):
+    """ Worker of mcnp_to_csv_batch, returns the stats of mcnp_to_csv or the error it raised """
+    try:
+        return mcnp_to_csv(mcnpFile, outputFile, binary, chunk_size), None
+    except Exception as e:
+        # remove partial outputs so the next run doesn't consider them up to date
+        for suffix in ['.csv', '.npz']:
+            Path(outputFile).with_suffix(suffix).unlink(missing_ok=True)
+        return None, f"{type(e).__name__}: {e}"
+
+def mcnp_to_csv_batch(pattern, output_folder, jobs=None, binary=False, chunk_size=CHUNK_SIZE, force=False):
+    """
+    Converts many MCNP mesh tallies in parallel and writes a summary.json manifest to output_folder.
+
+    Parameters
+    ----------
+    pattern : str
+        a directory (every file in it is converted, except .csv/.npz/summary.json outputs) or a glob pattern
+    output_folder : str
+        where the .csv (and .npz) files and summary.json are written
+    jobs : int
+        number of worker processes (default is the number of cpus)
+    binary : bool
+        whether to also write .npz files
+    chunk_size : int
+        number of bytes of the voxel section to read at once
+    force : bool
+        convert files even if their outputs are newer than them
+
+    Returns
+    -------
+    list
+        the summary entry of each file (input, output, status, voxels, seconds, error)
+    """
+    start = time.perf_counter()
+    mcnpFiles = find_tally_files(pattern)
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    outputFiles = [Path(output_folder) / f"{name}.csv" for name in batch_output_names(mcnpFiles)]
+
+    summary = []
+    pending = []
+    for mcnpFile, outputFile in zip(mcnpFiles, outputFiles):
+        entry = {"input": mcnpFile, "output": str(outputFile), "status": "skipped", "voxels": None, "seconds": None, "error": None}
+        outputPaths = [outputFile] + ([outputFile.with_suffix('.npz')] if binary else [])
+        if force or not is_up_to_date(mcnpFile, outputPaths):
+            pending.append(entry)
+        summary.append(entry)
+
+    arguments = [(entry["input"], entry["output"], binary, chunk_size) for entry in pending]
+    for entry, (stats, error) in zip(pending, run_pool(convert_one, arguments, jobs, lambda error: (None, error))):
+        if error is None:
+            entry.update(status="converted", voxels=stats["voxels"], seconds=stats["seconds"])
+        else:
+            entry.update(status="failed", error=error)
+
+    with open(Path(output_folder) / SUMMARY_FILENAME, 'w') as f:
+        json.dump({
+            "converted": sum(e["status"] == "converted" for e in summary),
+            "skipped": sum(e["status"] == "skipped" for e in summary),
+            "failed": sum(e["status"] == "failed" for e in summary),
+            "seconds": time.perf_counter() - start,
+            "files": summary
+        }, f, indent = 4)
+    return summary
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog = "MCNP mesh tally to .csv converter")
-    parser.add_argument("mcnpFile", type = str, help = "input mcnp .txt filename")
-    parser.add_argument("outputFile", type = str, help = "output .csv filename")
+    parser.add_argument("mcnpFile", type = str, help = "input mcnp .txt filename (with --batch, a directory or glob pattern)")
+    parser.add_argument("outputFile", type = str, help = "output .csv filename (with --batch, the output folder)")
+    parser.add_argument("--binary", "-b", action = "store_true", help = "also write an .npz file with the boundaries, results, and errors")
+    parser.add_argument("--chunk-size", type = int, default = CHUNK_SIZE, help = "bytes of the voxel section to read at once")
+    parser.add_argument("--batch", action = "store_true", help = "convert every file matching mcnpFile in parallel")
+    parser.add_argument("--jobs", "-j", type = int, default = None, help = "number of worker processes for --batch (default is the number of cpus)")
+    parser.add_argument("--force", "-f", action = "store_true", help = "with --batch, also convert files whose outputs are up to date")
 
     args = parser.parse_args()
 
-    mcnp_to_csv(args.mcnpFile, args.outputFile)
-
-
+    if args.batch:
+        summary = mcnp_to_csv_batch(args.mcnpFile, args.outputFile, args.jobs, args.binary, args.chunk_size, args.force)
+        for entry in summary:
+            if entry["status"] == "failed":
+                print(f"{entry['input']}: failed ({entry['error']})")
+        print(f"{sum(e['status'] == 'converted' for e in summary)} converted, "
+              f"{sum(e['status'] == 'skipped' for e in summary)} skipped, "
+              f"{sum(e['status'] == 'failed' for e in summary)} failed")
+    else:
+        stats = mcnp_to_csv(args.mcnpFile, args.outputFile, args.binary, args.chunk_size)
+        print(f"converted {stats['voxels']} voxels in {stats['seconds']:.2f} s "
+              f"({stats['mb_per_second']:.1f} MB/s, peak RSS {stats['peak_rss_mb']:.1f} MB)")
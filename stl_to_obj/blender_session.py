@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+import math
+import time
+
+import bmesh
+import bpy
+import numpy as np
+
+# defaults of bpy.ops.mesh.dissolve_limited and bpy.ops.mesh.tris_convert_to_quads
+DISSOLVE_ANGLE_LIMIT = math.radians(5)
+JOIN_FACE_THRESHOLD = math.radians(40)
+JOIN_SHAPE_THRESHOLD = math.radians(40)
+
+# datablocks created by importing and processing a mesh, removed between meshes of a warm session
+IMPORTED_DATA = ["objects", "meshes", "materials", "images", "textures"]
+
+class BlenderSession:
+    """ Keeps one Blender instance ready for importing meshes, instead of factory resetting it for every mesh.
+
+    Attributes
+    ----------
+    warm : bool
+        whether to only remove the imported datablocks between meshes (False factory resets every time)
+    started : bool
+        whether Blender has been factory reset once
+    overhead_seconds : float
+        total time spent resetting Blender between meshes
+    resets : int
+        number of resets done
+
+    Methods
+    -------
+    reset():
+        Prepares Blender for importing the next mesh
+    compress(objects, mesh_compression):
+        Removes unnecessary faces of objects with bmesh (no edit mode needed)
+    split(objects, grid):
+        Splits objects into one object per tile of a tiles.TileGrid
+    decimated(objects, ratio):
+        Context manager that decimates objects (only as far as exports are concerned) inside its block
+    """
+    def __init__(self, warm=True):
+        """
+        Parameters
+        ----------
+        warm : bool
+            whether to only remove the imported datablocks between meshes (False factory resets every time)
+        """
+        self.warm = warm
+        self.started = False
+        self.overhead_seconds = 0.0
+        self.resets = 0
+
+    def reset(self):
+        """ Prepares Blender for importing the next mesh """
+        start = time.perf_counter()
+        if not self.warm or not self.started:
+            bpy.ops.wm.read_factory_settings(use_empty=True)
+            self.started = True
+        else:
+            if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode='OBJECT')
+            for data_name in IMPORTED_DATA:
+                blocks = getattr(bpy.data, data_name)
+                for block in list(blocks):
+                    blocks.remove(block)
+        self.overhead_seconds += time.perf_counter() - start
+        self.resets += 1
+
+    def compress(self, objects, mesh_compression):
+        """
+        Removes unnecessary faces of objects with bmesh (no edit mode needed)
+
+        Parameters
+        ----------
+        objects : list
+            the imported mesh objects
+        mesh_compression : str
+            limited_dissolve, tris_to_quads, or anything else to leave the mesh as is
+        """
+        if mesh_compression not in ["limited_dissolve", "tris_to_quads"]:
+            return
+        for obj in objects:
+            bm = bmesh.new()
+            bm.from_mesh(obj.data)
+            if mesh_compression == "limited_dissolve":
+                bmesh.ops.dissolve_limited(bm, angle_limit=DISSOLVE_ANGLE_LIMIT, use_dissolve_boundaries=False,
+                                           verts=bm.verts, edges=bm.edges, delimit={'NORMAL'})
+            else:
+                bmesh.ops.join_triangles(bm, faces=bm.faces, angle_face_threshold=JOIN_FACE_THRESHOLD,
+                                         angle_shape_threshold=JOIN_SHAPE_THRESHOLD)
+            bm.to_mesh(obj.data)
+            bm.free()
+
+    def split(self, objects, grid):
+        """
+        Splits objects into one object per tile (by the centers of their faces) and removes the originals.
+
+        Parameters
+        ----------
+        objects : list
+            the imported mesh objects (before any compression, so their faces are still the .stl's triangles)
+        grid : tiles.TileGrid
+            the tiles built from the .stl
+
+        Returns
+        -------
+        dict
+            tile index -> the objects of the tile (only non empty tiles, in index order)
+        """
+        parts = dict()
+        for obj in objects:
+            mesh = obj.data
+            positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get("co", positions)
+            centers = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+            mesh.polygons.foreach_get("center", centers)
+            loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+            mesh.polygons.foreach_get("loop_start", loop_starts)
+            loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get("vertex_index", loop_vertices)
+            # the faces are the .stl's triangles
+            triangles = loop_vertices[loop_starts[:, None] + np.arange(3)]
+            positions = positions.reshape(-1, 3)
+
+            # one pass: the faces are sorted by tile, then every tile's mesh is built from its own slice of them
+            cells = grid.cells(centers.reshape(-1, 3))
+            order = np.argsort(cells, kind='stable')
+            tile_indices, starts = np.unique(cells[order], return_index=True)
+            for tile, start, stop in zip(tile_indices, starts, np.append(starts[1:], len(order))):
+                used, tile_triangles = np.unique(triangles[order[start:stop]], return_inverse=True)
+                tile_mesh = bpy.data.meshes.new(f"{obj.name}_{tile}")
+                tile_mesh.from_pydata(positions[used].tolist(), [], tile_triangles.reshape(-1, 3).tolist())
+                tile_mesh.update()
+                for material in mesh.materials:
+                    tile_mesh.materials.append(material)
+                tile_obj = bpy.data.objects.new(f"{obj.name}_{tile}", tile_mesh)
+                tile_obj.matrix_world = obj.matrix_world.copy()
+                bpy.context.collection.objects.link(tile_obj)
+                parts.setdefault(int(tile), []).append(tile_obj)
+            bpy.data.objects.remove(obj)
+            bpy.data.meshes.remove(mesh)
+        return dict(sorted(parts.items()))
+
+    @contextmanager
+    def decimated(self, objects, ratio):
+        """
+        Adds a collapse decimate modifier to objects for the duration of the block.
+        The meshes themselves are untouched, so every level of a LOD chain is decimated from the full detail mesh
+        (exports apply the modifiers, and triangle_count(objects, evaluated=True) counts the decimated triangles).
+
+        Parameters
+        ----------
+        objects : list
+            the imported mesh objects
+        ratio : float
+            fraction of the faces to keep (1 or more adds no modifiers)
+        """
+        modifiers = []
+        if ratio < 1:
+            for obj in objects:
+                modifier = obj.modifiers.new(name="LOD", type='DECIMATE')
+                modifier.ratio = ratio
+                modifiers.append((obj, modifier))
+        try:
+            yield
+        finally:
+            for obj, modifier in modifiers:
+                obj.modifiers.remove(modifier)
+
+def triangle_count(objects, evaluated=False):
+    """ Returns the number of triangles the faces of objects' meshes would be split into (after their modifiers if evaluated) """
+    if evaluated:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        objects = [obj.evaluated_get(depsgraph) for obj in objects]
+    total = 0
+    for obj in objects:
+        loop_totals = np.empty(len(obj.data.polygons), dtype=np.int32)
+        obj.data.polygons.foreach_get("loop_total", loop_totals)
+        total += int((loop_totals - 2).sum())
+    return total
@@ -0,0 +1,140 @@
+from pathlib import Path
+import hashlib
+import json
+
+# name of the file (inside the output folder) that stores the cache
+CACHE_FILENAME = ".build_cache.json"
+
+# size of the blocks used to hash .stl files, so large files are never fully loaded into memory
+HASH_BLOCK_SIZE = 1 << 20
+
+def file_hash(filepath):
+    """ Returns the sha256 hex digest of a file's contents. """
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def cache_key(stl_filepath, params):
+    """
+    Returns the key that identifies the outputs of one mesh.
+
+    Parameters
+    ----------
+    stl_filepath : str
+        location of the .stl file
+    params : dict
+        every manifest/header parameter that changes the generated files
+    """
+    return sources_key([stl_filepath], params)
+
+def sources_key(filepaths, params):
+    """
+    Returns the key that identifies the outputs generated from several source files (ex: the images of a texture).
+
+    Parameters
+    ----------
+    filepaths : list
+        locations of the source files, in a fixed order
+    params : dict
+        every parameter that changes the generated files
+    """
+    sha = hashlib.sha256()
+    for filepath in filepaths:
+        sha.update(file_hash(filepath).encode())
+    sha.update(json.dumps(params, sort_keys=True).encode())
+    return sha.hexdigest()
+
+class BuildCache:
+    """ Remembers which outputs were generated from which inputs, so unchanged meshes aren't regenerated.
+
+    Attributes
+    ----------
+    filepath : Path
+        location of the cache file
+    entries : dict
+        maps each stl_file_extless to its key and the result of its conversion
+    statuses : list
+        (stl_file_extless, "hit" or "miss") of every mesh looked up this run
+
+    Methods
+    -------
+    lookup(stl_file_extless, key):
+        Returns the cached result of a mesh, or None if it has to be regenerated
+    update(stl_file_extless, key, result):
+        Stores the result of a freshly generated mesh
+    discard(stl_file_extless):
+        Forgets a mesh (ex: because its conversion failed)
+    save():
+        Writes the cache file
+    report(title="build cache"):
+        Returns a printable summary of the hits and misses of this run
+    """
+    def __init__(self, output_folder, filename=CACHE_FILENAME):
+        """
+        Parameters
+        ----------
+        output_folder : str
+            where the output .obj, .glb, and .tscn files are placed
+        filename : str
+            name of the cache file (ex: the textures have their own)
+        """
+        self.output_folder = Path(output_folder)
+        self.filepath = self.output_folder / filename
+        self.entries = dict()
+        if self.filepath.exists():
+            with open(self.filepath, 'r') as f:
+                self.entries = json.load(f)
+        self.statuses = []
+
+    def lookup(self, stl_file_extless, key):
+        """
+        Returns the cached result of a mesh, or None if it has to be regenerated.
+        A mesh is only reused if its key matches and all of its outputs still exist.
+
+        Parameters
+        ----------
+        stl_file_extless : str
+            name of the .stl file without the extension
+        key : str
+            the key returned by cache_key
+        """
+        entry = self.entries.get(stl_file_extless)
+        if entry is not None and entry["key"] == key \
+                and all((self.output_folder / output).exists() for output in entry["result"]["outputs"]):
+            self.statuses.append((stl_file_extless, "hit"))
+            return entry["result"]
+        self.statuses.append((stl_file_extless, "miss"))
+        return None
+
+    def update(self, stl_file_extless, key, result):
+        """
+        Stores the result of a freshly generated mesh
+
+        Parameters
+        ----------
+        stl_file_extless : str
+            name of the .stl file without the extension
+        key : str
+            the key returned by cache_key
+        result : dict
+            the result of the conversion (must be JSON serializable and have an "outputs" list)
+        """
+        self.entries[stl_file_extless] = {"key": key, "result": result}
+
+    def discard(self, stl_file_extless):
+        """ Forgets a mesh (ex: because its conversion failed) """
+        self.entries.pop(stl_file_extless, None)
+
+    def save(self):
+        """ Writes the cache file """
+        with open(self.filepath, 'w') as f:
+            json.dump(self.entries, f, indent = 4)
+
+    def report(self, title="build cache"):
+        """ Returns a printable summary of the hits and misses of this run """
+        lines = [f"{name}: {status}" for name, status in self.statuses]
+        hits = sum(status == "hit" for _, status in self.statuses)
+        lines.append(f"{title}: {hits} hits, {len(self.statuses) - hits} misses")
+        return '\n'.join(lines)
@@ -0,0 +1,316 @@
+import numpy as np
+
+# manifest values of collision_mode (decimated also takes a ratio, ex: decimated:0.25)
+COLLISION_MODES = ["trimesh", "convex", "convex_decomposition", "decimated", "box"]
+
+# decimal places kept for the coordinates written into the .tscn
+COORDINATE_DECIMALS = 4
+
+# most points of a ConvexPolygonShape, hulls with more are simplified (Godot's convex collisions slow down with every point)
+MAX_HULL_POINTS = 256
+
+def parse_collision_mode(collision_mode):
+    """
+    Splits a collision_mode manifest value into its mode and ratio.
+
+    Parameters
+    ----------
+    collision_mode : str
+        one of COLLISION_MODES, or "" for the default (trimesh)
+
+    Returns
+    -------
+    tuple
+        (mode, ratio), ratio is None unless mode is decimated
+    """
+    mode, _, ratio = (collision_mode or "trimesh").partition(":")
+    if mode not in COLLISION_MODES:
+        raise ValueError(f"invalid collision_mode {collision_mode}, must be one of {COLLISION_MODES}")
+    if mode != "decimated":
+        return mode, None
+    ratio = float(ratio) if ratio else 0.5
+    if not 0 < ratio <= 1:
+        raise ValueError(f"invalid collision_mode {collision_mode}, the decimation ratio must be in (0, 1]")
+    return mode, ratio
+
+def convex_hull(points):
+    """
+    Computes the convex hull of a point cloud with quickhull.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        (n, 3) positions
+
+    Returns
+    -------
+    tuple
+        (k, 3) float64 hull vertices and (f, 3) outward facing triangles indexing them.
+        If the points are flat (or there are fewer than 4), every unique point is returned with no triangles.
+    """
+    points = np.unique(np.asarray(points, dtype=np.float64), axis=0)
+    no_faces = np.zeros((0, 3), dtype=np.int64)
+    if len(points) < 4:
+        return points, no_faces
+    eps = 1e-9 * max(np.abs(points).max(), 1.0)
+
+    # initial simplex: the two most distant axis extremes, the point farthest from their line,
+    # and the point farthest from the plane of those three
+    extremes = np.concatenate([points.argmin(axis=0), points.argmax(axis=0)])
+    distances = np.linalg.norm(points[extremes][:, None] - points[extremes][None], axis=2)
+    i, j = np.unravel_index(distances.argmax(), distances.shape)
+    a, b = extremes[i], extremes[j]
+    line = points[b] - points[a]
+    c = np.linalg.norm(np.cross(points - points[a], line), axis=1).argmax()
+    normal = np.cross(line, points[c] - points[a])
+    plane_distances = (points - points[a]) @ normal
+    d = np.abs(plane_distances).argmax()
+    if abs(plane_distances[d]) <= eps * np.linalg.norm(normal):
+        return points, no_faces
+    if plane_distances[d] > 0:
+        b, c = c, b # orient the base (a, b, c) away from d
+
+    faces = dict() # face id: [vertex ids, unit normal, offset, outside point ids]
+    edge_faces = dict() # directed edge (v0, v1): id of the face it bounds, the neighbour across it has edge (v1, v0)
+    next_id = 0
+    def add_faces(triangles):
+        # the normals of all the new faces are computed at once
+        nonlocal next_id
+        corners = points[np.array(triangles)]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+        offsets = np.einsum('ij,ij->i', normals, corners[:, 0])
+        face_ids = list(range(next_id, next_id + len(triangles)))
+        for f, (v0, v1, v2), n, offset in zip(face_ids, triangles, normals, offsets):
+            faces[f] = [(v0, v1, v2), n, offset, np.zeros(0, dtype=np.int64)]
+            edge_faces[(v0, v1)] = edge_faces[(v1, v2)] = edge_faces[(v2, v0)] = f
+        next_id += len(triangles)
+        return face_ids
+
+    def assign(candidates, face_ids):
+        # give every candidate point to the face it is farthest outside of
+        if not len(candidates):
+            return
+        normals = np.array([faces[f][1] for f in face_ids])
+        offsets = np.array([faces[f][2] for f in face_ids])
+        heights = points[candidates] @ normals.T - offsets
+        best = heights.argmax(axis=1)
+        outside = heights[np.arange(len(candidates)), best] > eps
+        for k, f in enumerate(face_ids):
+            faces[f][3] = candidates[outside & (best == k)]
+
+    simplex = add_faces([(a, b, c), (a, d, b), (b, d, c), (c, d, a)])
+    assign(np.setdiff1d(np.arange(len(points)), [a, b, c, d]), simplex)
+
+    pending = [f for f in simplex if len(faces[f][3])]
+    while pending:
+        f = pending.pop()
+        if f not in faces or not len(faces[f][3]):
+            continue
+        outside = faces[f][3]
+        apex = outside[(points[outside] @ faces[f][1]).argmax()]
+
+        # the faces the apex can see are connected, so they are found by walking across edges from f
+        visible = {f}
+        stack = [f]
+        horizon = []
+        while stack:
+            g = stack.pop()
+            v0, v1, v2 = faces[g][0]
+            for edge in [(v0, v1), (v1, v2), (v2, v0)]:
+                neighbour = edge_faces[(edge[1], edge[0])]
+                if neighbour in visible:
+                    continue
+                if points[apex] @ faces[neighbour][1] - faces[neighbour][2] > eps:
+                    visible.add(neighbour)
+                    stack.append(neighbour)
+                else:
+                    horizon.append(edge)
+        candidates = np.concatenate([faces[g][3] for g in visible])
+        candidates = candidates[candidates != apex]
+        for g in visible:
+            v0, v1, v2 = faces.pop(g)[0]
+            for edge in [(v0, v1), (v1, v2), (v2, v0)]:
+                del edge_faces[edge]
+
+        new_faces = add_faces([(v0, v1, apex) for v0, v1 in horizon])
+        assign(candidates, new_faces)
+        pending.extend(g for g in new_faces if len(faces[g][3]))
+
+    triangles = np.array([face[0] for face in faces.values()], dtype=np.int64)
+    used, triangles = np.unique(triangles, return_inverse=True)
+    return points[used], triangles.reshape(-1, 3)
+
+def connected_components(indices, vertex_count):
+    """
+    Labels the triangles of a mesh by connected component.
+
+    Parameters
+    ----------
+    indices : numpy.ndarray
+        (m, 3) triangle indices
+    vertex_count : int
+        number of vertices the indices refer to
+
+    Returns
+    -------
+    numpy.ndarray
+        (m,) label of each triangle (the labels are not consecutive)
+    """
+    labels = np.arange(vertex_count)
+    while True:
+        new_labels = labels.copy()
+        triangle_min = labels[indices].min(axis=1)
+        for corner in range(3):
+            np.minimum.at(new_labels, indices[:, corner], triangle_min)
+        # pointer jumping so long chains converge in a few passes
+        while True:
+            jumped = new_labels[new_labels]
+            if np.array_equal(jumped, new_labels):
+                break
+            new_labels = jumped
+        if np.array_equal(new_labels, labels):
+            return labels[indices[:, 0]]
+        labels = new_labels
+
+def cluster_vertices(positions, indices, cell_size):
+    """ Merges all vertices inside the same cell of a grid and drops the triangles that collapse. """
+    cells = np.floor((positions - positions.min(axis=0)) / cell_size).astype(np.int64)
+    _, inverse, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    clustered = np.zeros((len(counts), 3), dtype=np.float64)
+    np.add.at(clustered, inverse, positions)
+    clustered /= counts[:, None]
+
+    triangles = inverse[indices]
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 2] != triangles[:, 0])]
+    _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+    return clustered.astype(np.float32), triangles[np.sort(first)].astype(np.uint32)
+
+def decimate(positions, indices, ratio, max_passes=8):
+    """
+    Reduces a mesh to about ratio of its triangles with vertex clustering.
+
+    Parameters
+    ----------
+    positions : numpy.ndarray
+        (n, 3) vertex positions
+    indices : numpy.ndarray
+        (m, 3) triangle indices
+    ratio : float
+        fraction of the triangles to keep
+    max_passes : int
+        number of times the cell size is adjusted to approach the target
+
+    Returns
+    -------
+    tuple
+        the decimated positions and indices
+    """
+    target = max(int(len(indices) * ratio), 1)
+    if ratio >= 1 or len(indices) <= target:
+        return positions, indices
+    corners = positions[indices].astype(np.float64)
+    area = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1).sum()
+    # a closed triangle mesh has about twice as many triangles as vertices
+    cell_size = np.sqrt(area / max(target / 2, 1)) or 1.0
+
+    best = (positions, indices)
+    for _ in range(max_passes):
+        decimated = cluster_vertices(positions.astype(np.float64), indices, cell_size)
+        if len(decimated[1]) <= target * 1.1:
+            best = decimated
+            # stop once the result is close enough, otherwise try smaller cells to keep more detail
+            if len(decimated[1]) >= target * 0.9:
+                break
+            cell_size /= np.sqrt(target / max(len(decimated[1]), 1))
+        else:
+            cell_size *= np.sqrt(len(decimated[1]) / target)
+    return best
+
+def box_shape(positions):
+    """ Returns the BoxShape (extents and origin) of the axis aligned bounding box of positions. """
+    low, high = positions.min(axis=0).astype(np.float64), positions.max(axis=0).astype(np.float64)
+    return {
+        "type": "box",
+        "extents": np.round((high - low) / 2, COORDINATE_DECIMALS).tolist(),
+        "origin": np.round((high + low) / 2, COORDINATE_DECIMALS).tolist()
+    }
+
+def farthest_points(points, count):
+    """ Returns the indices of count points picked one by one as the point farthest from the ones already picked (the extremes come first). """
+    picked = [int(np.linalg.norm(points - points.mean(axis=0), axis=1).argmax())]
+    distances = np.linalg.norm(points - points[picked[0]], axis=1)
+    for _ in range(min(count, len(points)) - 1):
+        picked.append(int(distances.argmax()))
+        distances = np.minimum(distances, np.linalg.norm(points - points[picked[-1]], axis=1))
+    return np.array(picked, dtype=np.int64)
+
+def simplify_hull(hull_points, hull_triangles, max_points=MAX_HULL_POINTS):
+    """
+    Clusters the vertices of a convex hull with growing cells until the hull of the clusters has at most max_points vertices.
+
+    Thin parts can flatten into a hull without faces before that happens,
+    then (like flat point sets) they keep the max_points farthest points of the last hull instead.
+    """
+    if len(hull_points) <= max_points:
+        return hull_points, hull_triangles
+    if len(hull_triangles):
+        # the vertices of a hull are spread over its surface, so cells of about sqrt(area / max_points) leave about max_points of them
+        corners = hull_points[hull_triangles]
+        area = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1).sum()
+        extent = float((hull_points.max(axis=0) - hull_points.min(axis=0)).max())
+        cell_size = np.sqrt(area / max_points) or extent
+        while cell_size <= extent:
+            clustered, _ = cluster_vertices(hull_points, hull_triangles, cell_size)
+            simplified = convex_hull(clustered)
+            if not len(simplified[1]):
+                break
+            hull_points, hull_triangles = simplified
+            if len(hull_points) <= max_points:
+                return hull_points, hull_triangles
+            cell_size *= 1.5
+    return convex_hull(hull_points[farthest_points(hull_points, max_points)])
+
+def convex_shape(positions):
+    """ Returns the ConvexPolygonShape of the convex hull of positions (at most MAX_HULL_POINTS points), and its triangle count. """
+    hull_points, hull_triangles = simplify_hull(*convex_hull(positions))
+    return {
+        "type": "convex",
+        "points": np.round(hull_points, COORDINATE_DECIMALS).reshape(-1).tolist()
+    }, len(hull_triangles)
+
+def simplified_shapes(solids, mode):
+    """
+    Builds the Godot shapes that replace the triangles of solids.
+
+    Parameters
+    ----------
+    solids : list
+        (positions, indices) of every solid, already in Godot's (Y-up) axes
+    mode : str
+        convex, convex_decomposition, or box
+
+    Returns
+    -------
+    tuple
+        list of JSON serializable shape dicts, and their total triangle count
+    """
+    if mode == "box":
+        # a box has 12 triangles
+        return [box_shape(np.concatenate([positions for positions, _ in solids]))], 12
+
+    if mode == "convex":
+        shape, triangles = convex_shape(np.concatenate([positions for positions, _ in solids]))
+        return [shape], triangles
+
+    # convex_decomposition: one hull for every connected part of every solid
+    shapes = []
+    total_triangles = 0
+    for positions, indices in solids:
+        labels = connected_components(indices, len(positions))
+        for label in np.unique(labels):
+            shape, triangles = convex_shape(positions[np.unique(indices[labels == label])])
+            shapes.append(shape)
+            total_triangles += triangles
+    return shapes, total_triangles
@@ -1,11 +1,39 @@
 from pathlib import Path
 import argparse
+import hashlib
 import json
 import csv
+import warnings
 
-import cubit
+try:
+    import cubit
+# only importable inside Cubit (a stub module can be passed to export_groups instead)
+except ImportError:
+    cubit = None
 
-def export_groups_CL(output_folder, sat_file, template='.csv'):
+# name of the file (inside the output folder) that stores the signature of every exported group
+SIGNATURE_FILENAME = ".group_signatures.json"
+
+# decimal places of the measurements that make up the geometry signature of a volume
+SIGNATURE_DECIMALS = 6
+
+# defaults of the manifest entries of new groups
+HEADER_TEMPLATE = {
+    "input_folder": "",
+    "output_folder": "",
+    "scale": 0.01,
+    "extra_textures": "more_textures.json"
+}
+MESH_TEMPLATE = {
+    "uv_map": "cube",
+    "texture": "",
+    "collisions": True,
+    "collision_mode": "trimesh",
+    "mesh_compression": "limited_dissolve"
+}
+MESH_FIELDNAMES = ["stl_file", "uv_map", "texture", "collisions", "collision_mode", "mesh_compression"]
+
+def export_groups_CL(output_folder, sat_file, template='.csv', incremental=True):
     """ Used in terminal to export .stl files based on the groups of an ACIS file.
     Also generates a .json file which is a template input to the stl_to_tscn module.
 
@@ -17,84 +45,151 @@ def export_groups_CL(output_folder, sat_file, template='.csv'):
         the ACIS file
     template : str
         the file format of the template file (either .json or .csv)
+    incremental : bool
+        whether to skip the groups that haven't changed since the last export
     """
     cubit.cmd(f'import acis "{sat_file}" nofreesurfaces heal attributes_on separate_bodies')
-    export_groups(output_folder, template)
+    export_groups(output_folder, template, incremental)
+
+def group_signature(cubit_module, volumes):
+    """
+    Returns the signature of a group: its volume ids and a hash of their geometry
+    (bounding box, volume, and surface areas of every volume), which changes whenever the group has to be re-exported.
+
+    Parameters
+    ----------
+    cubit_module : module
+        the cubit module (or a stub of it)
+    volumes : list
+        ids of the volumes of the group
+    """
+    sha = hashlib.sha256()
+    for volume in sorted(volumes):
+        surfaces = sorted(cubit_module.get_relatives("volume", volume, "surface"))
+        measurements = list(cubit_module.get_bounding_box("volume", volume)) + [cubit_module.get_volume_volume(volume)]
+        measurements += [cubit_module.get_surface_area(surface) for surface in surfaces]
+        sha.update(json.dumps([volume, len(surfaces), [round(float(m), SIGNATURE_DECIMALS) for m in measurements]]).encode())
+    return {"volumes": sorted(volumes), "geometry": sha.hexdigest()}
+
+def load_template(template_filepath):
+    """ Returns the header and meshes of an existing template file (None if it doesn't exist) """
+    if not template_filepath.exists():
+        return None
+    if template_filepath.suffix == '.json':
+        with open(template_filepath, 'r') as json_file:
+            return json.load(json_file)
+    with open(template_filepath, 'r', newline='') as csv_file:
+        # the header is the first 2 lines, the meshes are the rest
+        lines = list(csv_file)
+    header = next(csv.DictReader(lines[:2]))
+    meshes = [row for row in csv.DictReader(lines[2:]) if any(row.values())]
+    return {"header": header, "meshes": meshes}
+
+def write_template(template_filepath, json_dict):
+    """ Writes the header and meshes of a template file (.json or .csv) """
+    if template_filepath.suffix == '.json':
+        with open(template_filepath, 'w') as json_file:
+            json_string = json.dumps(json_dict, indent = 4)
+            json_file.write(json_string)
+        return
+    with open(template_filepath, 'w', newline='',) as csv_file:
+        # write the header dict
+        writer = csv.DictWriter(csv_file, fieldnames=list(json_dict["header"]))
+        writer.writeheader()
+        writer.writerow(json_dict["header"])
 
-def export_groups(output_folder, template='.csv'):
+        # write the meshes array (with the columns added by hand after the default ones)
+        fieldnames = list(MESH_FIELDNAMES)
+        for mesh in json_dict["meshes"]:
+            fieldnames += [key for key in mesh if key not in fieldnames]
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames, restval="")
+        writer.writeheader()
+        for mesh in json_dict["meshes"]:
+            writer.writerow(mesh)
+
+def export_groups(output_folder, template='.csv', incremental=True, cubit_module=None, binary=True):
     """ Used in Cubit's Python command line to export .stl files based on the groups of an ACIS file.
-    Also generates a .json file which is a template input to the stl_to_tscn module.
+    Also generates a template input file (input.json or input.csv) for the stl_to_tscn module.
+
+    Groups whose signature (see group_signature) matches the last export are skipped, and new groups are
+    added to an existing template file, so the entries that were edited by hand (texture, uv_map, ...) are kept.
 
     Parameters
     ----------
     output_folder : str
-        where output .stl and .json files should be placed
+        where output .stl and template files should be placed
     template : str
         the file format of the template file (either .json or .csv)
+    incremental : bool
+        whether to skip the groups that haven't changed since the last export
+    cubit_module : module
+        the cubit module to use (default: the one imported in Cubit, tests can pass a stub)
+    binary : bool
+        whether to export binary .stl files (smaller and faster to read than ascii ones)
+
+    Returns
+    -------
+    dict
+        names of the groups that were "exported", "skipped" (unchanged), and "added" to the template
     """
-    # json file dictionaries
-    header_dict = {
-        "input_folder": "",
-        "output_folder": "",
-        "scale": 0.01,
-        "extra_textures": "more_textures.json" 
-    }
-    meshes = []
+    cubit_module = cubit_module or cubit
+    summary = {"exported": [], "skipped": [], "added": []}
+
+    signature_filepath = Path(output_folder) / SIGNATURE_FILENAME
+    signatures = dict()
+    if signature_filepath.exists():
+        with open(signature_filepath, 'r') as f:
+            signatures = json.load(f)
 
     # get tuples of (group_name, id)
-    groups = cubit.group_names_ids()
+    groups = cubit_module.group_names_ids()
 
+    group_names = []
     for group in groups:
         group_name = group[0]
         if group_name == "picked":
             continue
+        group_names.append(group_name)
         stl_filepath = Path(output_folder) / Path(group_name).with_suffix('.stl')
-        volumes = cubit.get_group_volumes(group[1])
-        cubit.cmd(f'export stl "{stl_filepath}" volume {str(volumes)[1:-1]} overwrite')
-
-        # add .stl mesh entry to .json file
-        mesh_dict = {
-            "stl_file": f"{group_name}.stl",
-            "uv_map": "cube",
-            "texture": group_name, 
-            "collisions": True,
-            "mesh_compression": "limited_dissolve"
-        }
-        meshes.append(mesh_dict)
-
-    json_dict = {
-        "header": header_dict,
-        "meshes": meshes
-    }
-
-    if template == '.json':
-        with open(Path(output_folder) / Path("input").with_suffix('.json'), 'w') as json_file:
-            json_string = json.dumps(json_dict, indent = 4)
-            json_file.write(json_string)
-    # default is .csv file
-    else:
-        with open(Path(output_folder) / Path("input").with_suffix('.csv'), 'w', newline='',) as csv_file:
-            # write the header dict
-            fieldnames = ["input_folder", "output_folder", "scale", "extra_textures"]
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerow(header_dict)
-
-            # write the meshes array
-            fieldnames = ["stl_file", "uv_map", "texture", "collisions", "mesh_compression"]
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-            writer.writeheader()
-            for mesh in meshes:
-                writer.writerow(mesh)
+        volumes = list(cubit_module.get_group_volumes(group[1]))
+        signature = group_signature(cubit_module, volumes) | {"binary": binary}
+        if incremental and signatures.get(group_name) == signature and stl_filepath.exists():
+            summary["skipped"].append(group_name)
+            continue
+        cubit_module.cmd(f'export stl "{stl_filepath}" volume {str(volumes)[1:-1]}{" binary" if binary else ""} overwrite')
+        signatures[group_name] = signature
+        summary["exported"].append(group_name)
+
+    with open(signature_filepath, 'w') as f:
+        json.dump(signatures, f, indent = 4)
+
+    # add the new groups to the template file, keeping the existing entries as they are
+    template_filepath = Path(output_folder) / Path("input").with_suffix('.json' if template == '.json' else '.csv')
+    json_dict = load_template(template_filepath) or {"header": dict(HEADER_TEMPLATE), "meshes": []}
+    existing = {Path(mesh["stl_file"]).stem for mesh in json_dict["meshes"]}
+    for group_name in group_names:
+        if group_name not in existing:
+            # the texture defaults to the group's name
+            json_dict["meshes"].append({"stl_file": f"{group_name}.stl"} | MESH_TEMPLATE | {"texture": group_name})
+            summary["added"].append(group_name)
+    removed = existing - set(group_names)
+    if removed:
+        warnings.warn(f"{template_filepath.name} has meshes that are no longer groups in Cubit: {', '.join(sorted(removed))}", UserWarning)
+    write_template(template_filepath, json_dict)
+
+    print(f"exported {len(summary['exported'])} groups, skipped {len(summary['skipped'])} unchanged groups, "
+          f"added {len(summary['added'])} groups to {template_filepath.name}")
+    return summary
 
 def main():
     parser = argparse.ArgumentParser(prog = "export groups in ACIS file to .stl files")
     parser.add_argument("output_folder", type = str, help = "location to store .stl and template files")
     parser.add_argument("sat_file", type = str, help = "location of ACIS file")
     parser.add_argument("--template", "-t", type = str, default=".csv", help = "type of output template file (.json or .csv)")
+    parser.add_argument("--full", action = "store_true", help = "re-export every group, even the ones that haven't changed")
     args = parser.parse_args()
 
-    export_groups_CL(args.output_folder, args.sat_file, args.template)
+    export_groups_CL(args.output_folder, args.sat_file, args.template, not args.full)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
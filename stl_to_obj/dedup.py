@@ -0,0 +1,191 @@
+from pathlib import Path
+import itertools
+
+import numpy as np
+
+import stl_io
+from collision_shapes import COORDINATE_DECIMALS
+
+# vertices match if they are this close, relative to the diagonal of the mesh's bounding box
+MATCH_TOLERANCE = 1e-4
+
+# the principal moments of two meshes must agree this closely (relative) before a transform is searched for
+MOMENT_TOLERANCE = 1e-3
+
+# conversion from the .stl's Z-up axes to Godot's Y-up axes (see stl_io.to_y_up)
+Y_UP = np.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]], dtype=np.float64)
+
+IDENTITY = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0]
+
+class Shape:
+    """ The vertices of an .stl in a frame that doesn't depend on where the mesh is placed.
+
+    Attributes
+    ----------
+    positions : numpy.ndarray
+        (n, 3) float64 welded vertex positions of every solid
+    triangles : int
+        number of triangles
+    centroid : numpy.ndarray
+        mean of the positions
+    moments : numpy.ndarray
+        eigenvalues of the covariance of the positions (increasing)
+    axes : numpy.ndarray
+        (3, 3) eigenvectors of the covariance of the positions (columns)
+    tolerance : float
+        distance under which two vertices match
+    """
+    def __init__(self, solids):
+        """
+        Parameters
+        ----------
+        solids : list
+            stl_io.Solids of the mesh
+        """
+        self.positions = np.concatenate([solid.positions for solid in solids]).astype(np.float64)
+        self.triangles = sum(solid.triangle_count for solid in solids)
+        self.centroid = self.positions.mean(axis=0)
+        self.moments, self.axes = np.linalg.eigh(np.cov((self.positions - self.centroid).T))
+        self.tolerance = MATCH_TOLERANCE * max(float(np.linalg.norm(self.positions.max(axis=0) - self.positions.min(axis=0))), 1e-12)
+
+    def key(self):
+        """ Returns what two shapes need in common to be compared at all """
+        return (len(self.positions), self.triangles)
+
+def same_points(a, b, tolerance):
+    """ Returns True if every point of a has a point of b within tolerance (a and b have the same number of points) """
+    low = np.minimum(a.min(axis=0), b.min(axis=0))
+    a_cells = np.floor((a - low) / tolerance).astype(np.int64)
+    b_cells = np.floor((b - low) / tolerance).astype(np.int64)
+    # the neighbouring cells are searched too, so points on either side of a cell boundary still match
+    dims = np.maximum(a_cells.max(axis=0), b_cells.max(axis=0)) + 3
+
+    def encode(cells):
+        return ((cells[:, 0] + 1) * dims[1] + (cells[:, 1] + 1)) * dims[2] + (cells[:, 2] + 1)
+
+    order = np.argsort(encode(b_cells))
+    b_keys = encode(b_cells)[order]
+    matched = np.zeros(len(a), dtype=bool)
+    for offset in itertools.product([-1, 0, 1], repeat=3):
+        keys = encode(a_cells + offset)
+        found = np.minimum(np.searchsorted(b_keys, keys), len(b_keys) - 1)
+        matched |= (b_keys[found] == keys) & (np.linalg.norm(a - b[order[found]], axis=1) <= tolerance)
+        if matched.all():
+            return True
+    return False
+
+def rigid_transform(a, b):
+    """
+    Finds the rotation and translation that move shape a onto shape b.
+
+    Pure translations (the usual copies in Cubit) are tried first, then the rotations that line up the principal axes.
+
+    Parameters
+    ----------
+    a, b : Shape
+        the shapes
+
+    Returns
+    -------
+    tuple
+        (rotation, translation) with b = a @ rotation.T + translation, or None if the shapes are different
+    """
+    if a.key() != b.key() or not np.allclose(a.moments, b.moments, rtol=MOMENT_TOLERANCE, atol=a.tolerance ** 2):
+        return None
+    centered = a.positions - a.centroid
+    rotations = [np.eye(3)]
+    for signs in itertools.product([1, -1], repeat=3):
+        rotation = b.axes @ np.diag(signs) @ a.axes.T
+        # reflections aren't rigid transforms
+        if np.linalg.det(rotation) > 0:
+            rotations.append(rotation)
+    for rotation in rotations:
+        if same_points(centered @ rotation.T + b.centroid, b.positions, a.tolerance):
+            return rotation, b.centroid - rotation @ a.centroid
+    return None
+
+def godot_transform(rotation, translation):
+    """ Returns the 12 values (basis rows, then origin) of the Godot Transform of a rigid transform of the .stl's axes """
+    basis = Y_UP @ rotation @ Y_UP.T
+    origin = Y_UP @ translation
+    values = np.concatenate([basis.reshape(-1), origin])
+    # + 0.0 turns -0.0 into 0.0
+    return (np.round(values, COORDINATE_DECIMALS) + 0.0).tolist()
+
+def format_transform(values):
+    """ Returns how the 12 values of a transform are written in the .tscn """
+    return f"Transform( {', '.join(f'{value:g}' for value in values)} )"
+
+def find_instances(stl_filepaths, groups):
+    """
+    Finds the meshes that are rigidly transformed copies of an earlier mesh.
+
+    Parameters
+    ----------
+    stl_filepaths : list
+        locations of the .stl files, in manifest order
+    groups : list
+        for every mesh, the values that must be equal for it to share the files of another mesh
+        (the parameters that change the generated files), in manifest order
+
+    Returns
+    -------
+    dict
+        index of every repeated mesh -> (index of the mesh it is a copy of, its transform (see godot_transform))
+    """
+    instances = dict()
+    originals = dict()
+    for i, (stl_filepath, group) in enumerate(zip(stl_filepaths, groups)):
+        try:
+            solids = stl_io.read_stl(stl_filepath)
+        # unreadable meshes are reported by their conversion
+        except (OSError, ValueError):
+            continue
+        if sum(solid.triangle_count for solid in solids) == 0:
+            continue
+        shape = Shape(solids)
+        candidates = originals.setdefault((group, shape.key()), [])
+        for original, original_shape in candidates:
+            transform = rigid_transform(original_shape, shape)
+            if transform is not None:
+                instances[i] = (original, godot_transform(*transform))
+                break
+        else:
+            candidates.append((i, shape))
+    return instances
+
+def multimesh_name(stl_file_extless, texture):
+    """ Returns the name of the MultiMeshInstance that draws the copies of a mesh with a texture """
+    return f"{stl_file_extless}_{texture}_multimesh"
+
+def plan_multimeshes(meshes, results, skip=()):
+    """
+    Groups the copies of every mesh that can be drawn by one MultiMeshInstance: converted, untiled, single level .obj meshes with the same texture.
+
+    Parameters
+    ----------
+    meshes : list
+        the "meshes" array of the input file
+    results : list
+        the result of each mesh (see stl_to_tscn.convert_mesh), the results of copies have "instance_of" and "transform"
+    skip : collection
+        indices of meshes that are drawn some other way (ex: merged)
+
+    Returns
+    -------
+    dict
+        MultiMeshInstance name -> indices of the meshes it draws (only groups of 2 or more meshes, in manifest order)
+    """
+    groups = dict()
+    for i, (m, result) in enumerate(zip(meshes, results)):
+        if i in skip or result.get("error") is not None or result.get("tiles") or len(result.get("lods") or []) > 1 \
+                or Path(result["lods"][0]["file"]).suffix != ".obj":
+            continue
+        source = result.get("instance_of", Path(m["stl_file"]).stem)
+        groups.setdefault(multimesh_name(source, m["texture"]), []).append(i)
+    return {name: indices for name, indices in groups.items() if len(indices) > 1}
+
+def dedup_report(meshes, results):
+    """ Returns a printable summary of the meshes that reuse the files of another mesh """
+    copies = [result for result in results if "instance_of" in result]
+    return f"deduplicated meshes: {len(copies)} copies of {len({result['instance_of'] for result in copies})} shapes, {len(meshes) - len(copies)} unique meshes"
@@ -0,0 +1,173 @@
+import json
+import struct
+
+import numpy as np
+
+GLB_MAGIC = 0x46546C67 # "glTF"
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A # "JSON"
+CHUNK_BIN = 0x004E4942 # "BIN\0"
+
+# glTF componentType of each numpy dtype
+COMPONENT_TYPES = {
+    np.dtype(np.int8): 5120,
+    np.dtype(np.uint8): 5121,
+    np.dtype(np.int16): 5122,
+    np.dtype(np.uint16): 5123,
+    np.dtype(np.uint32): 5125,
+    np.dtype(np.float32): 5126
+}
+
+# glTF accessor type of each number of components
+ACCESSOR_TYPES = {1: "SCALAR", 2: "VEC2", 3: "VEC3", 4: "VEC4"}
+
+# bufferView targets
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+def pad4(length):
+    """ Returns the number of bytes needed to align length to 4 bytes. """
+    return -length % 4
+
+def index_array(indices):
+    """ Returns indices as the smallest unsigned type that glTF accepts for them. """
+    if len(indices) and indices.max() >= 0xFFFF:
+        return np.ascontiguousarray(indices, dtype=np.uint32)
+    return np.ascontiguousarray(indices, dtype=np.uint16)
+
+class GlbWriter:
+    """ Builds a binary glTF (.glb) file directly from numpy arrays.
+
+    The arrays are kept as they are until write, which streams them into the file one by one,
+    so the binary chunk is never assembled in memory.
+
+    Attributes
+    ----------
+    gltf : dict
+        the JSON part of the file
+    arrays : list
+        the arrays of the binary chunk, in order
+    byte_length : int
+        current length of the binary chunk (including padding)
+
+    Methods
+    -------
+    add_accessor(array, target=None, normalized=False, bounds=False, components=None):
+        Adds an array to the binary chunk and returns the index of its accessor
+    add_mesh(name, positions, indices, attributes=None):
+        Adds a mesh, and a node that instances it, and returns the index of the node
+    write(filepath):
+        Writes the .glb file
+    """
+    def __init__(self):
+        self.gltf = {
+            "asset": {"version": "2.0", "generator": "level-gen"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "accessors": [],
+            "bufferViews": [],
+            "buffers": []
+        }
+        self.arrays = []
+        self.byte_length = 0
+
+    def add_accessor(self, array, target=None, normalized=False, bounds=False, components=None):
+        """
+        Adds an array to the binary chunk and returns the index of its accessor
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            (n,) or (n, components) array of one of the COMPONENT_TYPES
+        target : int
+            ARRAY_BUFFER or ELEMENT_ARRAY_BUFFER (None for neither)
+        normalized : bool
+            whether integer values represent the 0-1 (or -1-1) range
+        bounds : bool
+            whether to store min and max (required for POSITION)
+        components : int
+            number of components of the accessor, if the array has padding columns after them
+            (ex: int16 positions padded to 4 components, since vertex attributes must be aligned to 4 bytes)
+        """
+        array = np.ascontiguousarray(array)
+        columns = 1 if array.ndim == 1 else array.shape[1]
+        components = components or columns
+
+        view = {"buffer": 0, "byteOffset": self.byte_length, "byteLength": array.nbytes}
+        if target is not None:
+            view["target"] = target
+        if components < columns:
+            view["byteStride"] = array.itemsize * columns
+        self.gltf["bufferViews"].append(view)
+        self.arrays.append(array)
+        self.byte_length += array.nbytes + pad4(array.nbytes)
+
+        accessor = {
+            "bufferView": len(self.gltf["bufferViews"]) - 1,
+            "componentType": COMPONENT_TYPES[array.dtype],
+            "count": len(array),
+            "type": ACCESSOR_TYPES[components]
+        }
+        if normalized:
+            accessor["normalized"] = True
+        if bounds:
+            accessor["min"] = array.reshape(len(array), columns)[:, :components].min(axis=0).tolist()
+            accessor["max"] = array.reshape(len(array), columns)[:, :components].max(axis=0).tolist()
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def add_mesh(self, name, positions, indices, attributes=None):
+        """
+        Adds a mesh, and a node that instances it, and returns the index of the node
+
+        Parameters
+        ----------
+        name : str
+            name of the node (Godot reads import hints such as -colonly from it)
+        positions : numpy.ndarray
+            (n, 3) float32 vertex positions (or (n, 4) int16 positions padded with a fourth column, with KHR_mesh_quantization)
+        indices : numpy.ndarray
+            (m, 3) or (m * 3,) triangle indices into positions
+        attributes : dict
+            extra vertex attributes, maps the glTF attribute name (ex: NORMAL) to its accessor index
+        """
+        if positions.dtype.kind == 'f':
+            positions = positions.astype(np.float32, copy=False)
+        primitive_attributes = {"POSITION": self.add_accessor(positions, ARRAY_BUFFER, bounds=True, components=3)}
+        if attributes:
+            primitive_attributes.update(attributes)
+        primitive = {
+            "attributes": primitive_attributes,
+            "indices": self.add_accessor(index_array(indices.reshape(-1)), ELEMENT_ARRAY_BUFFER),
+            "mode": 4 # triangles
+        }
+        self.gltf["meshes"].append({"name": name, "primitives": [primitive]})
+        self.gltf["nodes"].append({"name": name, "mesh": len(self.gltf["meshes"]) - 1})
+        node_index = len(self.gltf["nodes"]) - 1
+        self.gltf["scenes"][0]["nodes"].append(node_index)
+        return node_index
+
+    def write(self, filepath):
+        """ Writes the .glb file """
+        if self.byte_length:
+            self.gltf["buffers"] = [{"byteLength": self.byte_length}]
+        else:
+            del self.gltf["buffers"], self.gltf["bufferViews"]
+
+        json_chunk = json.dumps(self.gltf, separators=(',', ':')).encode()
+        json_chunk += b' ' * pad4(len(json_chunk))
+        total_length = 12 + 8 + len(json_chunk)
+        if self.byte_length:
+            total_length += 8 + self.byte_length
+
+        with open(filepath, 'wb') as f:
+            f.write(struct.pack("<III", GLB_MAGIC, GLB_VERSION, total_length))
+            f.write(struct.pack("<II", len(json_chunk), CHUNK_JSON))
+            f.write(json_chunk)
+            if self.byte_length:
+                f.write(struct.pack("<II", self.byte_length, CHUNK_BIN))
+                for array in self.arrays:
+                    f.write(memoryview(array).cast('B'))
+                    f.write(b'\0' * pad4(array.nbytes))
@@ -0,0 +1,14 @@
+extends Spatial
+# attached to the parent node of a LOD chain generated by stl_to_tscn.py
+# shows the child whose lod_min_distance/lod_max_distance range contains the distance to the camera
+# (Godot 3 stores these ranges on every GeometryInstance, but doesn't switch on them by itself)
+
+func _process(_delta):
+	var camera = get_viewport().get_camera()
+	if camera == null or get_child_count() == 0:
+		return
+	# the meshes keep the coordinates of the .stl, so measure from the center of the full detail level
+	var aabb = get_child(0).get_transformed_aabb()
+	var distance = camera.global_transform.origin.distance_to(aabb.position + aabb.size / 2)
+	for child in get_children():
+		child.visible = distance >= child.lod_min_distance and (child.lod_max_distance == 0 or distance < child.lod_max_distance)
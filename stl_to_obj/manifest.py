@@ -0,0 +1,216 @@
+from pathlib import Path, PurePosixPath
+import csv
+import json
+
+import textures
+from collision_shapes import parse_collision_mode
+from tiles import parse_tiles
+
+# manifest parameters that are booleans (.csv files store them as text)
+BOOLEAN_FIELDS = ["collisions", "quantize"]
+
+# every mesh needs these (from its row or from the defaults of its directory)
+REQUIRED_FIELDS = ["stl_file", "uv_map", "texture"]
+
+# values of the parameters that neither a row nor the defaults of its directory set (no compression, no collisions)
+FIELD_DEFAULTS = {"mesh_compression": "", "collisions": False}
+
+# an stl_file with any of these is a glob pattern (relative to the input folder)
+GLOB_CHARACTERS = "*?["
+
+# parameters checked by the function that parses them for the conversion (it raises ValueError if they are invalid)
+PARSERS = [(("collision_mode",), parse_collision_mode), (("tiles",), parse_tiles)]
+
+def parse_boolean(value):
+    """ Returns the boolean of a manifest value (true/false text in .csv files) """
+    if isinstance(value, str):
+        return value.strip().casefold() == "true"
+    return bool(value)
+
+def clean_row(row):
+    """ Drops the empty values of a row (so the defaults fill them in) and converts its booleans """
+    row = {key: value for key, value in row.items() if key is not None and value is not None and value != ""}
+    for field in BOOLEAN_FIELDS:
+        if field in row:
+            row[field] = parse_boolean(row[field])
+    return row
+
+def read_csv_rows(f, filename, header_lines):
+    """ Yields the (line number, row) of every mesh of an open .csv manifest, positioned after its header_lines header lines """
+    reader = csv.reader(f)
+    fieldnames = next(reader, None)
+    for row in reader:
+        if any(value.strip() for value in row):
+            # the reader counts from where it started, after the header
+            yield f"{filename} line {header_lines + reader.line_num}", clean_row(dict(zip(fieldnames, row)))
+
+def read_jsonl_rows(f, filename):
+    """ Yields the (line number, row) of every mesh of an open .jsonl manifest, positioned after its header """
+    for line_number, line in enumerate(f, 2):
+        if line.strip():
+            yield f"{filename} line {line_number}", clean_row(json.loads(line))
+
+def open_manifest(input_file):
+    """
+    Reads the header of an input file, and returns it with a generator of its meshes that reads them as they are used.
+
+    .csv files have the header names and values on their first 2 lines, then the mesh parameter names and one line per mesh.
+    .jsonl (JSON Lines) files have {"header": {...}} on their first line, then one mesh object per line.
+    .json files are read at once ({"header": {...}, "meshes": [...]}).
+
+    Parameters
+    ----------
+    input_file : str
+        the input file (.json, .jsonl, or .csv)
+
+    Returns
+    -------
+    tuple
+        the header dict, and a generator of the (location, row) of every mesh (empty values left out)
+    """
+    filename = Path(input_file).name
+    suffix = Path(input_file).suffix
+    if suffix == ".json":
+        with open(input_file, 'r') as f:
+            data = json.load(f)
+        return data["header"], ((f"{filename} mesh {i}", clean_row(m)) for i, m in enumerate(data["meshes"]))
+    if suffix not in [".jsonl", ".csv"]:
+        raise Exception("input file was not a .json, .jsonl, or .csv file")
+
+    f = open(input_file, 'r', newline='')
+    if suffix == ".csv":
+        reader = csv.reader([f.readline(), f.readline()])
+        header = dict(zip(*reader))
+        if "scale" in header:
+            header["scale"] = float(header["scale"])
+        rows = read_csv_rows(f, filename, 2)
+    else:
+        header = json.loads(f.readline())["header"]
+        rows = read_jsonl_rows(f, filename)
+
+    def close_after(rows):
+        with f:
+            yield from rows
+    return header, close_after(rows)
+
+def directory_key(directory):
+    """ Returns how a directory of the defaults is looked up: normalized by PurePosixPath (ex: "./shields/" -> "shields"), "" for the input folder itself """
+    directory = PurePosixPath(directory).as_posix()
+    return "" if directory == "." else directory
+
+def load_defaults(header):
+    """
+    Returns the defaults of every directory of the header (a dict, or a .json file with the dict, in its "defaults").
+
+    The defaults map a directory (relative to the input folder, "" for every directory) to the parameters
+    of the meshes whose .stl files are in it (or in its subdirectories), for the parameters their rows leave empty.
+    """
+    defaults = header.get("defaults") or dict()
+    if isinstance(defaults, str):
+        with open(defaults, 'r') as f:
+            defaults = json.load(f)
+    return {directory_key(directory): clean_row(values) for directory, values in defaults.items()}
+
+def directory_defaults(defaults, stl_file):
+    """ Returns the defaults of an .stl file, the ones of deeper directories override the ones of their parents """
+    merged = dict(defaults.get("", dict()))
+    parents = list(PurePosixPath(stl_file).parents)[::-1]
+    for parent in parents[1:]:
+        merged.update(defaults.get(parent.as_posix(), dict()))
+    return merged
+
+def expand(input_folder, location, row):
+    """ Yields the rows of every .stl file matched by the stl_file glob pattern of a row (or the row itself) """
+    pattern = row.get("stl_file", "")
+    if not any(character in pattern for character in GLOB_CHARACTERS):
+        yield location, row, False
+        return
+    for match in sorted(Path(input_folder).glob(pattern)):
+        # the conversion rebuilds the filename from its stem and .stl, so other cases (ex: .STL) wouldn't be found
+        if match.suffix == ".stl" and match.is_file():
+            yield f"{location} ({pattern})", row | {"stl_file": match.relative_to(input_folder).as_posix()}, True
+
+def check_mesh(mesh, choices, parsers):
+    """ Returns the problems of a mesh (missing parameters, textures that aren't loaded, invalid choices, values its parsers reject) """
+    problems = [f"no {field}" for field in REQUIRED_FIELDS if field not in mesh]
+    texture = mesh.get("texture")
+    if texture is not None and texture not in textures.texture_dict and texture not in textures.other_textures:
+        problems.append(f"texture {texture} is not in the loaded textures")
+    for field, values in choices.items():
+        if field in mesh and mesh[field] not in values:
+            problems.append(f"invalid {field} {mesh[field]}, must be one of {list(values)}")
+    for fields, parse in parsers:
+        if any(field in mesh for field in fields):
+            try:
+                parse(*(mesh.get(field) for field in fields))
+            except (ValueError, TypeError) as e:
+                problems.append(str(e))
+    return problems
+
+def load_meshes(header, rows, input_folder, choices=None, parsers=(), validate=True):
+    """
+    Builds the meshes of a manifest in a single pass over its rows, and checks all of them before any is converted.
+
+    Rows whose stl_file is a glob pattern (ex: shields/*.stl) add every matching .stl file,
+    and every mesh gets the defaults of its directory (see load_defaults) for the parameters its row leaves empty.
+    A mesh listed by its own row replaces the mesh a pattern added for the same .stl file.
+
+    Parameters
+    ----------
+    header : dict
+        the header of the manifest
+    rows : iterable
+        the (location, row) of every mesh (see open_manifest)
+    input_folder : str
+        location of the .stl files (patterns are matched in it)
+    choices : dict
+        the valid values of parameters (ex: {"uv_map": [...]}), checked along with the textures
+    parsers : list
+        (parameter names, function) of parameters that are parsed for the conversion (ex: (("lods", "lod_distances"), parse_lods)),
+        the function gets their values and raises ValueError if they are invalid (on top of PARSERS)
+    validate : bool
+        whether to check the meshes (the textures must be loaded)
+
+    Returns
+    -------
+    list
+        the meshes, in manifest order
+
+    Raises
+    ------
+    ValueError
+        listing the problems of every invalid mesh
+    """
+    choices = choices or dict()
+    parsers = PARSERS + list(parsers)
+    defaults = load_defaults(header)
+    meshes = dict()
+    problems = []
+    for location, row in rows:
+        if "stl_file" not in row:
+            problems.append(f"{location}: no stl_file")
+            continue
+        matched = False
+        for mesh_location, mesh, from_pattern in expand(input_folder, location, row):
+            matched = True
+            mesh = FIELD_DEFAULTS | directory_defaults(defaults, mesh["stl_file"]) | mesh
+            stem = Path(mesh["stl_file"]).stem
+            if stem in meshes:
+                previous_location, previous, previous_from_pattern = meshes[stem]
+                if previous["stl_file"] != mesh["stl_file"]:
+                    problems.append(f"{mesh_location}: {mesh['stl_file']} has the same name as {previous['stl_file']} ({previous_location})")
+                    continue
+                if from_pattern or not previous_from_pattern:
+                    if not from_pattern:
+                        problems.append(f"{mesh_location}: {mesh['stl_file']} is already listed ({previous_location})")
+                    continue
+            meshes[stem] = (mesh_location, mesh, from_pattern)
+        if not matched:
+            problems.append(f"{location}: {row.get('stl_file')} matches no .stl files")
+
+    if validate:
+        for location, mesh, _ in meshes.values():
+            problems += [f"{location}: {problem}" for problem in check_mesh(mesh, choices, parsers)]
+    if problems:
+        raise ValueError("invalid manifest\n" + "\n".join(problems))
+    return [mesh for _, mesh, _ in meshes.values()]
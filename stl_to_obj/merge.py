@@ -0,0 +1,92 @@
+from pathlib import Path
+import json
+import re
+
+# lines of the .obj files written by Blender
+OBJ_FACE = re.compile(r"^f (.*)$", re.MULTILINE)
+OBJ_COUNTED = {"v": 0, "vt": 1, "vn": 2}
+
+# written in the output folder, maps every merged .obj back to the groups (and their faces) it was made from
+MERGE_MAP_FILENAME = "merge_map.json"
+
+def merge_name(texture, uv_map):
+    """ Returns the name (node and file name without the extension) of the merged mesh of a material """
+    return f"{texture}_{uv_map}_merged"
+
+def plan_merges(meshes, results):
+    """
+    Groups the meshes that can be drawn together: converted, untiled, single level meshes with the same texture and uv_map.
+    Copies of another mesh (see the dedup module) are left out, since they reuse its .obj with their own transform,
+    and so are .glb meshes (see the mesh_glb module).
+
+    Parameters
+    ----------
+    meshes : list
+        the "meshes" array of the input file
+    results : list
+        the result of each mesh (see stl_to_tscn.convert_mesh)
+
+    Returns
+    -------
+    dict
+        merged mesh name -> indices of the meshes merged into it (only groups of 2 or more meshes, in manifest order)
+    """
+    groups = dict()
+    for i, (m, result) in enumerate(zip(meshes, results)):
+        if result.get("error") is not None or result.get("tiles") or len(result.get("lods") or []) > 1 or "instance_of" in result \
+                or Path(result["lods"][0]["file"]).suffix != ".obj":
+            continue
+        groups.setdefault(merge_name(m["texture"], m["uv_map"]), []).append(i)
+    return {name: indices for name, indices in groups.items() if len(indices) > 1}
+
+def merge_obj_files(output_folder, name, groups):
+    """
+    Concatenates .obj files into one object (a single surface for Godot), renumbering the faces of every file.
+    Every file becomes a "g" group named after its mesh, so the merged mesh can be traced back to the manifest.
+
+    Parameters
+    ----------
+    output_folder : str
+        where the .obj files are (and where the merged .obj is written)
+    name : str
+        name of the merged mesh (see merge_name)
+    groups : list
+        names of the .stl files without the extension, whose .obj files are merged
+
+    Returns
+    -------
+    list
+        one dict per group with its "group" name and the [first, last) "faces" of the merged .obj it became
+    """
+    offsets = [0, 0, 0]
+    face_count = 0
+    mapping = []
+
+    def renumber(match):
+        corners = []
+        for corner in match.group(1).split():
+            corners.append("/".join(str(int(index) + offsets[k]) if index else "" for k, index in enumerate(corner.split("/"))))
+        return "f " + " ".join(corners)
+
+    with open(Path(output_folder) / Path(name).with_suffix('.obj'), 'w') as merged:
+        merged.write(f"o {name}\n")
+        for group in groups:
+            text = (Path(output_folder) / Path(group).with_suffix('.obj')).read_text()
+            # a single object per file, the materials come from the .tscn
+            lines = [line for line in text.splitlines() if not line.startswith(("o ", "mtllib ", "usemtl "))]
+            text = '\n'.join(lines) + '\n'
+            faces = len(OBJ_FACE.findall(text))
+            merged.write(f"g {group}\n")
+            merged.write(OBJ_FACE.sub(renumber, text))
+            mapping.append({"group": group, "faces": [face_count, face_count + faces]})
+            face_count += faces
+            for line in lines:
+                kind = line.split(" ", 1)[0]
+                if kind in OBJ_COUNTED:
+                    offsets[OBJ_COUNTED[kind]] += 1
+    return mapping
+
+def write_merge_map(output_folder, merge_map):
+    """ Writes the merged mesh name -> group mapping of every merged .obj as merge_map.json in output_folder """
+    with open(Path(output_folder) / MERGE_MAP_FILENAME, 'w') as f:
+        json.dump(merge_map, f, indent = 4)
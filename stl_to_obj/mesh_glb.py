@@ -0,0 +1,214 @@
+from pathlib import Path
+
+import bpy
+import numpy as np
+
+import stl_io
+from glb import GlbWriter, ARRAY_BUFFER
+
+# extension of glTF files whose vertex attributes are stored as integers
+QUANTIZATION_EXTENSION = "KHR_mesh_quantization"
+
+# decimals of the vertex positions, texture coordinates, and normals of the .obj files written by Blender
+OBJ_DECIMALS = {"v": 6, "vt": 6, "vn": 4}
+
+def mesh_arrays(objects):
+    """
+    Reads the triangles of objects (after their modifiers, ex: the LOD decimation) out of Blender.
+
+    Parameters
+    ----------
+    objects : list
+        the mesh objects (with a uv map)
+
+    Returns
+    -------
+    tuple
+        (n * 3, 3) positions, (n * 3, 3) normals (flat, in Godot's Y-up axes), and (n * 3, 2) uvs (Blender's bottom left origin)
+        of the 3 corners of every triangle
+    """
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    positions, normals, uvs = [], [], []
+    for obj in objects:
+        evaluated = obj.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+        try:
+            mesh.calc_loop_triangles()
+            triangles = len(mesh.loop_triangles)
+            vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get("co", vertices)
+            corners = np.empty(triangles * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("vertices", corners)
+            loops = np.empty(triangles * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("loops", loops)
+            face_normals = np.empty(triangles * 3, dtype=np.float32)
+            mesh.loop_triangles.foreach_get("normal", face_normals)
+            loop_uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+            if mesh.uv_layers.active is not None:
+                mesh.uv_layers.active.data.foreach_get("uv", loop_uvs)
+            matrix = np.array(evaluated.matrix_world, dtype=np.float64)
+        finally:
+            evaluated.to_mesh_clear()
+
+        # the .obj exporter applies the object's transform too
+        points = vertices.reshape(-1, 3)[corners] @ matrix[:3, :3].T + matrix[:3, 3]
+        face_normals = face_normals.reshape(-1, 3) @ np.linalg.inv(matrix[:3, :3])
+        face_normals /= np.maximum(np.linalg.norm(face_normals, axis=1, keepdims=True), 1e-12)
+        positions.append(stl_io.to_y_up(points))
+        normals.append(np.repeat(stl_io.to_y_up(face_normals), 3, axis=0))
+        uvs.append(loop_uvs.reshape(-1, 2)[loops])
+    if not positions:
+        return np.empty((0, 3)), np.empty((0, 3)), np.empty((0, 2))
+    return np.concatenate(positions), np.concatenate(normals), np.concatenate(uvs)
+
+def weld(positions, normals, uvs):
+    """
+    Merges the triangle corners that have the same position, normal, and uv into one vertex.
+
+    Returns
+    -------
+    tuple
+        the (k, 3) positions, (k, 3) normals, and (k, 2) uvs of the vertices, and the (n * 3,) vertex of every corner
+    """
+    # + 0 turns -0.0 into 0.0, so they are the same bytes
+    attributes = np.ascontiguousarray(np.column_stack([positions, normals, uvs]).astype(np.float32) + 0)
+    keys = attributes.view(np.dtype((np.void, attributes.dtype.itemsize * attributes.shape[1]))).reshape(-1)
+    _, first, indices = np.unique(keys, return_index=True, return_inverse=True)
+    vertices = attributes[first]
+    return vertices[:, :3], vertices[:, 3:6], vertices[:, 6:], indices.reshape(-1).astype(np.uint32)
+
+def tangents(positions, normals, uvs, indices):
+    """
+    Returns the (k, 4) tangents of the vertices (xyz along increasing u, w the handedness of the bitangent),
+    averaged over their triangles and made orthogonal to their normals.
+    """
+    triangles = indices.reshape(-1, 3)
+    p0, p1, p2 = (positions[triangles[:, corner]].astype(np.float64) for corner in range(3))
+    w0, w1, w2 = (uvs[triangles[:, corner]].astype(np.float64) for corner in range(3))
+    e1, e2 = p1 - p0, p2 - p0
+    d1, d2 = w1 - w0, w2 - w0
+    determinant = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+    # triangles without a uv area don't contribute
+    inverse = np.where(np.abs(determinant) > 1e-20, 1 / np.where(determinant == 0, 1, determinant), 0)[:, None]
+    face_tangents = (e1 * d2[:, 1:] - e2 * d1[:, 1:]) * inverse
+    face_bitangents = (e2 * d1[:, :1] - e1 * d2[:, :1]) * inverse
+
+    tangent = np.zeros((len(positions), 3))
+    bitangent = np.zeros((len(positions), 3))
+    for axis in range(3):
+        for corner in range(3):
+            tangent[:, axis] += np.bincount(triangles[:, corner], face_tangents[:, axis], len(positions))
+            bitangent[:, axis] += np.bincount(triangles[:, corner], face_bitangents[:, axis], len(positions))
+
+    normals = normals.astype(np.float64)
+    tangent -= normals * np.sum(normals * tangent, axis=1, keepdims=True)
+    length = np.linalg.norm(tangent, axis=1)
+    # vertices without a uv gradient get any tangent orthogonal to their normal
+    fallback = np.cross(normals, np.where(np.abs(normals[:, :1]) < 0.9, [[1.0, 0, 0]], [[0, 1.0, 0]]))
+    tangent = np.where((length > 1e-12)[:, None], tangent, fallback)
+    tangent /= np.maximum(np.linalg.norm(tangent, axis=1, keepdims=True), 1e-12)
+    handedness = np.where(np.sum(np.cross(normals, tangent) * bitangent, axis=1) < 0, -1.0, 1.0)
+    return np.column_stack([tangent, handedness]).astype(np.float32)
+
+def format_lengths(values, decimals):
+    """ Returns the length of every value written with decimals fixed decimals (ex: "-12.500000") """
+    values = np.asarray(values, dtype=np.float64)
+    integer_digits = np.floor(np.log10(np.maximum(np.abs(values), 1))) + 1
+    return integer_digits + (values < 0) + 1 + decimals
+
+def obj_size(positions, normals, uvs):
+    """ Returns about how many bytes Blender's .obj exporter writes for triangle corners (unwelded, see mesh_arrays) """
+    size = 0
+    corner_indices = []
+    for kind, values in [("v", positions), ("vt", uvs), ("vn", normals)]:
+        unique, inverse = np.unique(np.round(values, OBJ_DECIMALS[kind]), axis=0, return_inverse=True)
+        # "v x y z\n"
+        size += int(format_lengths(unique, OBJ_DECIMALS[kind]).sum()) + len(unique) * (len(kind) + unique.shape[1] + 1)
+        corner_indices.append(inverse.reshape(-1) + 1)
+    # "f v/vt/vn v/vt/vn v/vt/vn\n"
+    size += int(sum(format_lengths(indices, 0).sum() - len(indices) for indices in corner_indices))
+    size += 3 * len(positions) + 2 * (len(positions) // 3)
+    return size
+
+class VisualGlb:
+    """ A .glb with one node (and mesh) per level of a visual mesh, written instead of the .obj files.
+
+    Attributes
+    ----------
+    writer : glb.GlbWriter
+        the file being built
+    quantize : bool
+        whether positions, normals, tangents, and uvs are stored as integers (KHR_mesh_quantization)
+
+    Methods
+    -------
+    add_level(name, objects):
+        Adds a node with the welded triangles of objects and returns the triangle count and the size of its arrays
+    write(filepath):
+        Writes the .glb file
+    """
+    def __init__(self, quantize=False):
+        """
+        Parameters
+        ----------
+        quantize : bool
+            whether to store the vertex attributes as integers
+        """
+        self.writer = GlbWriter()
+        self.quantize = quantize
+        if quantize:
+            self.writer.gltf["extensionsUsed"] = [QUANTIZATION_EXTENSION]
+            self.writer.gltf["extensionsRequired"] = [QUANTIZATION_EXTENSION]
+
+    def add_level(self, name, objects):
+        """
+        Adds a node with the welded triangles of objects (after their modifiers) and its normals, tangents, and uvs.
+
+        Parameters
+        ----------
+        name : str
+            name of the node (and of the MeshInstance Godot imports it as)
+        objects : list
+            the mesh objects of the level
+
+        Returns
+        -------
+        dict
+            "triangles" of the level, "bytes" of its arrays, and about how many bytes it would take as an .obj ("obj_bytes")
+        """
+        corner_positions, corner_normals, corner_uvs = mesh_arrays(objects)
+        positions, normals, uvs, indices = weld(corner_positions, corner_normals, corner_uvs)
+        vertex_tangents = tangents(positions, normals, uvs, indices)
+        # glTF's uv origin is the top left corner
+        uvs = np.column_stack([uvs[:, 0], 1 - uvs[:, 1]])
+        start = self.writer.byte_length
+
+        transform = dict()
+        attributes = dict()
+        if self.quantize:
+            low, high = positions.min(axis=0), positions.max(axis=0)
+            center = (low + high) / 2
+            # one step for every axis, so the node's scale is uniform and the normals stay unscaled
+            step = max(float((high - low).max()) / 65534, 1e-9)
+            # vertex attributes are aligned to 4 bytes, so the 3 component attributes get a padding column
+            positions = np.column_stack([np.round((positions - center) / step), np.zeros(len(positions))]).astype(np.int16)
+            transform = {"translation": center.tolist(), "scale": [step] * 3}
+            attributes["NORMAL"] = self.writer.add_accessor(np.column_stack([np.round(normals * 127), np.zeros(len(normals))]).astype(np.int8),
+                                                            ARRAY_BUFFER, normalized=True, components=3)
+            attributes["TANGENT"] = self.writer.add_accessor(np.round(vertex_tangents * 127).astype(np.int8), ARRAY_BUFFER, normalized=True)
+            if len(uvs) and uvs.min() >= 0 and uvs.max() <= 1:
+                attributes["TEXCOORD_0"] = self.writer.add_accessor(np.round(uvs * 65535).astype(np.uint16), ARRAY_BUFFER, normalized=True)
+            else:
+                attributes["TEXCOORD_0"] = self.writer.add_accessor(uvs.astype(np.float32), ARRAY_BUFFER)
+        else:
+            attributes["NORMAL"] = self.writer.add_accessor(normals.astype(np.float32), ARRAY_BUFFER)
+            attributes["TANGENT"] = self.writer.add_accessor(vertex_tangents, ARRAY_BUFFER)
+            attributes["TEXCOORD_0"] = self.writer.add_accessor(uvs.astype(np.float32), ARRAY_BUFFER)
+        node = self.writer.add_mesh(name, positions, indices, attributes)
+        self.writer.gltf["nodes"][node].update(transform)
+        return {"triangles": len(indices) // 3, "bytes": self.writer.byte_length - start,
+                "obj_bytes": obj_size(corner_positions, corner_normals, corner_uvs)}
+
+    def write(self, filepath):
+        """ Writes the .glb file """
+        self.writer.write(Path(filepath))
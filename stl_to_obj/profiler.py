@@ -0,0 +1,84 @@
+from contextlib import contextmanager
+from pathlib import Path
+import csv
+import json
+import resource
+import time
+
+# columns of the profile report
+FIELDS = ["mesh", "stage", "wall_seconds", "cpu_seconds", "peak_rss_mb", "triangles_in", "triangles_out"]
+
+# number of meshes and stages listed in the summary
+SUMMARY_LENGTH = 10
+
+class Profiler:
+    """ Records the wall time, cpu time, peak RSS, and triangle counts of every stage of every mesh.
+
+    Every process (including --jobs workers) has its own Profiler, whose records are sent back with the mesh results.
+
+    Attributes
+    ----------
+    enabled : bool
+        whether stages are recorded (when False, stage does nothing but run its block)
+    records : list
+        one dict (see FIELDS) per finished stage
+
+    Methods
+    -------
+    stage(mesh, name, triangles_in=None):
+        Context manager that records one stage, the block can set "triangles_out" on the dict it yields
+    take():
+        Returns the records so far and forgets them
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+
+    @contextmanager
+    def stage(self, mesh, name, triangles_in=None):
+        record = {"mesh": mesh, "stage": name, "triangles_in": triangles_in, "triangles_out": None}
+        if not self.enabled:
+            yield record
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        yield record
+        record["wall_seconds"] = time.perf_counter() - wall
+        record["cpu_seconds"] = time.process_time() - cpu
+        # ru_maxrss is the high-water mark of the process, so it includes the earlier stages
+        record["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.records.append(record)
+
+    def take(self):
+        records = self.records
+        self.records = []
+        return records
+
+def write_profile(records, output_folder):
+    """ Writes the records as profile.json and profile.csv in output_folder """
+    with open(Path(output_folder) / "profile.json", 'w') as f:
+        json.dump(records, f, indent = 4)
+    with open(Path(output_folder) / "profile.csv", 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+
+def profile_summary(records):
+    """ Returns a printable list of the slowest meshes, stages (summed over all meshes), and single mesh stages """
+    mesh_totals = dict()
+    stage_totals = dict()
+    for record in records:
+        mesh_totals[record["mesh"]] = mesh_totals.get(record["mesh"], 0.0) + record["wall_seconds"]
+        stage_totals[record["stage"]] = stage_totals.get(record["stage"], 0.0) + record["wall_seconds"]
+
+    lines = ["slowest meshes:"]
+    for mesh, seconds in sorted(mesh_totals.items(), key=lambda item: item[1], reverse=True)[:SUMMARY_LENGTH]:
+        lines.append(f"  {mesh}: {seconds:.3f} s")
+    lines.append("slowest stages:")
+    for stage, seconds in sorted(stage_totals.items(), key=lambda item: item[1], reverse=True)[:SUMMARY_LENGTH]:
+        lines.append(f"  {stage}: {seconds:.3f} s")
+    lines.append("slowest mesh stages:")
+    for record in sorted(records, key=lambda record: record["wall_seconds"], reverse=True)[:SUMMARY_LENGTH]:
+        triangles = f" ({record['triangles_in']} -> {record['triangles_out']} triangles)" if record["triangles_in"] is not None else ""
+        lines.append(f"  {record['mesh']} {record['stage']}: {record['wall_seconds']:.3f} s{triangles}")
+    return '\n'.join(lines)
@@ -0,0 +1,135 @@
+from pathlib import Path
+import re
+
+import numpy as np
+
+# layout of one triangle of a binary .stl file
+STL_TRIANGLE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attribute", "<u2")
+])
+STL_HEADER_SIZE = 80
+
+# "vertex x y z" lines of an ascii .stl file
+ASCII_VERTEX = re.compile(rb"^\s*vertex\s+(\S+)\s+(\S+)\s+(\S+)", re.MULTILINE)
+ASCII_SOLID = re.compile(rb"^\s*solid\b", re.MULTILINE)
+
+class Solid:
+    """ A triangle soup read from an .stl file.
+
+    Attributes
+    ----------
+    name : str
+        name of the solid ("" if the file didn't name it)
+    positions : numpy.ndarray
+        (n, 3) float32 vertex positions
+    indices : numpy.ndarray
+        (m, 3) uint32 indices into positions, one row per triangle
+    """
+    def __init__(self, name, positions, indices):
+        """
+        Parameters
+        ----------
+        name : str
+            name of the solid
+        positions : numpy.ndarray
+            (n, 3) float32 vertex positions
+        indices : numpy.ndarray
+            (m, 3) uint32 indices into positions
+        """
+        self.name = name
+        self.positions = positions
+        self.indices = indices
+
+    @property
+    def triangle_count(self):
+        return len(self.indices)
+
+def is_binary_stl(filepath):
+    """ Returns True if the .stl file is binary (its size matches the triangle count in its header). """
+    size = Path(filepath).stat().st_size
+    if size < STL_HEADER_SIZE + 4:
+        return False
+    with open(filepath, 'rb') as f:
+        f.seek(STL_HEADER_SIZE)
+        count = int(np.frombuffer(f.read(4), "<u4")[0])
+    return size == STL_HEADER_SIZE + 4 + count * STL_TRIANGLE.itemsize
+
+def weld(corners):
+    """
+    Merges identical vertices of a triangle soup.
+
+    Parameters
+    ----------
+    corners : numpy.ndarray
+        (m * 3, 3) float32 positions of every triangle corner
+
+    Returns
+    -------
+    tuple
+        (n, 3) float32 unique positions and (m, 3) uint32 indices into them
+    """
+    # unique on whole rows as 12 byte values is much faster than np.unique(axis=0),
+    # adding 0 turns -0.0 into 0.0 so they compare equal like the float values
+    corners = np.ascontiguousarray(corners, dtype=np.float32) + np.float32(0)
+    unique, inverse = np.unique(corners.view(np.dtype((np.void, corners.itemsize * 3))).reshape(-1), return_inverse=True)
+    positions = unique.view(np.float32).reshape(-1, 3)
+    # same order as np.unique(axis=0) (sorted by x, then y, then z), bytes don't sort like floats
+    order = np.lexsort(positions.T[::-1])
+    rank = np.empty(len(order), dtype=np.uint32)
+    rank[order] = np.arange(len(order), dtype=np.uint32)
+    return positions[order], rank[inverse.reshape(-1, 3)]
+
+def read_binary_stl(filepath):
+    """ Returns the single Solid of a binary .stl file. """
+    size = Path(filepath).stat().st_size
+    count = (size - STL_HEADER_SIZE - 4) // STL_TRIANGLE.itemsize
+    with open(filepath, 'rb') as f:
+        f.seek(STL_HEADER_SIZE + 4)
+        triangles = np.fromfile(f, dtype=STL_TRIANGLE, count=count)
+    # the vertices are strided between the normals and attributes, so this copies them either way
+    corners = triangles["vertices"].reshape(-1, 3)
+    del triangles
+    positions, indices = weld(corners)
+    return [Solid(Path(filepath).stem, positions, indices)]
+
+def read_ascii_stl(filepath):
+    """ Returns every Solid of an ascii .stl file (Cubit writes one solid per volume). """
+    with open(filepath, 'rb') as f:
+        text = f.read()
+
+    solids = []
+    starts = [m.start() for m in ASCII_SOLID.finditer(text)] or [0]
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        block = text[start:end]
+        vertices = ASCII_VERTEX.findall(block)
+        if not vertices:
+            continue
+        name = block.split(b'\n', 1)[0].strip()[len(b"solid"):].strip().decode(errors='replace')
+        corners = np.array(vertices, dtype=np.float32)
+        positions, indices = weld(corners)
+        solids.append(Solid(name, positions, indices))
+    return solids
+
+def to_y_up(positions):
+    """ Converts Z-up .stl positions to the Y-up axes of glTF/Godot (the same conversion Blender's exporters apply). """
+    return np.stack([positions[:, 0], positions[:, 2], -positions[:, 1]], axis=1)
+
+def read_stl(filepath):
+    """
+    Reads a binary or ascii .stl file into numpy arrays.
+
+    Parameters
+    ----------
+    filepath : str
+        location of the .stl file
+
+    Returns
+    -------
+    list
+        the Solids of the file
+    """
+    if is_binary_stl(filepath):
+        return read_binary_stl(filepath)
+    return read_ascii_stl(filepath)
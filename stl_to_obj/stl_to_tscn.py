@@ -1,19 +1,45 @@
 from pathlib import Path
-from io import StringIO
 import argparse
 import json
-import csv
 import shutil
 import warnings
+import multiprocessing
 
-import aspose.threed as a3d
 import bpy
+import numpy as np
 
 import textures # custom module created to store texture info
+import tscn_scene
+import stl_io
+import collision_shapes
+import tiles
+import merge
+import dedup
+import mesh_glb
+import manifest
+from texture_build import build_textures, texture_report, FORMATS
+from glb import GlbWriter
+from build_cache import BuildCache, cache_key
+from blender_session import BlenderSession, triangle_count
+from profiler import Profiler, write_profile, profile_summary
+from worker_pool import run_pool
 
 # example run
 # python3.10 stl_to_tscn.py input.json
 
+# manifest parameters that change the generated .obj/.glb files (the build cache key depends on them)
+CACHE_PARAMS = ["uv_map", "mesh_compression", "collisions", "collision_mode", "lods", "lod_distances", "tiles", "mesh_format", "quantize"]
+
+# formats of the visual meshes (the mesh_format manifest parameter)
+MESH_FORMATS = ["obj", "glb"]
+
+# script that switches between the levels of a LOD chain (copied next to the .obj files of scenes that have LODs)
+LOD_SCRIPT = Path(__file__).parent / "lod_switch.gd"
+
+# Blender instance and stage profiler of this process (every --jobs worker has its own)
+SESSION = BlenderSession()
+PROFILER = Profiler()
+
 # uv map functions from bpy
 UV_MAPS = {
     "smart": bpy.ops.uv.smart_project,
@@ -32,29 +58,50 @@ class TscnGenerator:
         location of the .stl files
     output_folder : str
         where output .obj, .glb, and .tscn files should be placed
-    ext_resource : str
-        stores the references to .jpg, .obj, .glb files that the scene uses
-    ext_resource_id : int
-        index of the next ext_resource to be added
-    sub_resource : str
-        constructions of SpatialMaterials (textures)
-    sub_resource_id : int
-        index of the next sub_resource to be added
-    nodes : str
-        MeshInstances and collisions scenes
+    scene : tscn_scene.Scene
+        the ext_resources (.jpg, .obj, .glb files), sub_resources (SpatialMaterials, shapes),
+        and nodes (MeshInstances and collisions) of the scene
+    root : tscn_scene.Node
+        the root Spatial node
     texture_index : dict
-        stores the sub_resource_id of generated textures
+        stores the SpatialMaterial sub_resource of generated textures
+    resource_index : dict
+        stores the ext_resource of every .obj and .glb path, so repeated meshes share one resource
+    built_textures : dict
+        results of the textures built by the texture_build module (their images replace the ones in res://textures)
+    lod_script : tscn_scene.ExtResource
+        the LOD switching script (None until a mesh with LODs is added)
+    profile : list
+        stage records (see the profiler module) of the meshes converted for this scene
 
     Methods
     -------
     add_texture(texture):
-        Adds a texture to sub_resource and stores its index in texture_index
+        Adds a texture to the sub_resources and stores it in texture_index
     add_obj_file(stl_file_extless, uv_map, mesh_compression, texture):
         Generates an .obj from an .stl and applies a texture to the .obj 
-    add_collisions(stl_file_extless):
-        Generates a .glb collision scene file from an .stl
+    add_ext_resource(file, type):
+        Returns the ext_resource of a file of the output folder, added the first time it is used
+    add_obj_node(stl_file_extless, texture, lods=None, tiles=None, properties=None):
+        Adds the MeshInstance node(s) and ext_resource(s) of an already generated .obj (or LOD chain/tiles of .objs)
+    add_mesh_node(name, parent, lods, texture, properties=None):
+        Adds a MeshInstance, or a LOD chain if there is more than one level
+    add_merged_node(name, texture, groups):
+        Adds the MeshInstance node and ext_resource of an .obj merged from several meshes
+    add_multimesh_node(name, texture, obj_file, transforms):
+        Adds a MultiMeshInstance that draws one .obj at several transforms
+    add_collisions(stl_file_extless, collision_mode):
+        Generates the collisions of an .stl (a .glb collision scene file or simplified shapes)
+    add_collision_node(stl_file_extless, name=None, parent=".", properties=None):
+        Adds the collision scene node and ext_resource of an already generated .glb
+    add_collision_shapes(stl_file_extless, shapes, name=None, parent=".", properties=None):
+        Adds a StaticBody with a CollisionShape node for every simplified shape
+    add_collision_tiles(stl_file_extless, tiles, source=None, properties=None):
+        Adds a Spatial with the collisions of every tile of a tiled mesh
     write_tscn_file():
-        Creates the .tscn file and writes ext_resource, sub_resource, and node to it.
+        Creates the .tscn file and writes the ext_resources, sub_resources, and nodes to it.
+    write_profile_report():
+        Writes profile.json/.csv and prints the slowest meshes and stages
     """
     def __init__(self, input_folder, output_folder, scale):
         """
@@ -69,27 +116,28 @@ class TscnGenerator:
         """
         self.input_folder = input_folder
         self.output_folder = output_folder
+        self.scene = tscn_scene.Scene()
 
-        # all the .obj, .glb, .jpg (textures)
-        self.ext_resource = ""
-        self.ext_resource_id = 1
-
-        # SpatialMaterials (construction of textures)
-        self.sub_resource = ""
-        self.sub_resource_id = 1
-
-        # MeshInstances and collision scenes (.glb)
-        self.nodes = f'[node name="{output_folder}" type="Spatial"]\n'
+        # root node that the MeshInstances and collision scenes (.glb) are added to
+        self.root = self.scene.add_node(output_folder, "Spatial")
         if scale != 1:
-            self.nodes += f'transform = Transform( {scale}, 0, 0, 0, {scale}, 0, 0, 0, {scale}, 0, 0, 0 )\n'
-        self.nodes += "\n" # add extra new line to prepare for next node
+            self.root.properties.append(("transform", f"Transform( {scale}, 0, 0, 0, {scale}, 0, 0, 0, {scale}, 0, 0, 0 )"))
 
         # keep track of textures so we don't generate them more than once
         self.texture_index = dict()
+        self.built_textures = dict()
+
+        # and don't add the files of repeated meshes more than once
+        self.resource_index = dict()
+
+        self.lod_script = None
+
+        # records of the stages of every mesh (only filled with --profile)
+        self.profile = []
 
     def add_texture(self, texture):
         """
-        Adds a texture to sub_resource and stores its index in texture_index.
+        Adds a texture to the sub_resources and stores it in texture_index.
         
         Parameters
         ----------
@@ -98,35 +146,42 @@ class TscnGenerator:
         """
         # don't generate textures more than once
         if texture not in self.texture_index:
+            material = self.scene.add_sub_resource("SpatialMaterial")
             # handle PBR textures (require .jpgs)
             if texture in textures.texture_dict:
                 t_info = textures.texture_dict[texture]
-                self.sub_resource += f'[sub_resource type="SpatialMaterial" id={self.sub_resource_id}]\n'
+                built = self.built_textures.get(texture)
+                # channel packed maps share one image (and ext_resource)
+                jpg_resources = dict()
 
                 for jpg, value in t_info.jpg_dict.items():
-                    if jpg in ["albedo", "roughness", "metallic"]:
-                        self.sub_resource += f"{jpg}_texture = ExtResource( {self.ext_resource_id} )\n"
-                    elif jpg == "normal":
-                        self.sub_resource += textures.NORMAL_OPTIONS + f"normal_texture = ExtResource( {self.ext_resource_id} )\n"
-                    elif jpg == "depth":
-                        self.sub_resource += textures.DEPTH_OPTIONS + f"depth_texture = ExtResource( {self.ext_resource_id} )\n"
                     # add .jpg as ext_resource
-                    self.ext_resource += f'[ext_resource path="res://{textures.TEXTURE_FOLDER}/{t_info.folder}/{value}" type="Texture" id={self.ext_resource_id}]\n'
-                    self.ext_resource_id += 1
+                    if built is None:
+                        path = f"res://{textures.TEXTURE_FOLDER}/{t_info.folder}/{value}"
+                    else:
+                        path = f"res://models/{self.output_folder}/{built['files'][jpg]}"
+                    if path not in jpg_resources:
+                        jpg_resources[path] = self.scene.add_ext_resource(path, "Texture")
+                    jpg_resource = jpg_resources[path]
+                    if jpg == "normal":
+                        material.properties += tscn_scene.parse_properties(textures.NORMAL_OPTIONS)
+                    elif jpg == "depth":
+                        material.properties += tscn_scene.parse_properties(textures.DEPTH_OPTIONS)
+                    if jpg in ["albedo", "roughness", "metallic", "normal", "depth"]:
+                        material.properties.append((f"{jpg}_texture", jpg_resource))
+                    if built is not None and jpg in built["channels"]:
+                        material.properties.append((f"{jpg}_texture_channel", built["channels"][jpg]))
 
                 # add uv1_scale if texture has it
                 if t_info.uv1_scale:
-                    self.sub_resource += f"uv1_scale = {t_info.uv1_scale}\n"
+                    material.properties.append(("uv1_scale", t_info.uv1_scale))
 
             # handle textures which don't need .jpgs (only need sub_resource)
             elif texture in textures.other_textures:
-                self.sub_resource += f'[sub_resource type="SpatialMaterial" id={self.sub_resource_id}]\n{textures.other_textures[texture]}'
+                material.properties += tscn_scene.parse_properties(textures.other_textures[texture])
 
-            self.sub_resource += "\n"
-                
-            # add the sub resource's index to texture_index so we can use it later 
-            self.texture_index[texture] = self.sub_resource_id
-            self.sub_resource_id += 1 
+            # store the sub resource in texture_index so we can use it later 
+            self.texture_index[texture] = material
 
     def add_obj_file(self, stl_file_extless, uv_map, mesh_compression, texture):
         """
@@ -143,154 +198,749 @@ class TscnGenerator:
         texture : str
             texture to apply to this .stl file 
         """
-        # reset bpy
-        bpy.ops.wm.read_factory_settings(use_empty=True)
-        # import .stl into bpy
-        import_path = Path(self.input_folder) / Path(stl_file_extless).with_suffix('.stl')
-        bpy.ops.import_mesh.stl(filepath=str(import_path))
-        # Get all objects in selection
-        selection = bpy.context.selected_objects
-        # Deselect all objects
-        bpy.ops.object.select_all(action='DESELECT')
+        export_obj(self.input_folder, self.output_folder, stl_file_extless, uv_map, mesh_compression)
+        self.add_obj_node(stl_file_extless, texture)
 
-        for obj in selection:
-            # Select each object
-            obj.select_set(True)
-            # Make it active
-            bpy.context.view_layer.objects.active = obj
-            # Toggle into Edit Mode
-            bpy.ops.object.mode_set(mode='EDIT')
-            # Select the geometry
-            bpy.ops.mesh.select_all(action='SELECT')
-
-            # Remove unnecessary faces 
-            if mesh_compression == "limited_dissolve": 
-                bpy.ops.mesh.dissolve_limited()
-            elif mesh_compression == "tris_to_quads":
-                bpy.ops.mesh.tris_convert_to_quads() 
-
-            # Call project operator to generate uv maps
-            try:
-                UV_MAPS[uv_map]()
-            except KeyError:
-                e = KeyError(f"no uv map generated for {stl_file_extless} due to invalid uv_map")
-                raise e
-
-            # Toggle out of Edit Mode
-            bpy.ops.object.mode_set(mode='OBJECT')
-            # Deselect the object
-            obj.select_set(False)
-
-        # Export to obj
-        export_path = Path(self.output_folder) / Path(stl_file_extless).with_suffix('.obj')
-        bpy.ops.wm.obj_export(filepath = str(export_path))
-        
-        # remove the .mtl file
-        mtl_filepath = Path(self.output_folder) / Path(stl_file_extless).with_suffix('.mtl')
-        Path.unlink(mtl_filepath)
+    def add_ext_resource(self, file, type):
+        """ Returns the ext_resource of a file of the output folder, added the first time it is used """
+        path = f"res://models/{self.output_folder}/{file}"
+        if path not in self.resource_index:
+            self.resource_index[path] = self.scene.add_ext_resource(path, type)
+        return self.resource_index[path]
+
+    def add_obj_node(self, stl_file_extless, texture, lods=None, tiles=None, properties=None):
+        """
+        Adds the MeshInstance node and .obj ext_resource of an already generated .obj
+
+        A LOD chain is added as a Spatial (with the LOD switching script) that has one MeshInstance per level,
+        the visibility range of each level is stored in its lod_min_distance and lod_max_distance.
+        A tiled mesh is added as a Spatial with one node (MeshInstance or LOD chain) per tile,
+        the bounds of every tile are stored in its metadata.
+
+        Parameters
+        ----------
+        stl_file_extless : str
+            name of the .stl file without the extension
+        texture : str
+            texture to apply to this .obj file (must already be added with add_texture)
+        lods : list
+            the levels generated by export_obj (None or a single level adds a plain MeshInstance)
+        tiles : list
+            the tiles generated by convert_mesh (None or empty if the mesh isn't tiled)
+        properties : list
+            extra (key, value) pairs of the node (ex: the transform of a repeated mesh)
+        """
+        if not tiles:
+            self.add_mesh_node(stl_file_extless, ".", lods or [{"file": f"{stl_file_extless}.obj"}], texture, properties)
+            return
+
+        self.scene.add_node(stl_file_extless, "Spatial", ".", properties=properties)
+        for tile in tiles:
+            low, high = tile["bounds"]
+            size = [round(h - l, collision_shapes.COORDINATE_DECIMALS) for l, h in zip(low, high)]
+            bounds = f'{{\n"bounds": AABB( {", ".join(map(str, low + size))} )\n}}'
+            self.add_mesh_node(tile["name"], stl_file_extless, tile["lods"], texture, [("__meta__", bounds)])
+
+    def add_mesh_node(self, name, parent, lods, texture, properties=None):
+        """
+        Adds a MeshInstance, or a LOD chain if there is more than one level
+
+        A .glb (see mesh_glb) is added as an instance of the scene Godot imports it as,
+        and its MeshInstances (one per level) get the material and LOD distances through child nodes that override them.
+
+        Parameters
+        ----------
+        name : str
+            name of the node
+        parent : str
+            path of the parent node
+        lods : list
+            the levels generated by export_obj (only "file" is needed for a single level)
+        texture : str
+            texture to apply to the meshes (must already be added with add_texture)
+        properties : list
+            extra (key, value) pairs of the node
+        """
+        properties = properties if properties is not None else []
+        glb = Path(lods[0]["file"]).suffix == ".glb"
+        if len(lods) == 1 and not glb:
+            mesh = self.add_ext_resource(lods[0]["file"], "ArrayMesh")
+            self.scene.add_node(name, "MeshInstance", parent, properties=[("mesh", mesh), ("material/0", self.texture_index[texture])] + properties)
+            return
+
+        if len(lods) > 1:
+            if self.lod_script is None:
+                self.lod_script = self.scene.add_ext_resource(f"res://models/{self.output_folder}/{LOD_SCRIPT.name}", "Script")
+            properties = [("script", self.lod_script)] + properties
+        if glb:
+            self.scene.add_node(name, parent=parent, instance=self.add_ext_resource(lods[0]["file"], "PackedScene"), properties=properties)
+        else:
+            self.scene.add_node(name, "Spatial", parent, properties=properties)
+        for level_index, level in enumerate(lods):
+            level_properties = [("material/0", self.texture_index[texture])]
+            if level.get("min_distance"):
+                level_properties.append(("lod_min_distance", float(level["min_distance"])))
+            if level.get("max_distance"):
+                level_properties.append(("lod_max_distance", float(level["max_distance"])))
+            if glb:
+                self.scene.add_node(level["node"], parent=name if parent == "." else f"{parent}/{name}", properties=level_properties)
+            else:
+                mesh = self.add_ext_resource(level["file"], "ArrayMesh")
+                self.scene.add_node(f"LOD{level_index}", "MeshInstance", name if parent == "." else f"{parent}/{name}", properties=[("mesh", mesh)] + level_properties)
 
-        # add to tscn file
-        self.nodes += f'[node name="{stl_file_extless}" type="MeshInstance" parent="."]\nmesh = ExtResource( {self.ext_resource_id} )' \
-                    + f'\nmaterial/0 = SubResource( {self.texture_index[texture]} )\n\n'
-        self.ext_resource += f'[ext_resource path="res://models/{self.output_folder}/{stl_file_extless}.obj" type="ArrayMesh" id={self.ext_resource_id}]\n'
-        self.ext_resource_id += 1
+    def add_merged_node(self, name, texture, groups):
+        """
+        Adds the MeshInstance node and .obj ext_resource of an .obj merged from several meshes (see the merge module)
+
+        Parameters
+        ----------
+        name : str
+            name of the merged mesh
+        texture : str
+            texture shared by the merged meshes (must already be added with add_texture)
+        groups : list
+            names of the .stl files (without the extension) that were merged, stored in the node's metadata
+        """
+        groups = ", ".join(f'"{group}"' for group in groups)
+        self.add_mesh_node(name, ".", [{"file": f"{name}.obj"}], texture, [("__meta__", f'{{\n"groups": [ {groups} ]\n}}')])
 
-    def add_collisions(self, stl_file_extless):
+    def add_multimesh_node(self, name, texture, obj_file, transforms):
         """
-        Generates a .glb collision scene file from an .stl
+        Adds a MultiMeshInstance that draws one .obj at several transforms (see the dedup module)
+
+        Parameters
+        ----------
+        name : str
+            name of the node
+        texture : str
+            texture shared by the instances (must already be added with add_texture)
+        obj_file : str
+            the .obj file (relative to the output folder) of the instances
+        transforms : list
+            the 12 values (see dedup.godot_transform) of the transform of every instance
+        """
+        mesh = self.add_ext_resource(obj_file, "ArrayMesh")
+        values = ", ".join(f"{value:g}" for transform in transforms for value in transform)
+        # transform_format 1 is MultiMesh.TRANSFORM_3D
+        multimesh = self.scene.add_sub_resource("MultiMesh", [("transform_format", 1), ("instance_count", len(transforms)),
+                                                             ("mesh", mesh), ("transform_array", f"PoolVector3Array( {values} )")])
+        self.scene.add_node(name, "MultiMeshInstance", ".", properties=[("multimesh", multimesh), ("material_override", self.texture_index[texture])])
+
+    def add_collisions(self, stl_file_extless, collision_mode="trimesh"):
+        """
+        Generates the collisions of an .stl (a .glb collision scene file or simplified shapes)
 
         Parameters
         ----------
         stl_file_extless : str
             name of the .stl file without the extension
+        collision_mode : str
+            how to simplify the collisions (see collision_shapes.COLLISION_MODES)
+        """
+        collisions = export_collisions(self.input_folder, self.output_folder, stl_file_extless, collision_mode)
+        if collisions["shapes"]:
+            self.add_collision_shapes(stl_file_extless, collisions["shapes"])
+        else:
+            self.add_collision_node(stl_file_extless)
+
+    def add_collision_node(self, stl_file_extless, name=None, parent=".", properties=None):
         """
-        # generate fbx file from stl file to create collisions
-        stl_file = Path(self.input_folder) / Path(stl_file_extless).with_suffix('.stl')
-        fbx_file = Path(self.output_folder) / Path(stl_file_extless).with_suffix('.fbx')
-        scene = a3d.Scene.from_file(str(stl_file))
-        scene.save(str(fbx_file))
+        Adds the collision scene node and .glb ext_resource of an already generated .glb
 
-        # reset bpy
-        bpy.ops.wm.read_factory_settings(use_empty=True)
-        # import .fbx into bpy
-        bpy.ops.import_scene.fbx(filepath = str(fbx_file))
+        Parameters
+        ----------
+        stl_file_extless : str
+            name of the .glb file without the extension (the .stl's name, unless it is a tile's collisions)
+        name : str
+            name of the node (default: {stl_file_extless}Col)
+        parent : str
+            path of the parent node
+        properties : list
+            extra (key, value) pairs of the node
+        """
+        collision_scene = self.add_ext_resource(f"{stl_file_extless}.glb", "PackedScene")
+        self.scene.add_node(name or f"{stl_file_extless}Col", parent=parent, instance=collision_scene, properties=properties)
 
-        # rename all objects as -colonly
-        for obj_index, obj in enumerate(bpy.data.objects):
-            # every re-name moves the object to the back of the list. 
-            obj.name = "Volume" + str(obj_index) + "-colonly"
+    def add_collision_shapes(self, stl_file_extless, shapes, name=None, parent=".", properties=None):
+        """
+        Adds a StaticBody with a CollisionShape node for every simplified shape
 
-        # export to .gltf
-        bpy.ops.export_scene.gltf(filepath = f"{self.output_folder}/{stl_file_extless}.gltf")
+        Parameters
+        ----------
+        stl_file_extless : str
+            name of the .stl file without the extension
+        shapes : list
+            shape dicts generated by the collision_shapes module
+        name : str
+            name of the StaticBody (default: {stl_file_extless}Col)
+        parent : str
+            path of the parent node
+        properties : list
+            extra (key, value) pairs of the StaticBody
+        """
+        name = name or f"{stl_file_extless}Col"
+        self.scene.add_node(name, "StaticBody", parent, properties=properties)
+        for shape_index, shape in enumerate(shapes):
+            node = self.scene.add_node(f"CollisionShape{shape_index}", "CollisionShape", name if parent == "." else f"{parent}/{name}")
+            if shape["type"] == "box":
+                resource = self.scene.add_sub_resource("BoxShape", [("extents", f'Vector3( {", ".join(map(str, shape["extents"]))} )')])
+                node.properties.append(("transform", f'Transform( 1, 0, 0, 0, 1, 0, 0, 0, 1, {", ".join(map(str, shape["origin"]))} )'))
+            elif shape["type"] == "convex":
+                resource = self.scene.add_sub_resource("ConvexPolygonShape", [("points", f'PoolVector3Array( {", ".join(map(str, shape["points"]))} )')])
+            node.properties.append(("shape", resource))
 
-        # remove the fbx file
-        Path.unlink(fbx_file)
+    def add_collision_tiles(self, stl_file_extless, tiles, source=None, properties=None):
+        """
+        Adds a Spatial with the collisions (collision scene or StaticBody) of every tile of a tiled mesh
 
-        # add to tscn file  
-        self.nodes += f'[node name="{stl_file_extless}Col" parent="." instance=ExtResource( {self.ext_resource_id} )]\n\n'
-        self.ext_resource += f'[ext_resource path="res://models/{self.output_folder}/{stl_file_extless}.glb" type="PackedScene" id={self.ext_resource_id}]\n'
-        self.ext_resource_id += 1
+        Parameters
+        ----------
+        stl_file_extless : str
+            name of the .stl file without the extension
+        tiles : list
+            the "name" and "shapes" of every tile generated by export_collisions
+        source : str
+            name of the .stl file whose .glb files are used (default: stl_file_extless, another mesh for repeated meshes)
+        properties : list
+            extra (key, value) pairs of the Spatial
+        """
+        source = source or stl_file_extless
+        self.scene.add_node(f"{stl_file_extless}Col", "Spatial", ".", properties=properties)
+        for tile in tiles:
+            if tile["shapes"]:
+                self.add_collision_shapes(stl_file_extless, tile["shapes"], tile["name"], f"{stl_file_extless}Col")
+            else:
+                self.add_collision_node(f"{source}_{tile['name']}", tile["name"], f"{stl_file_extless}Col")
 
     def write_tscn_file(self):
-        """ Creates the .tscn file and writes ext_resource, sub_resource, and node to it. """
+        """ Creates the .tscn file and writes the ext_resources, sub_resources, and nodes to it. """
         with open(f"{self.output_folder}/{self.output_folder}.tscn", 'w') as tscn_file:
-            tscn_file.write(f"[gd_scene load_steps={self.ext_resource_id + self.sub_resource_id} format=2]\n\n{self.ext_resource}\n{self.sub_resource}{self.nodes}")
+            self.scene.write(tscn_file)
+        if self.lod_script is not None:
+            shutil.copy(LOD_SCRIPT, Path(self.output_folder) / LOD_SCRIPT.name)
 
+    def write_profile_report(self):
+        """ Writes profile.json/.csv in the output folder and prints the slowest meshes and stages """
+        write_profile(self.profile, self.output_folder)
+        print(profile_summary(self.profile))
 
-def make_folder(folder):
+def parse_lods(lods, lod_distances):
+    """
+    Turns the lods and lod_distances manifest values into the levels of a LOD chain.
+
+    Parameters
+    ----------
+    lods : list or str
+        decreasing fractions of the faces kept by each level (ex: [1.0, 0.5, 0.15], or "1.0 0.5 0.15" in a .csv),
+        None or "" for a single full detail level
+    lod_distances : list or str
+        increasing camera distances (in Godot units) where each level switches to the next one,
+        one less than the number of levels
+
+    Returns
+    -------
+    list
+        one dict per level with its "ratio", "min_distance", and "max_distance" (0 for no limit)
+    """
+    def values(value):
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.replace(";", " ").split()
+        return [float(v) for v in value]
+
+    ratios = values(lods) or [1.0]
+    distances = values(lod_distances)
+    if any(not 0 < ratio <= 1 for ratio in ratios) or any(a <= b for a, b in zip(ratios, ratios[1:])):
+        raise ValueError(f"invalid lods {lods}, the ratios must be decreasing and in (0, 1]")
+    if len(distances) != len(ratios) - 1 or any(d <= 0 for d in distances) or any(a >= b for a, b in zip(distances, distances[1:])):
+        raise ValueError(f"invalid lod_distances {lod_distances}, there must be one increasing distance between every two lods")
+    bounds = [0.0] + distances + [0.0]
+    return [{"ratio": ratio, "min_distance": bounds[i], "max_distance": bounds[i + 1]} for i, ratio in enumerate(ratios)]
+
+def plan_tiles(input_folder, stl_file_extless, tiles_option):
+    """
+    Builds the tiles of an .stl from the centers of its triangles.
+
+    Parameters
+    ----------
+    input_folder : str
+        location of the .stl files
+    stl_file_extless : str
+        name of the .stl file without the extension
+    tiles_option : str
+        the tiles manifest value (see tiles.parse_tiles)
+
+    Returns
+    -------
+    tuple
+        the tiles.TileGrid (None without tiling), and the bounds of every non empty tile (in Godot's axes)
+    """
+    mode, parameter = tiles.parse_tiles(tiles_option)
+    if mode is None:
+        return None, dict()
+    with PROFILER.stage(stl_file_extless, "tile_planning") as record:
+        solids = stl_io.read_stl(Path(input_folder) / Path(stl_file_extless).with_suffix('.stl'))
+        centers = np.concatenate([tiles.triangle_centers(solid.positions, solid.indices) for solid in solids])
+        tile_grid = tiles.TileGrid(centers, mode, parameter)
+        bounds = {tile: tiles.tile_bounds(parts) for tile, parts in tiles.split_solids(solids, tile_grid).items()}
+        record["triangles_out"] = len(centers)
+    return tile_grid, bounds
+
+def export_obj(input_folder, output_folder, stl_file_extless, uv_map, mesh_compression, lods=None, tile_grid=None,
+               mesh_format="obj", quantize=False, session=SESSION):
+    """
+    Generates an .obj (or a LOD chain of .objs) from an .stl (without touching any scene state)
+
+    The first level is written as {stl_file_extless}.obj and level i as {stl_file_extless}_lod{i}.obj,
+    every level is decimated from the same uv mapped mesh so they all share its texture mapping.
+    With a tile_grid, the .stl is split into tiles before it is compressed (so no face crosses tiles),
+    and every tile gets its own files ({stl_file_extless}_Tile{index}.obj, {stl_file_extless}_Tile{index}_lod{i}.obj).
+    With the glb mesh_format, every level is a node of a single {stl_file_extless}_visual.glb
+    (or {stl_file_extless}_Tile{index}_visual.glb) written straight from the mesh (see the mesh_glb module).
+
+    Parameters
+    ----------
+    input_folder : str
+        location of the .stl files
+    output_folder : str
+        where the output .obj file should be placed
+    stl_file_extless : str
+        name of the .stl file without the extension
+    uv_map : str
+        type of texture mapping to apply to the mesh
+    mesh_compression : str
+        how to combine the triangles of the .stl file
+    lods : list
+        the levels returned by parse_lods (None for a single full detail level)
+    tile_grid : tiles.TileGrid
+        the tiles to split the mesh into (None to keep it whole)
+    mesh_format : str
+        obj or glb
+    quantize : bool
+        whether the .glb stores its vertex attributes as integers
+    session : BlenderSession
+        the Blender instance to use
+
+    Returns
+    -------
+    dict
+        tile index (None without a tile_grid) -> the levels with the "file" they were written to, their "triangles"
+        (None for a single untiled .obj, unless profiling), and the "bytes" of their file or of their part of the .glb
+        (.glb levels also have the "node" they are in and about how many "obj_bytes" they would take as an .obj)
+    """
+    if mesh_format not in MESH_FORMATS:
+        raise ValueError(f"invalid mesh_format {mesh_format}, must be one of {MESH_FORMATS}")
+    if uv_map not in UV_MAPS:
+        raise KeyError(f"no uv map generated for {stl_file_extless} due to invalid uv_map")
+    lods = lods or parse_lods(None, None)
+
+    with PROFILER.stage(stl_file_extless, "blender_reset"):
+        # clear the previous mesh out of bpy
+        session.reset()
+    with PROFILER.stage(stl_file_extless, "stl_import") as record:
+        # import .stl into bpy
+        import_path = Path(input_folder) / Path(stl_file_extless).with_suffix('.stl')
+        bpy.ops.import_mesh.stl(filepath=str(import_path))
+        # Get all objects in selection
+        selection = list(bpy.context.selected_objects)
+    triangles = triangle_count(selection) if PROFILER.enabled else None
+    record["triangles_out"] = triangles
+
+    parts = {None: selection}
+    if tile_grid is not None:
+        with PROFILER.stage(stl_file_extless, "tile_split", triangles) as record:
+            parts = session.split(selection, tile_grid)
+            selection = [obj for objects in parts.values() for obj in objects]
+            record["triangles_out"] = triangles
+
+    with PROFILER.stage(stl_file_extless, mesh_compression or "mesh_compression", triangles) as record:
+        # Remove unnecessary faces (through bmesh, so it doesn't need edit mode)
+        session.compress(selection, mesh_compression)
+    triangles = triangle_count(selection) if PROFILER.enabled else None
+    record["triangles_out"] = triangles
+
+    with PROFILER.stage(stl_file_extless, f"{uv_map}_uv_projection", triangles):
+        # edit all the objects (of every tile) at once, so there is only one round trip into edit mode
+        for obj in selection:
+            obj.select_set(True)
+        bpy.context.view_layer.objects.active = selection[0]
+        bpy.ops.object.mode_set(mode='EDIT')
+        # Select the geometry
+        bpy.ops.mesh.select_all(action='SELECT')
+        # Call project operator to generate uv maps
+        UV_MAPS[uv_map]()
+        # Toggle out of Edit Mode
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    count_triangles = PROFILER.enabled or len(lods) > 1 or tile_grid is not None
+    exported = dict()
+    for tile, objects in parts.items():
+        tile_file_extless = stl_file_extless if tile is None else f"{stl_file_extless}_{tiles.tile_name(tile)}"
+        # only export the objects of this tile
+        bpy.ops.object.select_all(action='DESELECT')
+        for obj in objects:
+            obj.select_set(True)
+
+        levels = []
+        visual_glb = mesh_glb.VisualGlb(quantize) if mesh_format == "glb" else None
+        for level_index, level in enumerate(lods):
+            level_file_extless = tile_file_extless if level_index == 0 else f"{tile_file_extless}_lod{level_index}"
+            stage = f"{mesh_format}_export" if len(lods) == 1 else f"lod{level_index}_{mesh_format}_export"
+            if tile is not None:
+                stage = f"{tiles.tile_name(tile)}_{stage}"
+            with PROFILER.stage(stl_file_extless, stage, triangles) as record:
+                if visual_glb is not None:
+                    # the levels are read out of Blender with the decimate modifiers applied, and written together below
+                    node = tile_file_extless if len(lods) == 1 else f"LOD{level_index}"
+                    with session.decimated(objects, level["ratio"]):
+                        written = visual_glb.add_level(node, objects)
+                    levels.append(level | {"file": f"{tile_file_extless}_visual.glb", "node": node} | written)
+                    record["triangles_out"] = written["triangles"]
+                    continue
+                # Export to obj (the exporter applies the decimate modifiers)
+                with session.decimated(objects, level["ratio"]):
+                    export_path = Path(output_folder) / Path(level_file_extless).with_suffix('.obj')
+                    bpy.ops.wm.obj_export(filepath = str(export_path), export_selected_objects = True)
+                    level_triangles = triangle_count(objects, evaluated=True) if count_triangles else None
+                record["triangles_out"] = level_triangles
+            levels.append(level | {"file": export_path.name, "triangles": level_triangles, "bytes": export_path.stat().st_size})
+
+            # remove the .mtl file
+            mtl_filepath = Path(output_folder) / Path(level_file_extless).with_suffix('.mtl')
+            Path.unlink(mtl_filepath)
+        if visual_glb is not None:
+            with PROFILER.stage(stl_file_extless, "glb_write" if tile is None else f"{tiles.tile_name(tile)}_glb_write"):
+                visual_glb.write(Path(output_folder) / levels[0]["file"])
+        exported[tile] = levels
+    return exported
+
+def export_collisions(input_folder, output_folder, stl_file_extless, collision_mode="trimesh", tile_grid=None):
+    """
+    Generates the collisions of an .stl (without touching any scene state).
+    The .stl is read straight into numpy arrays, so neither aspose nor bpy are needed.
+
+    trimesh and decimated collisions are written as a .glb collision scene file,
+    the other modes are returned as shapes that are written into the .tscn.
+    With a tile_grid, the collisions are generated separately for the triangles of every tile
+    (the same tiles as the visual mesh), with one .glb per tile ({stl_file_extless}_Tile{index}.glb).
+
+    Parameters
+    ----------
+    input_folder : str
+        location of the .stl files
+    output_folder : str
+        where the output .glb file should be placed
+    stl_file_extless : str
+        name of the .stl file without the extension
+    collision_mode : str
+        how to simplify the collisions (see collision_shapes.COLLISION_MODES)
+    tile_grid : tiles.TileGrid
+        the tiles to split the collisions into (None to keep them whole)
+
+    Returns
+    -------
+    dict
+        "shapes" lists the simplified shapes (empty if a .glb was written or if tiled),
+        "tiles" has the "name" and "shapes" of every tile (only with a tile_grid),
+        "triangles" has the triangle count of the .stl and of the generated collisions
+    """
+    mode, ratio = collision_shapes.parse_collision_mode(collision_mode)
+    stl_file = Path(input_folder) / Path(stl_file_extless).with_suffix('.stl')
+    with PROFILER.stage(stl_file_extless, "collision_stl_read") as record:
+        stl_solids = stl_io.read_stl(stl_file)
+        triangles_before = sum(solid.triangle_count for solid in stl_solids)
+        record["triangles_out"] = triangles_before
+
+    if tile_grid is None:
+        shapes, triangles_after = collision_solids(output_folder, stl_file_extless, stl_file_extless,
+                                                   [(solid.positions, solid.indices) for solid in stl_solids], mode, ratio)
+        return {"shapes": shapes, "triangles": [triangles_before, triangles_after]}
+
+    with PROFILER.stage(stl_file_extless, "collision_tile_split", triangles_before) as record:
+        parts = tiles.split_solids(stl_solids, tile_grid)
+        record["triangles_out"] = triangles_before
+    tile_results = []
+    triangles_after = 0
+    for tile, solids in parts.items():
+        name = tiles.tile_name(tile)
+        shapes, triangles = collision_solids(output_folder, stl_file_extless, f"{stl_file_extless}_{name}", solids, mode, ratio, f"{name}_")
+        tile_results.append({"name": name, "shapes": shapes})
+        triangles_after += triangles
+    return {"shapes": [], "tiles": tile_results, "triangles": [triangles_before, triangles_after]}
+
+def collision_solids(output_folder, stl_file_extless, glb_file_extless, solids, mode, ratio, stage_prefix=""):
+    """
+    Generates the collisions of some solids (a whole .stl or one of its tiles), see export_collisions.
+
+    Parameters
+    ----------
+    output_folder : str
+        where the output .glb file should be placed
+    stl_file_extless : str
+        name of the .stl file without the extension (for the profile)
+    glb_file_extless : str
+        name of the .glb file to write (trimesh and decimated modes) without the extension
+    solids : list
+        (positions, indices) of every solid, in the .stl's axes
+    mode, ratio : str, float
+        the parsed collision_mode
+    stage_prefix : str
+        prepended to the names of the profiled stages
+
+    Returns
+    -------
+    tuple
+        the simplified shapes (empty if a .glb was written), and the triangle count of the collisions
+    """
+    solids = [(stl_io.to_y_up(positions), indices) for positions, indices in solids]
+    triangles_before = sum(len(indices) for _, indices in solids)
+    if mode in ["convex", "convex_decomposition", "box"]:
+        with PROFILER.stage(stl_file_extless, f"{stage_prefix}{mode}_collision_shapes", triangles_before) as record:
+            shapes, triangles_after = collision_shapes.simplified_shapes(solids, mode)
+            record["triangles_out"] = triangles_after
+        return shapes, triangles_after
+
+    if mode == "decimated":
+        with PROFILER.stage(stl_file_extless, f"{stage_prefix}collision_decimation", triangles_before) as record:
+            solids = [collision_shapes.decimate(positions, indices, ratio) for positions, indices in solids]
+            record["triangles_out"] = sum(len(indices) for _, indices in solids)
+    triangles_after = sum(len(indices) for _, indices in solids)
+    with PROFILER.stage(stl_file_extless, f"{stage_prefix}collision_glb_export", triangles_after) as record:
+        glb = GlbWriter()
+        # name every solid as -colonly so Godot only imports it as a collision shape
+        for solid_index, (positions, indices) in enumerate(solids):
+            glb.add_mesh("Volume" + str(solid_index) + "-colonly", positions, indices)
+        glb.write(Path(output_folder) / Path(glb_file_extless).with_suffix('.glb'))
+        record["triangles_out"] = triangles_after
+    return [], triangles_after
+
+def mesh_result(error):
+    """ Returns the result of a mesh before anything is converted (see convert_mesh), also the result of a mesh whose worker failed """
+    return {"error": error, "outputs": [], "lods": [], "tiles": [], "collisions": None, "blender_overhead": 0.0, "profile": []}
+
+def convert_mesh(input_folder, output_folder, mesh, warm=True, profile=False):
+    """
+    Generates all the output files of one manifest entry. 
+    This is the unit of work sent to the worker processes in --jobs mode.
+
+    Parameters
+    ----------
+    input_folder : str
+        location of the .stl files
+    output_folder : str
+        where output .obj and .glb files should be placed
+    mesh : dict
+        one entry of the "meshes" array of the input file
+    warm : bool
+        whether to reuse this process's Blender instance without factory resetting it
+    profile : bool
+        whether to record the time, memory, and triangles of every stage
+
+    Returns
+    -------
+    dict
+        "outputs" lists the generated files (relative to output_folder),
+        "blender_overhead" is the time spent resetting Blender (seconds),
+        "profile" has the records of every stage (empty unless profile is True),
+        "lods" has the levels written by export_obj (empty if tiled),
+        "tiles" has the "name", "bounds", and "lods" of every tile (empty unless the mesh is tiled),
+        "collisions" is the result of export_collisions (None without collisions),
+        "error" is None if the mesh was converted, otherwise a description of the error
+    """
+    stl_file_extless = Path(mesh["stl_file"]).stem
+    # stl_file can be in a subfolder of the input folder
+    input_folder = Path(input_folder) / Path(mesh["stl_file"]).parent
+    result = mesh_result(None)
+    SESSION.warm = warm
+    PROFILER.enabled = profile
+    overhead = SESSION.overhead_seconds
+    try:
+        lods = parse_lods(mesh.get("lods"), mesh.get("lod_distances"))
+        tile_grid, bounds = plan_tiles(input_folder, stl_file_extless, mesh.get("tiles"))
+        exported = export_obj(input_folder, output_folder, stl_file_extless, mesh["uv_map"], mesh["mesh_compression"], lods, tile_grid,
+                              mesh.get("mesh_format") or "obj", bool(mesh.get("quantize")))
+        result["blender_overhead"] = SESSION.overhead_seconds - overhead
+        if tile_grid is None:
+            result["lods"] = exported[None]
+        else:
+            result["tiles"] = [{"name": tiles.tile_name(tile), "bounds": bounds.get(tile), "lods": levels} for tile, levels in exported.items()]
+        result["outputs"] += list(dict.fromkeys(level["file"] for levels in exported.values() for level in levels))
+        if mesh["collisions"]:
+            result["collisions"] = export_collisions(input_folder, output_folder, stl_file_extless, mesh.get("collision_mode"), tile_grid)
+            if "tiles" in result["collisions"]:
+                result["outputs"] += [f"{stl_file_extless}_{tile['name']}.glb" for tile in result["collisions"]["tiles"] if not tile["shapes"]]
+            elif not result["collisions"]["shapes"]:
+                result["outputs"].append(f"{stl_file_extless}.glb")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["profile"] = PROFILER.take()
+    return result
+
+def convert_meshes(input_folder, output_folder, meshes, jobs=1, warm=True, profile=False):
+    """
+    Converts every mesh, either in this process or across a pool of worker processes.
+
+    Each worker process imports its own copy of bpy, so meshes never share a Blender instance.
+
+    Parameters
+    ----------
+    input_folder : str
+        location of the .stl files
+    output_folder : str
+        where output .obj and .glb files should be placed
+    meshes : list
+        the "meshes" array of the input file
+    jobs : int
+        number of worker processes (1 converts the meshes in this process)
+    warm : bool
+        whether to reuse each process's Blender instance without factory resetting it
+    profile : bool
+        whether to record the time, memory, and triangles of every stage
+
+    Returns
+    -------
+    list
+        the result of each mesh (see convert_mesh), in the same order as meshes
+    """
+    if jobs <= 1:
+        return [convert_mesh(input_folder, output_folder, m, warm, profile) for m in meshes]
+
+    # bpy is not fork safe, so every worker starts a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    return run_pool(convert_mesh, [(input_folder, output_folder, m, warm, profile) for m in meshes], jobs, mesh_result, context)
+
+
+def collision_report(meshes, results):
+    """ Returns a printable summary of the collision triangle counts before and after simplification """
+    lines = []
+    for m, result in zip(meshes, results):
+        if result.get("collisions"):
+            before, after = result["collisions"]["triangles"]
+            lines.append(f"{Path(m['stl_file']).stem}: {m.get('collision_mode') or 'trimesh'} collisions, {before} -> {after} triangles")
+    return '\n'.join(lines)
+
+def lod_report(meshes, results):
+    """ Returns a printable summary of the triangle counts of every level of the LOD chains (summed over the tiles of tiled meshes) """
+    lines = []
+    for m, result in zip(meshes, results):
+        chains = [tile["lods"] for tile in result.get("tiles") or []] or [result.get("lods") or []]
+        if len(chains[0]) > 1:
+            counts = ", ".join(f"{sum(chain[i]['triangles'] for chain in chains)} (x{level['ratio']:g})" for i, level in enumerate(chains[0]))
+            lines.append(f"{Path(m['stl_file']).stem}: LOD triangles {counts}")
+    return '\n'.join(lines)
+
+def tile_report(meshes, results):
+    """ Returns a printable summary of the number of tiles and the triangles per tile of tiled meshes """
+    lines = []
+    for m, result in zip(meshes, results):
+        if result.get("tiles"):
+            counts = [tile["lods"][0]["triangles"] for tile in result["tiles"]]
+            lines.append(f"{Path(m['stl_file']).stem}: {len(counts)} tiles, {min(counts)} to {max(counts)} triangles per tile")
+    return '\n'.join(lines)
+
+def mesh_format_report(meshes, results):
+    """ Returns a printable summary of the size of the .glb visual meshes and of the .obj files they replace """
+    lines = []
+    for m, result in zip(meshes, results):
+        levels = [level for tile in result.get("tiles") or [] for level in tile["lods"]] or result.get("lods") or []
+        if "instance_of" not in result and levels and "obj_bytes" in levels[0]:
+            glb_bytes = sum(level["bytes"] for level in levels) / 1024
+            obj_bytes = sum(level["obj_bytes"] for level in levels) / 1024
+            lines.append(f"{Path(m['stl_file']).stem}: .glb meshes {glb_bytes:.1f} KB, about {obj_bytes:.1f} KB as .obj")
+    return '\n'.join(lines)
+
+def add_results(tscn, meshes, results, merges=None, multimeshes=None):
+    """
+    Adds the nodes and resources of every converted mesh to a scene, in manifest order.
+    Copies of another mesh (see the dedup module) reuse its files, placed with their transform.
+
+    Parameters
+    ----------
+    tscn : TscnGenerator
+        the scene
+    meshes : list
+        the "meshes" array of the input file
+    results : list
+        the result of each mesh (see convert_mesh)
+    merges : dict
+        merged mesh name -> indices of the meshes it replaces (see merge.plan_merges), None to add every mesh
+    multimeshes : dict
+        MultiMeshInstance name -> indices of the meshes it draws (see dedup.plan_multimeshes), None to add every mesh
+    """
+    merged_into = {i: name for name, indices in (merges or dict()).items() for i in indices}
+    multimesh_of = {i: name for name, indices in (multimeshes or dict()).items() for i in indices}
+    for i, (m, result) in enumerate(zip(meshes, results)):
+        stl_file_extless = Path(m["stl_file"]).stem
+        if result.get("error") is not None:
+            continue
+        source = result.get("instance_of", stl_file_extless)
+        properties = [("transform", dedup.format_transform(result["transform"]))] if "transform" in result else None
+        tscn.add_texture(m["texture"])
+        if i in multimesh_of:
+            # the MultiMeshInstance takes the place of its first mesh
+            indices = multimeshes[multimesh_of[i]]
+            if indices[0] == i:
+                transforms = [results[j].get("transform", dedup.IDENTITY) for j in indices]
+                tscn.add_multimesh_node(multimesh_of[i], m["texture"], result["lods"][0]["file"], transforms)
+        elif i not in merged_into:
+            tscn.add_obj_node(stl_file_extless, m["texture"], result.get("lods"), result.get("tiles"), properties)
+        # the merged mesh takes the place of its first mesh
+        elif merges[merged_into[i]][0] == i:
+            tscn.add_merged_node(merged_into[i], m["texture"], [Path(meshes[j]["stl_file"]).stem for j in merges[merged_into[i]]])
+        # collisions are never merged, so they keep the names of their meshes
+        if m["collisions"]:
+            if result["collisions"].get("tiles"):
+                tscn.add_collision_tiles(stl_file_extless, result["collisions"]["tiles"], source, properties)
+            elif result["collisions"]["shapes"]:
+                tscn.add_collision_shapes(stl_file_extless, result["collisions"]["shapes"], properties=properties)
+            else:
+                tscn.add_collision_node(source, f"{stl_file_extless}Col", properties=properties)
+
+def draw_calls(scene):
+    """ Returns the number of meshes (MeshInstances, .glb meshes, and MultiMeshInstances) drawn up close (LOD levels that are only shown further away aren't counted) """
+    return sum(1 for node in scene.nodes if (node.type == "MultiMeshInstance" or "material/0" in dict(node.properties))
+               and "lod_min_distance" not in dict(node.properties))
+
+def merge_report(before, after):
+    """ Returns a printable comparison of the node and draw call counts of the scene without and with merging """
+    return (f"merged meshes: {len(before.nodes)} -> {len(after.nodes)} nodes, "
+            f"{draw_calls(before)} -> {draw_calls(after)} draw calls")
+
+def make_folder(folder, force=False):
     try:
         p = Path.cwd() / Path(folder)
         p.mkdir()
-    # delete the folder and remake it if it does exist
+    # keep the folder so the build cache can reuse its files, unless a full rebuild is forced
     except FileExistsError:
-        warnings.warn(f"{folder} folder already exists, so it was deleted and remade", UserWarning)
-        shutil.rmtree(p) # delete folder and contents
-        p.mkdir()
+        if force:
+            warnings.warn(f"{folder} folder already exists, so it was deleted and remade", UserWarning)
+            shutil.rmtree(p) # delete folder and contents
+            p.mkdir()
 
-def csvToDict(csv_filepath):
-    with open(csv_filepath) as csv_file:
-        # split csv_file into two strings
-        # header is the first 2 lines, meshes is the rest.
-        csv_list = list(csv_file)
-        header_string = f'{csv_list[0]}\n{csv_list[1]}'
-        csv_list.pop(0)
-        csv_list.pop(0)
-        meshes_string = '\n'.join(csv_list)
-
-        # create header dict
-        reader = csv.DictReader(StringIO(header_string))
-        for row in reader:
-            row["scale"] = float(row["scale"])
-            header = row # there should only be one row in reader, that's why this works
-
-        # create meshes array
-        meshes = []
-        reader = csv.DictReader(StringIO(meshes_string))
-        for row in reader:
-            if row["collisions"].casefold() == "true":
-                row["collisions"] = True
-            else:
-                row["collisions"] = False
-            meshes.append(row)
-        
-    return {"header": header, "meshes": meshes}
+def load_manifest(input_file):
+    """ Loads the header and meshes of an input file (.json, .jsonl, or .csv), without checking the meshes (see manifest.load_meshes) """
+    header, rows = manifest.open_manifest(input_file)
+    return {"header": header, "meshes": manifest.load_meshes(header, rows, header["input_folder"], validate=False)}
 
 def main():
     parser = argparse.ArgumentParser(prog = ".stl to .obj and .tscn file converter")
-    parser.add_argument("input_file", type = str, help = "input filename (.json or .csv)")
+    parser.add_argument("input_file", type = str, help = "input filename (.json, .jsonl, or .csv)")
+    parser.add_argument("--jobs", "-j", type = int, default = 1, help = "number of worker processes that convert meshes")
+    parser.add_argument("--force", "-f", action = "store_true", help = "delete the output folder and regenerate every mesh")
+    parser.add_argument("--profile", action = "store_true", help = "write profile.json/.csv with the time, memory, and triangles of every stage of every mesh")
+    parser.add_argument("--merge", action = "store_true", help = "merge the meshes that share a texture and uv_map into one mesh (and draw call) per material")
+    parser.add_argument("--texture-source", type = str, default = None, help = "textures folder of the Godot project, builds the textures the manifest uses into the output folder")
+    parser.add_argument("--texture-size", type = int, default = 0, help = "largest side (in pixels) of the built textures (0 keeps their size)")
+    parser.add_argument("--texture-format", type = str, default = "keep", choices = ["keep"] + list(FORMATS), help = "image format of the built textures")
+    parser.add_argument("--pack-textures", action = "store_true", help = "pack the roughness and metallic images of the built textures into one image")
+    parser.add_argument("--dedup", type = str, nargs = "?", const = "instances", default = None, choices = ["instances", "multimesh"],
+                        help = "convert meshes that are moved/rotated copies of another mesh only once, and add them as transformed MeshInstances (instances) or MultiMeshInstances (multimesh)")
+    parser.add_argument("--factory-reset", action = "store_true", help = "factory reset Blender for every mesh instead of reusing a warm session")
     args = parser.parse_args()
 
-    # load data dictionary differently based on whether it is .json or .csv
-    inputSuffix = Path(args.input_file).suffix
-    if inputSuffix == ".json":
-        with open(args.input_file, 'r') as f:
-            data = json.load(f)
-    elif inputSuffix == ".csv":
-        data = csvToDict(args.input_file)
-    else:
-        raise Exception("input file was not a .json or .csv file")
-
-    header = data["header"]
+    PROFILER.enabled = args.profile
+    header, rows = manifest.open_manifest(args.input_file)
     input_folder = header["input_folder"]
     output_folder = header["output_folder"]
 
@@ -298,9 +948,13 @@ def main():
     textures.load_textures("textures.json")
     if "extra_textures" in header: 
         textures.load_textures(header["extra_textures"])
+
+    # every mesh is checked before any is converted
+    data = {"header": header, "meshes": manifest.load_meshes(header, rows, input_folder, {"uv_map": list(UV_MAPS), "mesh_format": MESH_FORMATS},
+                                                                  [(("lods", "lod_distances"), parse_lods)])}
         
     # make the output folder
-    make_folder(output_folder)
+    make_folder(output_folder, args.force)
 
     # initialize tscn class object (with optional scale)
     scale = 1
@@ -308,19 +962,114 @@ def main():
         scale = header["scale"]
     tscn = TscnGenerator(input_folder, output_folder, scale)
 
+    # only build the (PBR) textures the meshes use
+    texture_results = None
+    if args.texture_source:
+        used = {m["texture"]: textures.texture_dict[m["texture"]] for m in data["meshes"] if m["texture"] in textures.texture_dict}
+        with PROFILER.stage(output_folder, "texture_build"):
+            texture_results, texture_cache = build_textures(args.texture_source, output_folder, used, args.jobs,
+                                                            args.texture_size, args.texture_format, args.pack_textures)
+        for name, result in texture_results.items():
+            if result["error"] is None:
+                tscn.built_textures[name] = result
+            else:
+                warnings.warn(f"{name} texture was not built (its original images are used): {result['error']}", UserWarning)
+        texture_cache.save()
+
     ##################################
     # iterate through all .stl files #
     ##################################
-    for m in data["meshes"]:
+    # copies of another mesh (with the same parameters) reuse its files instead of being converted
+    instances = dict()
+    if args.dedup:
+        with PROFILER.stage(output_folder, "dedup"):
+            instances = dedup.find_instances([Path(input_folder) / Path(m["stl_file"]).with_suffix('.stl') for m in data["meshes"]],
+                                             [json.dumps([m.get(p) for p in CACHE_PARAMS]) for m in data["meshes"]])
+
+    # only regenerate the meshes whose .stl or parameters changed since the last run
+    cache = BuildCache(output_folder)
+    keys = []
+    results = []
+    for i, m in enumerate(data["meshes"]):
         stl_file_extless = Path(m["stl_file"]).stem
-        # generation
-        tscn.add_texture(m["texture"])
-        tscn.add_obj_file(stl_file_extless, m["uv_map"], m["mesh_compression"], m["texture"])
-        if m["collisions"]:
-            tscn.add_collisions(stl_file_extless)
+        if i in instances:
+            cache.discard(stl_file_extless)
+            keys.append(None)
+            results.append(None)
+            continue
+        params = {p: m.get(p) for p in CACHE_PARAMS}
+        params["scale"] = scale
+        try:
+            keys.append(cache_key(Path(input_folder) / Path(m["stl_file"]).with_suffix('.stl'), params))
+        # a missing .stl is reported by its conversion like any other failure
+        except FileNotFoundError:
+            keys.append(None)
+        results.append(cache.lookup(stl_file_extless, keys[-1]))
+    misses = [i for i, result in enumerate(results) if result is None and i not in instances]
+
+    # the slow generation of .obj and .glb files can run in parallel...
+    miss_results = convert_meshes(input_folder, output_folder, [data["meshes"][i] for i in misses], args.jobs, not args.factory_reset, args.profile)
+    for i, result in zip(misses, miss_results):
+        stl_file_extless = Path(data["meshes"][i]["stl_file"]).stem
+        tscn.profile += result.pop("profile")
+        if result["error"] is None:
+            cache.update(stl_file_extless, keys[i], result)
+        else:
+            cache.discard(stl_file_extless)
+        results[i] = result
+
+    for i, (original, transform) in instances.items():
+        source = Path(data["meshes"][original]["stl_file"]).stem
+        if results[original]["error"] is None:
+            results[i] = dict(results[original], outputs=[], instance_of=source, transform=transform)
+        else:
+            results[i] = {"error": f"copy of {source}, which was not converted", "outputs": [], "lods": [], "tiles": [], "collisions": None, "blender_overhead": 0.0}
+
+    for m, result in zip(data["meshes"], results):
+        if result.get("error") is not None:
+            warnings.warn(f"{Path(m['stl_file']).stem} was not converted: {result['error']}", UserWarning)
+
+    # meshes that share a material are merged into one .obj (one draw call) per material
+    merges = None
+    if args.merge:
+        merges = merge.plan_merges(data["meshes"], results)
+        merge_map = dict()
+        for name, indices in merges.items():
+            with PROFILER.stage(name, "obj_merge"):
+                merge_map[name] = merge.merge_obj_files(output_folder, name, [Path(data["meshes"][i]["stl_file"]).stem for i in indices])
+        merge.write_merge_map(output_folder, merge_map)
+
+    # copies of a mesh that share a texture are drawn by one MultiMeshInstance
+    multimeshes = None
+    if args.dedup == "multimesh":
+        multimeshes = dedup.plan_multimeshes(data["meshes"], results, {i for indices in (merges or dict()).values() for i in indices})
 
-    tscn.write_tscn_file()    
+    # ...but resource ids are always assigned here in manifest order, so the .tscn doesn't depend on --jobs
+    add_results(tscn, data["meshes"], results, merges, multimeshes)
 
+    with PROFILER.stage(output_folder, "tscn_write"):
+        tscn.write_tscn_file()
+    tscn.profile += PROFILER.take()
+    cache.save()
+    print(cache.report())
+    if texture_results is not None:
+        print(texture_cache.report("texture cache"))
+        print(texture_report(texture_results))
+    print(collision_report(data["meshes"], results))
+    for report in [lod_report(data["meshes"], results), tile_report(data["meshes"], results), mesh_format_report(data["meshes"], results)]:
+        if report:
+            print(report)
+    if args.dedup:
+        print(dedup.dedup_report(data["meshes"], results))
+    if args.merge:
+        unmerged = TscnGenerator(input_folder, output_folder, scale)
+        add_results(unmerged, data["meshes"], results)
+        print(merge_report(unmerged.scene, tscn.scene))
+    if miss_results:
+        overhead = sum(result["blender_overhead"] for result in miss_results) / len(miss_results)
+        print(f"blender session ({'factory reset' if args.factory_reset else 'warm'}): {1000 * overhead:.1f} ms reset overhead per mesh")
+    if args.profile:
+        tscn.write_profile_report()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,211 @@
+from pathlib import Path
+import multiprocessing
+
+import bpy
+import numpy as np
+
+from build_cache import BuildCache, sources_key
+from worker_pool import run_pool
+
+# folder (inside the output folder) and cache file of the built textures
+BUILD_FOLDER = "textures"
+TEXTURE_CACHE_FILENAME = ".texture_cache.json"
+
+# output formats (file extension -> Blender file_format), "keep" keeps the format of every source image
+FORMATS = {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+# Blender file_format of the source images whose format is kept (the formats Godot 3 imports)
+KEEP_FORMATS = FORMATS | {"jpeg": "JPEG", "tga": "TARGA", "bmp": "BMP", "hdr": "HDR", "exr": "OPEN_EXR"}
+
+# channels of the packed roughness/metallic image (SpatialMaterial's TEXTURE_CHANNEL_GREEN and TEXTURE_CHANNEL_BLUE)
+PACKED_CHANNELS = {"roughness": 1, "metallic": 2}
+
+# Godot 3 import settings written next to every built image: VRAM compression with mipmaps and repeat (for uv1_scale)
+IMPORT_OPTIONS = """[remap]
+
+importer="texture"
+type="StreamTexture"
+
+[params]
+
+compress/mode=2
+compress/normal_map={normal_map}
+flags/repeat=true
+flags/filter=true
+flags/mipmaps=true
+detect_3d=false
+"""
+
+def texture_result(error):
+    """ Returns the result of a texture before anything is built (see build_texture), also the result of a texture whose worker failed """
+    return {"error": error, "files": dict(), "channels": dict(), "outputs": [], "bytes": [0, 0]}
+
+def load_image(filepath, size):
+    """ Loads an image into Blender, downscaled so its largest side is at most size (0 keeps its size) """
+    image = bpy.data.images.load(str(filepath))
+    width, height = image.size
+    if size and max(width, height) > size:
+        scale = size / max(width, height)
+        image.scale(max(round(width * scale), 1), max(round(height * scale), 1))
+    return image
+
+def save_image(image, filepath, file_format, normal_map=False):
+    """ Saves a Blender image as file_format and writes its Godot .import settings """
+    image.filepath_raw = str(filepath)
+    image.file_format = file_format
+    image.save()
+    Path(f"{filepath}.import").write_text(IMPORT_OPTIONS.format(normal_map=int(normal_map)))
+
+def pack_roughness_metallic(roughness, metallic, name):
+    """ Returns a new image with the roughness image in its green channel and the metallic image in its blue channel """
+    width, height = roughness.size
+    if tuple(metallic.size) != (width, height):
+        metallic.scale(width, height)
+    pixels = np.ones((height, width, 4), dtype=np.float32)
+    for channel, image in [(PACKED_CHANNELS["roughness"], roughness), (PACKED_CHANNELS["metallic"], metallic)]:
+        source = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(source)
+        pixels[..., channel] = source.reshape(height, width, 4)[..., 0]
+    packed = bpy.data.images.new(name, width, height, alpha=False)
+    packed.colorspace_settings.name = 'Non-Color'
+    packed.pixels.foreach_set(pixels.reshape(-1))
+    return packed
+
+def output_format(filename, file_format):
+    """ Returns the (file extension, Blender file_format) a source image is built as """
+    if file_format != "keep":
+        return f".{file_format}", FORMATS[file_format]
+    suffix = Path(filename).suffix
+    if suffix[1:].casefold() not in KEEP_FORMATS:
+        raise ValueError(f"can't keep the format of {filename}, must be one of {list(KEEP_FORMATS)} (or use another --texture-format)")
+    return suffix, KEEP_FORMATS[suffix[1:].casefold()]
+
+def build_texture(source_folder, output_folder, folder, jpg_dict, size=0, file_format="keep", pack=False):
+    """
+    Downscales, channel packs, and converts the images of one PBR texture.
+    This is the unit of work sent to the worker processes.
+
+    Parameters
+    ----------
+    source_folder : str
+        the textures folder of the Godot project (that has a folder of images for every texture)
+    output_folder : str
+        the output folder of stl_to_tscn (the images are written in its textures folder)
+    folder : str
+        name of the texture (and of its folder)
+    jpg_dict : dict
+        filename of the image of every map (albedo, roughness, ...)
+    size : int
+        largest side of the built images in pixels (0 keeps the size of the source images)
+    file_format : str
+        one of FORMATS, or keep
+    pack : bool
+        whether to pack the roughness and metallic images into one image (only if the texture has both)
+
+    Returns
+    -------
+    dict
+        "files" has the built image of every map (relative to output_folder),
+        "channels" has the channel of every packed map,
+        "outputs" lists the generated files (relative to output_folder),
+        "bytes" has the size of the source and built images,
+        "error" is None if the texture was built, otherwise a description of the error
+    """
+    result = texture_result(None)
+    source = Path(source_folder) / folder
+    build = Path(output_folder) / BUILD_FOLDER / folder
+    images = []
+    try:
+        maps = dict(jpg_dict)
+        # checked before anything is written
+        formats = {map_name: output_format(filename, file_format) for map_name, filename in maps.items()}
+        result["bytes"][0] = sum((source / filename).stat().st_size for filename in maps.values())
+        build.mkdir(parents=True, exist_ok=True)
+
+        if pack and "roughness" in maps and "metallic" in maps:
+            roughness = load_image(source / maps.pop("roughness"), size)
+            metallic = load_image(source / maps.pop("metallic"), size)
+            images += [roughness, metallic]
+            # png, since lossy formats bleed between the channels
+            packed_file = Path(BUILD_FOLDER) / folder / f"{folder}_RoughnessMetallic.png"
+            images.append(pack_roughness_metallic(roughness, metallic, packed_file.stem))
+            save_image(images[-1], Path(output_folder) / packed_file, "PNG")
+            for map_name, channel in PACKED_CHANNELS.items():
+                result["files"][map_name] = packed_file.as_posix()
+                result["channels"][map_name] = channel
+            result["outputs"].append(packed_file.as_posix())
+
+        for map_name, filename in maps.items():
+            image = load_image(source / filename, size)
+            images.append(image)
+            suffix, blender_format = formats[map_name]
+            built_file = Path(BUILD_FOLDER) / folder / Path(filename).with_suffix(suffix).name
+            save_image(image, Path(output_folder) / built_file, blender_format, map_name == "normal")
+            result["files"][map_name] = built_file.as_posix()
+            result["outputs"].append(built_file.as_posix())
+
+        result["bytes"][1] = sum((Path(output_folder) / output).stat().st_size for output in result["outputs"])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    for image in images:
+        bpy.data.images.remove(image)
+    return result
+
+def build_textures(source_folder, output_folder, texture_dict, jobs=1, size=0, file_format="keep", pack=False):
+    """
+    Builds the images of textures that changed since the last run, either in this process or across worker processes.
+
+    Parameters
+    ----------
+    source_folder : str
+        the textures folder of the Godot project
+    output_folder : str
+        the output folder of stl_to_tscn
+    texture_dict : dict
+        the textures to build (name -> textures.Texture), only the ones referenced by the manifest
+    jobs : int
+        number of worker processes (1 builds the textures in this process)
+    size, file_format, pack : int, str, bool
+        see build_texture
+
+    Returns
+    -------
+    tuple
+        the result of every texture (see build_texture, cached or freshly built), and the texture cache
+    """
+    cache = BuildCache(output_folder, TEXTURE_CACHE_FILENAME)
+    params = {"size": size, "format": file_format, "pack": pack}
+    results = dict()
+    keys = dict()
+    for name, texture in texture_dict.items():
+        try:
+            keys[name] = sources_key([Path(source_folder) / texture.folder / filename for filename in texture.jpg_dict.values()],
+                                     params | {"jpg_dict": texture.jpg_dict})
+        # a missing image is reported by its build like any other failure
+        except FileNotFoundError:
+            keys[name] = None
+        results[name] = cache.lookup(name, keys[name])
+    misses = [name for name, result in results.items() if result is None]
+
+    arguments = [(source_folder, output_folder, texture_dict[name].folder, texture_dict[name].jpg_dict, size, file_format, pack) for name in misses]
+    if jobs <= 1:
+        miss_results = [build_texture(*args) for args in arguments]
+    else:
+        # bpy is not fork safe, so every worker starts a fresh interpreter
+        context = multiprocessing.get_context("spawn")
+        miss_results = run_pool(build_texture, arguments, jobs, texture_result, context)
+
+    for name, result in zip(misses, miss_results):
+        if result["error"] is None:
+            cache.update(name, keys[name], result)
+        else:
+            cache.discard(name)
+        results[name] = result
+    return results, cache
+
+def texture_report(results):
+    """ Returns a printable summary of the size of the source and built images """
+    built = [result for result in results.values() if result["error"] is None]
+    before = sum(result["bytes"][0] for result in built) / (1 << 20)
+    after = sum(result["bytes"][1] for result in built) / (1 << 20)
+    return f"built textures: {len(built)} textures, {before:.1f} MB -> {after:.1f} MB"
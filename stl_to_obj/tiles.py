@@ -0,0 +1,167 @@
+import numpy as np
+
+import stl_io
+from collision_shapes import COORDINATE_DECIMALS
+
+# manifest values of tiles (ex: grid:4x4x1 splits x and y into 4, octree:20000 keeps at most 20000 triangles per tile)
+TILE_MODES = ["grid", "octree"]
+DEFAULT_GRID = (2, 2, 2)
+DEFAULT_BUDGET = 50000
+
+# the octree is built on a 2^OCTREE_DEPTH grid of morton codes (3 * OCTREE_DEPTH bits)
+OCTREE_DEPTH = 10
+
+def parse_tiles(tiles):
+    """
+    Splits a tiles manifest value into its mode and parameter.
+
+    Parameters
+    ----------
+    tiles : str
+        grid:NXxNYxNZ, octree:TRIANGLES, or None/"" for no tiling
+
+    Returns
+    -------
+    tuple
+        (mode, parameter), the grid shape or the triangle budget of the octree leaves ((None, None) for no tiling)
+    """
+    if not tiles:
+        return None, None
+    mode, _, parameter = tiles.partition(":")
+    if mode not in TILE_MODES:
+        raise ValueError(f"invalid tiles {tiles}, must be one of {TILE_MODES}")
+    try:
+        if mode == "grid":
+            shape = tuple(int(n) for n in parameter.split("x")) if parameter else DEFAULT_GRID
+            if len(shape) == 3 and min(shape) >= 1:
+                return mode, shape
+        else:
+            budget = int(parameter) if parameter else DEFAULT_BUDGET
+            if budget >= 1:
+                return mode, budget
+    except ValueError:
+        pass
+    raise ValueError(f"invalid tiles {tiles}, expected grid:NXxNYxNZ or octree:TRIANGLES")
+
+def triangle_centers(positions, indices):
+    """ Returns the (m, 3) centers of the triangles """
+    return positions[indices].mean(axis=1)
+
+def spread_bits(values):
+    """ Spreads the low 10 bits of every value so there are 2 zero bits between each of them (for morton codes) """
+    values = values.astype(np.uint64) & 0x3ff
+    values = (values | (values << 16)) & 0x30000ff
+    values = (values | (values << 8)) & 0x300f00f
+    values = (values | (values << 4)) & 0x30c30c3
+    values = (values | (values << 2)) & 0x9249249
+    return values
+
+class TileGrid:
+    """ Assigns triangles to the tiles of a grid or octree built over the centers of a mesh's triangles.
+
+    The tiles are built once from the .stl, then the visual meshes (in Blender) and the collisions (in numpy)
+    are both split with cells, so a triangle ends up in the same tile on both sides.
+
+    Attributes
+    ----------
+    mode : str
+        grid or octree
+    low, high : numpy.ndarray
+        bounding box of the triangle centers the tiles were built over
+    shape : tuple
+        number of tiles along each axis (grid only)
+    leaf_starts : numpy.ndarray
+        first morton code of every octree leaf, in increasing order (octree only)
+    count : int
+        number of tiles (some of them can be empty)
+
+    Methods
+    -------
+    cells(centers):
+        Returns the tile index of every triangle center
+    """
+    def __init__(self, centers, mode, parameter):
+        """
+        Parameters
+        ----------
+        centers : numpy.ndarray
+            (m, 3) triangle centers (in the .stl's axes)
+        mode : str
+            grid or octree
+        parameter : tuple or int
+            the grid shape, or the triangle budget of the octree leaves
+        """
+        self.mode = mode
+        self.low = centers.min(axis=0)
+        self.high = centers.max(axis=0)
+        if mode == "grid":
+            self.shape = parameter
+            self.count = int(np.prod(parameter))
+            return
+
+        codes = np.sort(self.morton_codes(centers))
+        leaf_starts = []
+        # depth first, so the leaves are found in increasing code order
+        stack = [(0, 0)]
+        while stack:
+            start, depth = stack.pop()
+            size = 1 << (3 * (OCTREE_DEPTH - depth))
+            triangles = np.searchsorted(codes, start + size) - np.searchsorted(codes, start)
+            if triangles <= parameter or depth == OCTREE_DEPTH:
+                leaf_starts.append(start)
+                continue
+            stack += [(start + child * (size >> 3), depth + 1) for child in reversed(range(8))]
+        self.leaf_starts = np.array(leaf_starts, dtype=np.uint64)
+        self.count = len(leaf_starts)
+
+    def quantize(self, centers, divisions):
+        extent = np.where(self.high > self.low, self.high - self.low, 1)
+        cells = np.floor((centers - self.low) / extent * divisions).astype(np.int64)
+        return np.clip(cells, 0, np.asarray(divisions) - 1)
+
+    def morton_codes(self, centers):
+        cells = self.quantize(centers, 1 << OCTREE_DEPTH)
+        return (spread_bits(cells[:, 0]) << 2) | (spread_bits(cells[:, 1]) << 1) | spread_bits(cells[:, 2])
+
+    def cells(self, centers):
+        """ Returns the tile index of every (m, 3) triangle center """
+        if self.mode == "grid":
+            cells = self.quantize(centers, self.shape)
+            return np.ravel_multi_index(cells.T, self.shape)
+        return np.searchsorted(self.leaf_starts, self.morton_codes(centers), side='right').astype(np.int64) - 1
+
+def extract(positions, indices, mask):
+    """ Returns the positions and indices of the masked triangles, without the vertices they don't use """
+    used, tile_indices = np.unique(indices[mask], return_inverse=True)
+    return positions[used], tile_indices.reshape(-1, 3).astype(np.uint32)
+
+def tile_bounds(parts):
+    """ Returns the bounding box ([low, high], in Godot's Y-up axes) of the positions of (positions, indices) parts """
+    positions = stl_io.to_y_up(np.concatenate([positions for positions, _ in parts])).astype(np.float64)
+    return [np.round(positions.min(axis=0), COORDINATE_DECIMALS).tolist(), np.round(positions.max(axis=0), COORDINATE_DECIMALS).tolist()]
+
+def split_solids(solids, grid):
+    """
+    Splits the triangles of solids into the tiles of grid.
+
+    Parameters
+    ----------
+    solids : list
+        stl_io.Solids (in the .stl's axes)
+    grid : TileGrid
+        the tiles
+
+    Returns
+    -------
+    dict
+        tile index -> list of the (positions, indices) parts of every solid in the tile (only non empty tiles, in index order)
+    """
+    tiles = dict()
+    for solid in solids:
+        cells = grid.cells(triangle_centers(solid.positions, solid.indices))
+        for tile in np.unique(cells):
+            tiles.setdefault(int(tile), []).append(extract(solid.positions, solid.indices, cells == tile))
+    return dict(sorted(tiles.items()))
+
+def tile_name(tile):
+    return f"Tile{tile}"
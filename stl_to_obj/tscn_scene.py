@@ -0,0 +1,164 @@
+# in-memory model of a Godot 3 .tscn scene (ext resources, sub resources, and nodes) that is written out in one pass
+
+class ExtResource:
+    """ A file (.jpg, .obj, .glb, ...) referenced by the scene.
+
+    Attributes
+    ----------
+    path : str
+        res:// path of the file
+    type : str
+        Godot type of the resource (ex: Texture, ArrayMesh, PackedScene)
+    id : int
+        id of the resource in the scene
+    """
+    __slots__ = ("path", "type", "id")
+
+    def __init__(self, path, type, id):
+        self.path = path
+        self.type = type
+        self.id = id
+
+    def reference(self):
+        return f"ExtResource( {self.id} )"
+
+    def header(self):
+        return f'[ext_resource path="{self.path}" type="{self.type}" id={self.id}]\n'
+
+class SubResource:
+    """ A resource built inside the scene (ex: SpatialMaterial, BoxShape).
+
+    Attributes
+    ----------
+    type : str
+        Godot type of the resource
+    id : int
+        id of the resource in the scene
+    properties : list
+        (key, value) pairs, values are strings or ExtResources
+    """
+    __slots__ = ("type", "id", "properties")
+
+    def __init__(self, type, id, properties=None):
+        self.type = type
+        self.id = id
+        self.properties = properties if properties is not None else []
+
+    def reference(self):
+        return f"SubResource( {self.id} )"
+
+    def header(self):
+        return f'[sub_resource type="{self.type}" id={self.id}]\n'
+
+class Node:
+    """ A node of the scene tree.
+
+    Attributes
+    ----------
+    name : str
+        name of the node
+    type : str
+        Godot class of the node (None for instanced scenes)
+    parent : str
+        path of the parent node (None for the root node)
+    instance : ExtResource
+        the PackedScene this node instances (None for regular nodes)
+    properties : list
+        (key, value) pairs, values are strings, ExtResources, or SubResources
+    """
+    __slots__ = ("name", "type", "parent", "instance", "properties")
+
+    def __init__(self, name, type=None, parent=None, instance=None, properties=None):
+        self.name = name
+        self.type = type
+        self.parent = parent
+        self.instance = instance
+        self.properties = properties if properties is not None else []
+
+    def header(self):
+        header = f'[node name="{self.name}"'
+        if self.type is not None:
+            header += f' type="{self.type}"'
+        if self.parent is not None:
+            header += f' parent="{self.parent}"'
+        if self.instance is not None:
+            header += f' instance={self.instance.reference()}'
+        return header + ']\n'
+
+def format_value(value):
+    """ Returns how a property value is written in the .tscn """
+    if isinstance(value, (ExtResource, SubResource)):
+        return value.reference()
+    return str(value)
+
+def format_properties(properties):
+    return ''.join(f"{key} = {format_value(value)}\n" for key, value in properties)
+
+def parse_properties(text):
+    """ Splits "key = value" lines (ex: the strings of the textures module) into (key, value) pairs """
+    return [tuple(line.split(" = ", 1)) for line in text.splitlines() if line.strip()]
+
+class Scene:
+    """ The resources and nodes of a .tscn file.
+
+    Ids are assigned in the order resources are added, so the file only depends on the order of the calls.
+
+    Attributes
+    ----------
+    ext_resources : list
+        ExtResources, in id order
+    sub_resources : list
+        SubResources, in id order
+    nodes : list
+        Nodes, in tree order (parents before their children)
+
+    Methods
+    -------
+    add_ext_resource(path, type):
+        Adds and returns an ExtResource
+    add_sub_resource(type, properties):
+        Adds and returns a SubResource
+    add_node(name, type, parent, instance, properties):
+        Adds and returns a Node
+    load_steps():
+        Returns the number of resources Godot loads for the scene (plus the scene itself)
+    write(file):
+        Writes the scene to an open text file
+    """
+    def __init__(self):
+        self.ext_resources = []
+        self.sub_resources = []
+        self.nodes = []
+
+    def add_ext_resource(self, path, type):
+        resource = ExtResource(path, type, len(self.ext_resources) + 1)
+        self.ext_resources.append(resource)
+        return resource
+
+    def add_sub_resource(self, type, properties=None):
+        resource = SubResource(type, len(self.sub_resources) + 1, properties)
+        self.sub_resources.append(resource)
+        return resource
+
+    def add_node(self, name, type=None, parent=None, instance=None, properties=None):
+        node = Node(name, type, parent, instance, properties)
+        self.nodes.append(node)
+        return node
+
+    def load_steps(self):
+        return len(self.ext_resources) + len(self.sub_resources) + 1
+
+    def write(self, file):
+        """ Writes the scene to an open text file, one resource/node at a time """
+        file.write(f"[gd_scene load_steps={self.load_steps()} format=2]\n\n")
+        for resource in self.ext_resources:
+            file.write(resource.header())
+        file.write("\n")
+        for resource in self.sub_resources:
+            file.write(resource.header())
+            file.write(format_properties(resource.properties))
+            file.write("\n")
+        for node in self.nodes:
+            file.write(node.header())
+            file.write(format_properties(node.properties))
+            file.write("\n")
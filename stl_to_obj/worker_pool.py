@@ -0,0 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+
+def error_message(e):
+    """ Returns how a failed task is reported (ex: "ValueError: ...") """
+    return f"{type(e).__name__}: {e}"
+
+def run_alone(function, args, mp_context):
+    """ Runs a task in a process of its own, so a crash breaks nothing else """
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+        return executor.submit(function, *args).result()
+
+def run_pool(function, arguments, jobs, failed, mp_context=None):
+    """
+    Runs function(*args) for every args of arguments across a process pool, and returns their results in order.
+
+    A worker that dies (ex: Blender segfault) breaks the whole pool, and every task that hadn't finished fails
+    with BrokenProcessPool, not only its own. Those tasks are run again, each in a process of its own,
+    so only the task that killed its worker fails.
+
+    Parameters
+    ----------
+    function : callable
+        the task (must be picklable, a module level function)
+    arguments : list
+        the arguments of every task
+    jobs : int
+        number of worker processes (default is the number of cpus)
+    failed : callable
+        gets the error message of a task that raised or whose worker died, and returns its result
+    mp_context : multiprocessing.context.BaseContext
+        how the workers are started (default is the platform's default)
+
+    Returns
+    -------
+    list
+        the result of every task, in the same order as arguments
+    """
+    results = [None] * len(arguments)
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context) as executor:
+        futures = [executor.submit(function, *args) for args in arguments]
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                unfinished.append(i)
+            except Exception as e:
+                results[i] = failed(error_message(e))
+
+    # the threads only wait on their task's process
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        futures = [executor.submit(run_alone, function, arguments[i], mp_context) for i in unfinished]
+        for i, future in zip(unfinished, futures):
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = failed(error_message(e))
+    return results
@@ -0,0 +1,247 @@
+# dense 3d grid of an mcnp mesh tally, for looking up the result at any point
+# 1. place every centroid row (from mcnp_to_csv's .csv or .npz) into its voxel of a memory mapped grid
+# 2. look up points by binary searching the x, y, z boundaries
+import argparse
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+# rows of the .csv (or .npz) read at once while building the grid
+CSV_CHUNK_ROWS = 1 << 20
+
+# points looked up at once, bounds the temporary arrays of query
+QUERY_BATCH = 1 << 20
+
+def grid_paths(grid_file):
+    """ Returns the (.npy grid, .npz boundaries) filenames of a grid """
+    grid_file = Path(grid_file)
+    return grid_file.with_suffix('.npy'), grid_file.with_name(f"{grid_file.stem}_bounds.npz")
+
+def voxel_indices(boundaries, coordinates):
+    """
+    Returns the index of the voxel containing each coordinate along one axis (-1 if it is outside the mesh).
+
+    Parameters
+    ----------
+    boundaries : numpy.ndarray
+        sorted boundaries of the axis
+    coordinates : numpy.ndarray
+        coordinates along the axis
+    """
+    indices = np.searchsorted(boundaries, coordinates, side='right') - 1
+    # the upper boundary belongs to the last voxel
+    indices[coordinates == boundaries[-1]] = len(boundaries) - 2
+    indices[(indices < 0) | (indices >= len(boundaries) - 1)] = -1
+    return indices
+
+def read_csv_rows(csv_file):
+    """
+    Reads the .csv written by mcnp_to_csv.
+
+    Returns
+    -------
+    tuple
+        the x, y, z boundaries, and a generator of (n, 5) arrays of x, y, z, result, relative error rows
+        (MCNP6's extra Volume and Rslt*Vol columns are dropped)
+    """
+    f = open(csv_file, 'r')
+    boundaries = [np.array(f.readline().strip().split(','), dtype=np.float64) for _ in range(3)]
+
+    def rows():
+        columns = None
+        with f:
+            while True:
+                lines = [line.strip() for line in f.readlines(CSV_CHUNK_ROWS * 64) if line.strip()]
+                if not lines:
+                    return
+                if columns is None:
+                    columns = lines[0].count(',') + 1
+                values = np.fromstring(','.join(lines), sep=',')
+                if values.size != len(lines) * columns:
+                    raise ValueError(f"{csv_file} has rows that don't have {columns} columns")
+                yield values.reshape(-1, columns)[:, :5]
+    return boundaries, rows()
+
+def read_npy_member(npz, name):
+    """ Opens an array of an .npz without reading it, returns the open file (after the .npy header) and the array's dtype and shape """
+    f = npz.open(f"{name}.npy")
+    if np.lib.format.read_magic(f) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if fortran_order:
+        raise ValueError(f"{name} of the .npz is in fortran order")
+    return f, dtype, shape
+
+def read_npz_rows(npz_file):
+    """ Same as read_csv_rows, but for the .npz written by mcnp_to_csv --binary (read CSV_CHUNK_ROWS rows at a time) """
+    with np.load(npz_file) as data:
+        boundaries = [data["x"], data["y"], data["z"]]
+
+    def rows():
+        with zipfile.ZipFile(npz_file) as npz:
+            members = [read_npy_member(npz, name) for name in ["centroids", "result", "rel_error"]]
+            try:
+                count = members[1][2][0]
+                for start in range(0, count, CSV_CHUNK_ROWS):
+                    n = min(CSV_CHUNK_ROWS, count - start)
+                    columns = []
+                    for f, dtype, shape in members:
+                        width = int(np.prod(shape[1:]))
+                        columns.append(np.frombuffer(f.read(n * width * dtype.itemsize), dtype=dtype).reshape(n, width))
+                    yield np.column_stack(columns)
+            finally:
+                for f, _, _ in members:
+                    f.close()
+    return boundaries, rows()
+
+def build_grid(tally_file, grid_file):
+    """
+    Builds the dense grid of a tally converted by mcnp_to_csv.
+
+    Parameters
+    ----------
+    tally_file : str
+        the .csv or .npz written by mcnp_to_csv
+    grid_file : str
+        where to store the grid (a .npy with the grid and a _bounds.npz with the boundaries are written)
+
+    Returns
+    -------
+    TallyGrid
+        the memory mapped grid
+    """
+    if Path(tally_file).suffix == ".npz":
+        boundaries, rows = read_npz_rows(tally_file)
+    else:
+        boundaries, rows = read_csv_rows(tally_file)
+
+    npy_path, bounds_path = grid_paths(grid_file)
+    np.savez(bounds_path, x=boundaries[0], y=boundaries[1], z=boundaries[2])
+    shape = (2,) + tuple(len(b) - 1 for b in boundaries)
+    grid = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float32, shape=shape)
+    # voxels without a row stay NaN
+    grid[:] = np.nan
+
+    for chunk in rows:
+        ijk = [voxel_indices(b, chunk[:, axis]) for axis, b in enumerate(boundaries)]
+        inside = (ijk[0] >= 0) & (ijk[1] >= 0) & (ijk[2] >= 0)
+        i, j, k = (index[inside] for index in ijk)
+        grid[0, i, j, k] = chunk[inside, 3]
+        grid[1, i, j, k] = chunk[inside, 4]
+    grid.flush()
+    del grid
+    return TallyGrid(grid_file)
+
+class TallyGrid:
+    """ Memory mapped dense grid of the results and relative errors of an mcnp mesh tally.
+
+    Attributes
+    ----------
+    boundaries : list
+        sorted x, y, z voxel boundaries
+    centers : list
+        x, y, z voxel centers
+    grid : numpy.memmap
+        (2, nx, ny, nz) float32 array, grid[0] is the result and grid[1] the relative error (NaN where the tally has no row)
+
+    Methods
+    -------
+    query(points, method="nearest"):
+        Returns the result and relative error at each point
+    """
+    def __init__(self, grid_file):
+        """
+        Parameters
+        ----------
+        grid_file : str
+            the grid_file passed to build_grid
+        """
+        npy_path, bounds_path = grid_paths(grid_file)
+        with np.load(bounds_path) as bounds:
+            self.boundaries = [bounds["x"], bounds["y"], bounds["z"]]
+        self.centers = [(b[:-1] + b[1:]) / 2 for b in self.boundaries]
+        self.grid = np.load(npy_path, mmap_mode='r')
+
+    def query(self, points, method="nearest"):
+        """
+        Returns the result and relative error at each point (NaN outside the mesh).
+
+        Parameters
+        ----------
+        points : numpy.ndarray
+            (n, 3) x, y, z positions, in the units of the tally
+        method : str
+            nearest (the voxel containing the point) or trilinear (interpolated between voxel centers)
+
+        Returns
+        -------
+        tuple
+            (n,) results and (n,) relative errors
+        """
+        if method not in ["nearest", "trilinear"]:
+            raise ValueError(f"invalid method {method}, must be nearest or trilinear")
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        result = np.empty(len(points), dtype=np.float64)
+        rel_error = np.empty(len(points), dtype=np.float64)
+        lookup = self._nearest if method == "nearest" else self._trilinear
+        for start in range(0, len(points), QUERY_BATCH):
+            batch = slice(start, start + QUERY_BATCH)
+            result[batch], rel_error[batch] = lookup(points[batch])
+        return result, rel_error
+
+    def _nearest(self, points):
+        ijk = [voxel_indices(b, points[:, axis]) for axis, b in enumerate(self.boundaries)]
+        inside = (ijk[0] >= 0) & (ijk[1] >= 0) & (ijk[2] >= 0)
+        result = np.full(len(points), np.nan)
+        rel_error = np.full(len(points), np.nan)
+        i, j, k = (index[inside] for index in ijk)
+        result[inside] = self.grid[0, i, j, k]
+        rel_error[inside] = self.grid[1, i, j, k]
+        return result, rel_error
+
+    def _trilinear(self, points):
+        inside = np.ones(len(points), dtype=bool)
+        lower = []
+        weights = []
+        for axis, (b, c) in enumerate(zip(self.boundaries, self.centers)):
+            p = points[:, axis]
+            inside &= (p >= b[0]) & (p <= b[-1])
+            # interpolate between the two nearest centers, clamping to the first/last center near the edges
+            i = np.clip(np.searchsorted(c, p, side='right') - 1, 0, max(len(c) - 2, 0))
+            upper = np.minimum(i + 1, len(c) - 1)
+            span = np.where(upper > i, c[upper] - c[i], 1.0)
+            lower.append(i)
+            weights.append(np.clip((p - c[i]) / span, 0.0, 1.0) * (upper > i))
+
+        result = np.zeros(len(points))
+        variance = np.zeros(len(points))
+        for corner in range(8):
+            ijk = []
+            w = np.ones(len(points))
+            for axis in range(3):
+                step = (corner >> axis) & 1
+                ijk.append(np.minimum(lower[axis] + step, len(self.centers[axis]) - 1))
+                w *= weights[axis] if step else 1 - weights[axis]
+            value = self.grid[0, ijk[0], ijk[1], ijk[2]].astype(np.float64)
+            error = self.grid[1, ijk[0], ijk[1], ijk[2]].astype(np.float64)
+            result += w * value
+            # absolute errors of the voxels are independent, so their weighted variances add up
+            variance += (w * value * error) ** 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_error = np.where(result != 0, np.sqrt(variance) / np.abs(result), 0.0)
+        result[~inside] = np.nan
+        rel_error[~inside] = np.nan
+        return result, rel_error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = "MCNP mesh tally to dense voxel grid converter")
+    parser.add_argument("tallyFile", type = str, help = ".csv or .npz written by mcnp_to_csv")
+    parser.add_argument("gridFile", type = str, help = "output grid filename (.npy)")
+
+    args = parser.parse_args()
+
+    build_grid(args.tallyFile, args.gridFile)
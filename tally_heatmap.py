@@ -0,0 +1,373 @@
+# voxel heatmap of an mcnp mesh tally, as a Godot scene
+# 1. sort the result of every voxel into bins (between thresholds) and drop the voxels below the first threshold
+# 2. greedy mesh the voxels: merge neighbouring voxels of the same bin into rectangles (mesh) or boxes (multimesh)
+# 3. write the .obj and the .tscn (one material per bin) the same way stl_to_tscn does
+# example run
+# python3 tally_heatmap.py tally.csv Heatmap --bins 8 --scale 0.01
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "stl_to_obj"))
+
+import tscn_scene
+import stl_io
+from tally_grid import TallyGrid, build_grid
+from tally_pyramid import TallyPyramid
+
+# colors of the lowest to the highest bin, the colors of the bins in between are interpolated
+DEFAULT_RAMP = ["#0000ff", "#00ffff", "#00ff00", "#ffff00", "#ff0000"]
+DEFAULT_BINS = 8
+
+# decimals of the vertex positions written in the .obj
+OBJ_DECIMALS = 6
+
+# unit cube (0 to 1 on every axis) drawn at every box of the multimesh, as (normal, 4 corners counterclockwise seen from outside)
+CUBE_FACES = [
+    ((-1, 0, 0), [(0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)]),
+    ((1, 0, 0), [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)]),
+    ((0, -1, 0), [(0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)]),
+    ((0, 1, 0), [(0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)]),
+    ((0, 0, -1), [(0, 0, 0), (0, 1, 0), (1, 1, 0), (1, 0, 0)]),
+    ((0, 0, 1), [(0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)])
+]
+
+def load_grid(tally_file, output_folder, level=0):
+    """
+    Returns the TallyGrid of a grid (.npy built by tally_grid) or of a tally (.csv/.npz written by mcnp_to_csv, built into output_folder),
+    or the PyramidGrid of a level of a pyramid (.tpyr built by tally_pyramid)
+    """
+    if Path(tally_file).suffix == ".tpyr":
+        return TallyPyramid(tally_file).region(level)
+    if Path(tally_file).suffix == ".npy":
+        return TallyGrid(tally_file)
+    return build_grid(tally_file, Path(output_folder) / f"{Path(tally_file).stem}_grid.npy")
+
+def log_thresholds(results, bins, minimum=None):
+    """ Returns bins thresholds spaced logarithmically from minimum (default: the smallest positive result) to the largest result """
+    positive = results[np.isfinite(results) & (results > 0)]
+    if len(positive) == 0:
+        raise ValueError("the tally has no positive results")
+    low = minimum if minimum is not None else positive.min()
+    high = positive.max()
+    if low >= high:
+        return np.array([low])
+    return np.geomspace(low, high, bins + 1)[:-1]
+
+def bin_voxels(results, rel_errors, thresholds, max_error=None):
+    """
+    Returns the bin of every voxel: the index of the highest threshold its result reaches
+    (-1 for voxels below the first threshold, without a result, or with a relative error above max_error)
+
+    Parameters
+    ----------
+    results, rel_errors : numpy.ndarray
+        (nx, ny, nz) results and relative errors of the voxels
+    thresholds : numpy.ndarray
+        increasing lower bounds of the bins
+    max_error : float
+        largest relative error of the voxels that are drawn (None draws every voxel)
+    """
+    labels = np.searchsorted(thresholds, np.nan_to_num(results, nan=-np.inf), side='right').astype(np.int32) - 1
+    if max_error is not None:
+        labels[~(rel_errors <= max_error)] = -1
+    return labels
+
+def ramp_colors(ramp, count):
+    """ Returns count (r, g, b) colors evenly spread along a ramp of "#rrggbb" colors """
+    stops = np.array([[int(color.lstrip("#")[i:i + 2], 16) / 255 for i in (0, 2, 4)] for color in ramp])
+    if count == 1:
+        return [tuple(stops[-1])]
+    positions = np.linspace(0, 1, count)
+    stop_positions = np.linspace(0, 1, len(stops))
+    return [tuple(np.interp(p, stop_positions, stops[:, channel]) for channel in range(3)) for p in positions]
+
+def merge_consecutive(keys, positions):
+    """
+    Groups rows that have the same keys and consecutive positions.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray
+        (n, k) integer keys
+    positions : numpy.ndarray
+        (n,) integer positions
+
+    Returns
+    -------
+    tuple
+        (row of the first member of every group, number of members of every group)
+    """
+    order = np.lexsort((positions,) + tuple(keys.T[::-1]))
+    keys = keys[order]
+    positions = positions[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = np.any(keys[1:] != keys[:-1], axis=1) | (positions[1:] != positions[:-1] + 1)
+    first = np.flatnonzero(starts)
+    return order[first], np.diff(np.append(first, len(order)))
+
+def runs(labels):
+    """
+    Returns the runs of equal labels along the last axis of a 3d array (except the runs of -1)
+
+    Returns
+    -------
+    tuple
+        (n, 3) index of the first voxel of every run, (n,) run lengths, (n,) labels
+    """
+    change = np.ones(labels.shape, dtype=bool)
+    change[..., 1:] = labels[..., 1:] != labels[..., :-1]
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, labels.size))
+    values = labels.reshape(-1)[starts]
+    drawn = values >= 0
+    return np.column_stack(np.unravel_index(starts[drawn], labels.shape)), lengths[drawn], values[drawn]
+
+def greedy_rectangles(labels):
+    """
+    Merges the cells of every slice (first axis) of a 3d array into rectangles of equal labels.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n, 6) slice, u0, u1, v0, v1, label of every rectangle (u and v are the second and third axes, [u0, u1) and [v0, v1))
+    """
+    first, lengths, values = runs(labels)
+    v1 = first[:, 2] + lengths
+    # runs spanning the same [v0, v1) in neighbouring rows become one rectangle
+    rows, counts = merge_consecutive(np.column_stack([first[:, 0], first[:, 2], v1, values]), first[:, 1])
+    return np.column_stack([first[rows, 0], first[rows, 1], first[rows, 1] + counts, first[rows, 2], v1[rows], values[rows]])
+
+def greedy_boxes(labels):
+    """
+    Merges the voxels of a 3d array into boxes of equal labels.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n, 7) x0, x1, y0, y1, z0, z1, label of every box ([x0, x1), in voxel indices)
+    """
+    rectangles = greedy_rectangles(labels)
+    # rectangles covering the same area in neighbouring slices become one box
+    rows, counts = merge_consecutive(rectangles[:, 1:], rectangles[:, 0])
+    boxes = rectangles[rows]
+    return np.column_stack([boxes[:, 0], boxes[:, 0] + counts, boxes[:, 1:]])
+
+def greedy_faces(labels):
+    """
+    Returns the faces of the voxels that don't touch a voxel of the same bin, merged into rectangles.
+
+    Returns
+    -------
+    list
+        (axis, direction, rectangles) for the 6 sides (direction -1 or 1 along axis),
+        rectangles are (n, 6) arrays of the plane (voxel boundary index along axis), u0, u1, v0, v1, label,
+        where u and v are the other two axes in increasing order
+    """
+    sides = []
+    for axis in range(3):
+        moved = np.moveaxis(labels, axis, 0)
+        for direction in [-1, 1]:
+            neighbours = np.full(moved.shape, -1, dtype=moved.dtype)
+            if direction == 1:
+                neighbours[:-1] = moved[1:]
+            else:
+                neighbours[1:] = moved[:-1]
+            faces = np.where(moved != neighbours, moved, -1)
+            rectangles = greedy_rectangles(faces)
+            # the face of a voxel on its positive side lies on its upper boundary
+            rectangles[:, 0] += direction == 1
+            sides.append((axis, direction, rectangles))
+    return sides
+
+def rectangle_quads(boundaries, axis, direction, rectangles):
+    """ Returns the (n, 4, 3) corners (counterclockwise seen from outside, in the tally's Z-up axes) of face rectangles """
+    u_axis, v_axis = [a for a in range(3) if a != axis]
+    corners = np.empty((len(rectangles), 4, 3))
+    corners[:, :, axis] = boundaries[axis][rectangles[:, 0], None]
+    u = [boundaries[u_axis][rectangles[:, 1]], boundaries[u_axis][rectangles[:, 2]]]
+    v = [boundaries[v_axis][rectangles[:, 3]], boundaries[v_axis][rectangles[:, 4]]]
+    # going from u to v turns counterclockwise around +x and +z, but around -y (z x x = y)
+    order = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    if (direction == 1) == (axis == 1):
+        order = order[::-1]
+    for corner, (i, j) in enumerate(order):
+        corners[:, corner, u_axis] = u[i]
+        corners[:, corner, v_axis] = v[j]
+    return corners
+
+def write_heatmap_obj(filepath, boundaries, sides, bins):
+    """
+    Writes the face rectangles as an .obj with one surface (usemtl) per bin, in Godot's Y-up axes.
+
+    Returns
+    -------
+    list
+        the bins that have faces, in surface order (Godot starts a surface at every usemtl, so empty bins are left out)
+    """
+    with open(filepath, 'w') as f:
+        f.write(f"o {Path(filepath).stem}\n")
+        for axis, direction, _ in sides:
+            f.write("vn {:g} {:g} {:g}\n".format(*(stl_io.to_y_up(np.eye(3)[None, axis] * direction)[0] + 0.0)))
+        surfaces = []
+        vertex_count = 0
+        for label in range(bins):
+            quads = [(side, rectangle_quads(boundaries, axis, direction, rectangles[rectangles[:, 5] == label]))
+                     for side, (axis, direction, rectangles) in enumerate(sides)]
+            if not any(len(side_quads) for _, side_quads in quads):
+                continue
+            surfaces.append(label)
+            f.write(f"usemtl bin{label}\n")
+            for side, side_quads in quads:
+                positions = np.round(stl_io.to_y_up(side_quads.reshape(-1, 3)), OBJ_DECIMALS) + 0.0
+                f.write(''.join(f"v {x:g} {y:g} {z:g}\n" for x, y, z in positions))
+                # two triangles per quad, vertex indices start at 1
+                n = side + 1
+                f.write(''.join(f"f {a}//{n} {a + 1}//{n} {a + 2}//{n}\nf {a}//{n} {a + 2}//{n} {a + 3}//{n}\n"
+                                for a in vertex_count + 1 + 4 * np.arange(len(side_quads))))
+                vertex_count += 4 * len(side_quads)
+    return surfaces
+
+def write_cube_obj(filepath):
+    """ Writes the unit cube drawn at every box of the multimesh """
+    with open(filepath, 'w') as f:
+        f.write(f"o {Path(filepath).stem}\n")
+        for normal, corners in CUBE_FACES:
+            f.write(''.join(f"v {x} {y} {z}\n" for x, y, z in corners))
+        for normal, _ in CUBE_FACES:
+            f.write("vn {} {} {}\n".format(*normal))
+        for face in range(len(CUBE_FACES)):
+            a = 4 * face + 1
+            n = face + 1
+            f.write(f"f {a}//{n} {a + 1}//{n} {a + 2}//{n}\nf {a}//{n} {a + 2}//{n} {a + 3}//{n}\n")
+
+def box_transforms(boundaries, boxes):
+    """ Returns the 12 values (basis rows, then origin, in Godot's Y-up axes) of the transform of the unit cube onto every box """
+    low = np.column_stack([boundaries[axis][boxes[:, 2 * axis]] for axis in range(3)])
+    high = np.column_stack([boundaries[axis][boxes[:, 2 * axis + 1]] for axis in range(3)])
+    size = high - low
+    transforms = np.zeros((len(boxes), 12))
+    # Y-up x, y, z are the tally's x, z, -y, so the cube spans [-y1, -y0] along Y-up z
+    transforms[:, 0] = size[:, 0]
+    transforms[:, 4] = size[:, 2]
+    transforms[:, 8] = size[:, 1]
+    transforms[:, 9:] = np.column_stack([low[:, 0], low[:, 2], -high[:, 1]])
+    return np.round(transforms, OBJ_DECIMALS) + 0.0
+
+def bin_material(color, alpha, vertex_color=False):
+    """ Returns the properties of the unshaded SpatialMaterial of a bin """
+    properties = [("flags_unshaded", "true")]
+    if alpha < 1:
+        properties.append(("flags_transparent", "true"))
+    if vertex_color:
+        properties.append(("vertex_color_use_as_albedo", "true"))
+    else:
+        properties.append(("albedo_color", "Color( {:g}, {:g}, {:g}, {:g} )".format(*np.round(color, 6), alpha)))
+    return properties
+
+def tally_heatmap(tally_file, output_folder, thresholds=None, bins=DEFAULT_BINS, minimum=None, max_error=None,
+                  ramp=DEFAULT_RAMP, alpha=1.0, mode="mesh", scale=1, level=0):
+    """
+    Writes a heatmap scene of a tally: {output_folder}/{output_folder}.tscn and the .obj it uses.
+
+    Parameters
+    ----------
+    tally_file : str
+        the .csv or .npz written by mcnp_to_csv, a grid (.npy) built by tally_grid, or a pyramid (.tpyr) built by tally_pyramid
+    output_folder : str
+        where the .tscn and .obj are placed (also the name of the scene, like stl_to_tscn's output folder)
+    thresholds : list
+        increasing lower bounds of the bins (None spaces bins thresholds logarithmically, see log_thresholds)
+    bins : int
+        number of bins when thresholds is None
+    minimum : float
+        lowest threshold when thresholds is None
+    max_error : float
+        voxels with a larger relative error aren't drawn (None draws every voxel)
+    ramp : list
+        "#rrggbb" colors from the lowest to the highest bin
+    alpha : float
+        opacity of the voxels
+    mode : str
+        mesh (one mesh with a surface per bin) or multimesh (one MultiMeshInstance of boxes with per instance colors)
+    scale : float
+        the scale of the tally's units (ex: if the tally is in centimeters, scale = 0.01)
+    level : int
+        level of the pyramid drawn (0 is the full resolution, i is 2^i times coarser), only used for pyramids
+
+    Returns
+    -------
+    dict
+        "voxels" drawn, "bins", "thresholds", and the "triangles" of the heatmap and of one cube per voxel ("cube_triangles")
+    """
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    grid = load_grid(tally_file, output_folder, level)
+    results = np.asarray(grid.grid[0])
+    if thresholds is None:
+        thresholds = log_thresholds(results, bins, minimum)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    labels = bin_voxels(results, np.asarray(grid.grid[1]), thresholds, max_error)
+    colors = ramp_colors(ramp, len(thresholds))
+
+    scene = tscn_scene.Scene()
+    root = scene.add_node(output_folder, "Spatial")
+    if scale != 1:
+        root.properties.append(("transform", f"Transform( {scale}, 0, 0, 0, {scale}, 0, 0, 0, {scale}, 0, 0, 0 )"))
+    legend = f'{{\n"thresholds": [ {", ".join(f"{t:g}" for t in thresholds)} ]\n}}'
+
+    if mode == "mesh":
+        sides = greedy_faces(labels)
+        obj_file = f"{output_folder}.obj"
+        surfaces = write_heatmap_obj(Path(output_folder) / obj_file, grid.boundaries, sides, len(thresholds))
+        triangles = 2 * sum(len(rectangles) for _, _, rectangles in sides)
+        mesh = scene.add_ext_resource(f"res://models/{output_folder}/{obj_file}", "ArrayMesh")
+        properties = [("mesh", mesh)]
+        for surface, label in enumerate(surfaces):
+            material = scene.add_sub_resource("SpatialMaterial", bin_material(colors[label], alpha))
+            properties.append((f"material/{surface}", material))
+        scene.add_node("Heatmap", "MeshInstance", ".", properties=properties + [("__meta__", legend)])
+    elif mode == "multimesh":
+        boxes = greedy_boxes(labels)
+        obj_file = "voxel.obj"
+        write_cube_obj(Path(output_folder) / obj_file)
+        triangles = 12 * len(boxes)
+        mesh = scene.add_ext_resource(f"res://models/{output_folder}/{obj_file}", "ArrayMesh")
+        transforms = ", ".join(f"{value:g}" for value in box_transforms(grid.boundaries, boxes).reshape(-1))
+        box_colors = ", ".join(f"{value:g}" for label in boxes[:, 6] for value in np.round(colors[label], 6).tolist() + [alpha])
+        # transform_format 1 is MultiMesh.TRANSFORM_3D, color_format 2 is MultiMesh.COLOR_FLOAT
+        multimesh = scene.add_sub_resource("MultiMesh", [("color_format", 2), ("transform_format", 1), ("instance_count", len(boxes)),
+                                                         ("mesh", mesh), ("color_array", f"PoolColorArray( {box_colors} )"),
+                                                         ("transform_array", f"PoolVector3Array( {transforms} )")])
+        material = scene.add_sub_resource("SpatialMaterial", bin_material(None, alpha, vertex_color=True))
+        scene.add_node("Heatmap", "MultiMeshInstance", ".", properties=[("multimesh", multimesh), ("material_override", material), ("__meta__", legend)])
+    else:
+        raise ValueError(f"invalid mode {mode}, must be mesh or multimesh")
+
+    with open(Path(output_folder) / f"{output_folder}.tscn", 'w') as tscn_file:
+        scene.write(tscn_file)
+    voxels = int((labels >= 0).sum())
+    return {"voxels": voxels, "bins": len(thresholds), "thresholds": thresholds.tolist(), "triangles": triangles, "cube_triangles": 12 * voxels}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = "MCNP mesh tally to voxel heatmap .tscn converter")
+    parser.add_argument("tallyFile", type = str, help = ".csv or .npz written by mcnp_to_csv, a grid .npy built by tally_grid, or a pyramid .tpyr built by tally_pyramid")
+    parser.add_argument("outputFolder", type = str, help = "output folder (and name of the .tscn)")
+    parser.add_argument("--thresholds", type = float, nargs = "+", default = None, help = "increasing lower bounds of the bins (default: logarithmic bins)")
+    parser.add_argument("--bins", type = int, default = DEFAULT_BINS, help = "number of logarithmic bins when --thresholds isn't given")
+    parser.add_argument("--min", type = float, default = None, help = "lowest logarithmic threshold (default: the smallest positive result)")
+    parser.add_argument("--max-error", type = float, default = None, help = "don't draw voxels whose relative error is larger than this")
+    parser.add_argument("--ramp", type = str, nargs = "+", default = DEFAULT_RAMP, help = "#rrggbb colors from the lowest to the highest bin")
+    parser.add_argument("--alpha", type = float, default = 1.0, help = "opacity of the voxels")
+    parser.add_argument("--mode", type = str, default = "mesh", choices = ["mesh", "multimesh"], help = "one mesh with a surface per bin, or a MultiMeshInstance of boxes")
+    parser.add_argument("--scale", type = float, default = 1, help = "scale of the tally's units (ex: 0.01 for centimeters)")
+    parser.add_argument("--level", type = int, default = 0, help = "level of a .tpyr pyramid to draw (0 is the full resolution, 3 is 8x coarser)")
+
+    args = parser.parse_args()
+
+    stats = tally_heatmap(args.tallyFile, args.outputFolder, args.thresholds, args.bins, args.min, args.max_error,
+                          args.ramp, args.alpha, args.mode, args.scale, args.level)
+    print(f"heatmap: {stats['voxels']} voxels in {stats['bins']} bins -> {stats['triangles']} triangles "
+          f"({stats['cube_triangles']} as separate cubes)")
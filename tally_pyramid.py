@@ -0,0 +1,425 @@
+# multiresolution pyramid of an mcnp mesh tally (full resolution, then 2x, 4x, 8x, ... coarser), stored sparsely in one binary file
+# 1. sum the volume weighted results and squared absolute errors of every 2x2x2 block of a level into a voxel of the next level
+# 2. drop the voxels whose result is below a threshold, and store the rest of every level as 8x8x8 bricks
+#    (a bitmask of the stored voxels, then their results and relative errors)
+# 3. read only the bricks of the level and region that are asked for, through a memory map
+# example run
+# python3 tally_pyramid.py tally.csv tally.tpyr --levels 3 --threshold 1e-8
+import argparse
+import json
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from tally_grid import TallyGrid, build_grid, voxel_indices
+
+# first and last bytes of a pyramid file, the footer (json with the offset of every array) is right before the last ones
+MAGIC = b"TALLYPYR"
+VERSION = 1
+
+# side of the bricks (in voxels), a brick is stored if any of its voxels is
+BRICK = 8
+
+# result and relative error of a stored voxel (relative errors don't need more than float16's 3 digits)
+VALUE_DTYPE = np.dtype([("result", "<f4"), ("rel_error", "<f2")])
+
+# voxels summed at once while building a level, bounds the temporary arrays of build_pyramid
+SLAB_VOXELS = 1 << 22
+
+# points looked up at once, bounds the temporary arrays of query
+QUERY_BATCH = 1 << 15
+
+def coarsen_boundaries(boundaries):
+    """ Returns the boundaries of the next level of an axis (every other boundary, the last voxel is alone if the count is odd) """
+    coarse = boundaries[::2]
+    if (len(boundaries) - 1) % 2:
+        coarse = np.append(coarse, boundaries[-1])
+    return coarse
+
+def grid_sums(grid, boundaries, start, stop):
+    """
+    Returns the sums of x slices [start, stop) of a dense grid, see block_sums.
+
+    Parameters
+    ----------
+    grid : numpy.ndarray
+        (2, nx, ny, nz) results and relative errors (NaN where the tally has no row, see tally_grid.TallyGrid)
+    boundaries : list
+        x, y, z voxel boundaries of the grid
+    """
+    widths = [np.diff(b) for b in boundaries]
+    result = grid[0, start:stop].astype(np.float64)
+    rel_error = grid[1, start:stop].astype(np.float64)
+    volume = widths[0][start:stop, None, None] * widths[1][None, :, None] * widths[2][None, None, :]
+    volume = np.where(np.isfinite(result), volume, 0.0)
+    result = np.nan_to_num(result)
+    weighted_error = volume * np.abs(result) * np.nan_to_num(rel_error)
+    return np.stack([volume * result, weighted_error ** 2, volume])
+
+def block_sums(sums):
+    """
+    Adds up every 2x2x2 block of voxels into one voxel of the next level (odd sizes get a voxel of the last one alone).
+
+    The sums of a voxel are its volume weighted result (V * x), its squared volume weighted absolute error ((V * x * r)^2),
+    and the volume of its voxels that have a result (V), so the result of a voxel is V * x / V and its relative error sqrt((V * x * r)^2) / |V * x|.
+    The errors of the voxels are independent, so their variances add up, and the sums of a block are the sums of its voxels.
+
+    Parameters
+    ----------
+    sums : numpy.ndarray
+        (3, nx, ny, nz) sums of the voxels of a level
+    """
+    padding = [(0, 0)] + [(0, size % 2) for size in sums.shape[1:]]
+    sums = np.pad(sums, padding)
+    _, nx, ny, nz = sums.shape
+    return sums.reshape(3, nx // 2, 2, ny // 2, 2, nz // 2, 2).sum(axis=(2, 4, 6))
+
+def level_values(sums):
+    """ Returns the results and relative errors of voxels from their sums (see block_sums), NaN where they have no result """
+    weighted_result, squared_error, volume = sums
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.where(volume > 0, weighted_result / volume, np.nan)
+        rel_error = np.where(weighted_result != 0, np.sqrt(squared_error) / np.abs(weighted_result), 0.0)
+    return result, np.where(volume > 0, rel_error, np.nan)
+
+def encode_bricks(sums, x_start, brick_shape, threshold):
+    """
+    Splits x slices of a level into bricks, and keeps the voxels with a result of at least threshold (in magnitude).
+
+    Parameters
+    ----------
+    sums : numpy.ndarray
+        (3, s, ny, nz) sums of x slices [x_start, x_start + s) of the level, x_start is a multiple of BRICK
+    brick_shape : tuple
+        number of bricks along x, y, z of the level
+    threshold : float
+        smallest result stored
+
+    Returns
+    -------
+    tuple
+        sorted (b,) keys of the bricks with a stored voxel (index in the level's brick grid, x major),
+        (b,) number of stored voxels of every brick, (b, BRICK ** 3 / 8) bitmasks of the stored voxels, and the stored values (VALUE_DTYPE)
+    """
+    result, rel_error = level_values(sums)
+    keep = np.isfinite(result) & (np.abs(np.nan_to_num(result)) >= threshold)
+
+    def bricks(values, fill):
+        padding = [(0, -size % BRICK) for size in values.shape]
+        values = np.pad(values, padding, constant_values=fill)
+        bx, by, bz = (size // BRICK for size in values.shape)
+        return values.reshape(bx, BRICK, by, BRICK, bz, BRICK).transpose(0, 2, 4, 1, 3, 5).reshape(bx * by * bz, BRICK ** 3), (bx, by, bz)
+
+    keep, (bx, by, bz) = bricks(keep, False)
+    stored = keep.any(axis=1)
+    bi, bj, bk = np.unravel_index(np.flatnonzero(stored), (bx, by, bz))
+    keys = ((x_start // BRICK + bi) * brick_shape[1] + bj) * brick_shape[2] + bk
+    keep = keep[stored]
+    values = np.empty(int(keep.sum()), dtype=VALUE_DTYPE)
+    values["result"] = bricks(result, np.nan)[0][stored][keep]
+    values["rel_error"] = bricks(rel_error, np.nan)[0][stored][keep]
+    return keys.astype(np.uint64), keep.sum(axis=1), np.packbits(keep, axis=1), values
+
+def write_array(f, array):
+    """ Writes an array (little endian, aligned to 8 bytes) and returns its offset in the file """
+    f.write(b"\0" * (-f.tell() % 8))
+    offset = f.tell()
+    np.ascontiguousarray(array).tofile(f)
+    return offset
+
+def load_grid(tally_file, pyramid_file):
+    """ Returns the TallyGrid of a grid (.npy built by tally_grid) or of a tally (.csv/.npz written by mcnp_to_csv, built next to the pyramid) """
+    if Path(tally_file).suffix == ".npy":
+        return TallyGrid(tally_file)
+    pyramid_file = Path(pyramid_file)
+    return build_grid(tally_file, pyramid_file.with_name(f"{pyramid_file.stem}_grid.npy"))
+
+def build_pyramid(tally_file, pyramid_file, levels=3, threshold=0.0):
+    """
+    Builds the pyramid of a tally: its full resolution grid and levels coarser ones, each twice as coarse as the one before.
+
+    Parameters
+    ----------
+    tally_file : str
+        the .csv or .npz written by mcnp_to_csv, or a grid (.npy) built by tally_grid
+    pyramid_file : str
+        where to store the pyramid
+    levels : int
+        number of coarser levels (3 builds 2x, 4x, and 8x coarser grids)
+    threshold : float
+        voxels with a smaller result (in magnitude) aren't stored, and read as NaN like the voxels without a result
+
+    Returns
+    -------
+    TallyPyramid
+        the pyramid
+    """
+    grid = load_grid(tally_file, pyramid_file)
+    boundaries = grid.boundaries
+    footer = {"version": VERSION, "brick": BRICK, "threshold": threshold, "levels": []}
+    # the sums of the coarser levels are built while their finer level is stored
+    with tempfile.TemporaryDirectory(dir=Path(pyramid_file).resolve().parent) as temp_folder, open(pyramid_file, 'wb') as f:
+        f.write(MAGIC)
+        source = None
+        for level in range(levels + 1):
+            shape = tuple(len(b) - 1 for b in boundaries)
+            brick_shape = tuple(-(-size // BRICK) for size in shape)
+            record = {"factor": 2 ** level, "shape": list(shape), "boundaries": [write_array(f, b.astype("<f8")) for b in boundaries]}
+            coarse_boundaries = [coarsen_boundaries(b) for b in boundaries]
+            coarse = None
+            if level < levels:
+                coarse = np.lib.format.open_memmap(Path(temp_folder) / f"level{level + 1}.npy", mode='w+', dtype=np.float64,
+                                                   shape=(3,) + tuple(len(b) - 1 for b in coarse_boundaries))
+
+            # slabs of x slices line up with the bricks of this level and the 2x2x2 blocks of the next one
+            slab = max(SLAB_VOXELS // max(shape[1] * shape[2], 1) // (2 * BRICK), 1) * 2 * BRICK
+            keys, counts, masks = [], [], []
+            f.write(b"\0" * (-f.tell() % 8))
+            record["values"] = f.tell()
+            for start in range(0, shape[0], slab):
+                stop = min(start + slab, shape[0])
+                sums = grid_sums(grid.grid, boundaries, start, stop) if source is None else np.asarray(source[:, start:stop])
+                brick_keys, brick_counts, brick_masks, values = encode_bricks(sums, start, brick_shape, threshold)
+                values.tofile(f)
+                keys.append(brick_keys)
+                counts.append(brick_counts)
+                masks.append(brick_masks)
+                if coarse is not None:
+                    coarse[:, start // 2:(stop + 1) // 2] = block_sums(sums)
+            counts = np.concatenate(counts)
+            record["bricks"] = len(counts)
+            record["voxels"] = int(counts.sum())
+            record["keys"] = write_array(f, np.concatenate(keys).astype("<u8"))
+            record["starts"] = write_array(f, np.concatenate([[0], np.cumsum(counts)]).astype("<u8"))
+            record["masks"] = write_array(f, np.concatenate(masks))
+            footer["levels"].append(record)
+
+            if coarse is not None:
+                coarse.flush()
+            source = coarse
+            boundaries = coarse_boundaries
+        del source, coarse
+        footer = json.dumps(footer).encode()
+        f.write(footer)
+        f.write(struct.pack("<Q", len(footer)))
+        f.write(MAGIC)
+    return TallyPyramid(pyramid_file)
+
+class PyramidGrid:
+    """ Dense grid of a region of one level of a pyramid, with the attributes of tally_grid.TallyGrid (see TallyPyramid.region).
+
+    Attributes
+    ----------
+    boundaries : list
+        sorted x, y, z voxel boundaries of the region
+    centers : list
+        x, y, z voxel centers of the region
+    grid : numpy.ndarray
+        (2, nx, ny, nz) float32 array, grid[0] is the result and grid[1] the relative error (NaN where the tally has no row or the voxel was pruned)
+    """
+    def __init__(self, boundaries, grid):
+        self.boundaries = boundaries
+        self.centers = [(b[:-1] + b[1:]) / 2 for b in boundaries]
+        self.grid = grid
+
+class TallyPyramid:
+    """ Lazily read pyramid of an mcnp mesh tally (see build_pyramid), only the bricks that are looked up are read from the file.
+
+    Attributes
+    ----------
+    data : numpy.memmap
+        the bytes of the pyramid file
+    levels : list
+        "factor", "shape", number of stored "bricks" and "voxels", and the offsets of the arrays of every level (0 is the full resolution)
+    threshold : float
+        smallest result (in magnitude) that was stored
+
+    Methods
+    -------
+    boundaries(level):
+        Returns the x, y, z voxel boundaries of a level
+    level_for(voxel_size):
+        Returns the coarsest level whose voxels are at most voxel_size wide
+    read(level, low, high):
+        Returns the dense results and relative errors of a box of voxels of a level
+    region(level, lower, upper):
+        Returns the PyramidGrid of the voxels of a level that overlap a box (in the units of the tally)
+    query(points, level):
+        Returns the result and relative error at each point
+    """
+    def __init__(self, pyramid_file):
+        """
+        Parameters
+        ----------
+        pyramid_file : str
+            the pyramid_file passed to build_pyramid
+        """
+        self.data = np.memmap(pyramid_file, dtype=np.uint8, mode='r')
+        end = len(self.data) - len(MAGIC)
+        if bytes(self.data[:len(MAGIC)]) != MAGIC or bytes(self.data[end:]) != MAGIC:
+            raise ValueError(f"{pyramid_file} is not a tally pyramid")
+        footer_length, = struct.unpack("<Q", bytes(self.data[end - 8:end]))
+        footer = json.loads(bytes(self.data[end - 8 - footer_length:end - 8]))
+        if footer["version"] != VERSION or footer["brick"] != BRICK:
+            raise ValueError(f"{pyramid_file} has version {footer['version']} (brick {footer['brick']}), only version {VERSION} (brick {BRICK}) can be read")
+        self.levels = footer["levels"]
+        self.threshold = footer["threshold"]
+
+    def _array(self, offset, dtype, count):
+        return np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+
+    def _bricks(self, level):
+        record = self.levels[level]
+        keys = self._array(record["keys"], "<u8", record["bricks"])
+        starts = self._array(record["starts"], "<u8", record["bricks"] + 1)
+        masks = self._array(record["masks"], np.uint8, record["bricks"] * BRICK ** 3 // 8).reshape(-1, BRICK ** 3 // 8)
+        values = self._array(record["values"], VALUE_DTYPE, record["voxels"])
+        return keys, starts, masks, values
+
+    def _find(self, level, keys):
+        """ Returns the position of every brick key in the level (-1 for bricks without stored voxels) """
+        stored = self._bricks(level)[0]
+        positions = np.searchsorted(stored, keys)
+        found = positions < len(stored)
+        found[found] = stored[positions[found]] == keys[found]
+        return np.where(found, positions, -1)
+
+    def boundaries(self, level):
+        """ Returns the x, y, z voxel boundaries of a level """
+        record = self.levels[level]
+        return [np.array(self._array(offset, "<f8", size + 1)) for offset, size in zip(record["boundaries"], record["shape"])]
+
+    def level_for(self, voxel_size):
+        """ Returns the coarsest level whose voxels are at most voxel_size wide along every axis (0 if none are) """
+        for level in reversed(range(len(self.levels))):
+            if max(np.diff(b).max() for b in self.boundaries(level)) <= voxel_size:
+                return level
+        return 0
+
+    def read(self, level=0, low=(0, 0, 0), high=None):
+        """
+        Returns the results and relative errors of a box of voxels of a level.
+
+        Parameters
+        ----------
+        level : int
+            0 for the full resolution grid, i for the grid 2^i times coarser
+        low, high : tuple
+            first and past the last voxel index along x, y, z (high defaults to the shape of the level)
+
+        Returns
+        -------
+        numpy.ndarray
+            (2, nx, ny, nz) float32 array, [0] is the result and [1] the relative error (NaN where the tally has no row or the voxel was pruned)
+        """
+        shape = np.array(self.levels[level]["shape"])
+        low = np.clip(np.asarray(low, dtype=np.int64), 0, shape)
+        high = np.clip(np.asarray(high if high is not None else shape, dtype=np.int64), low, shape)
+        brick_shape = -(-shape // BRICK)
+        brick_low = low // BRICK
+        brick_high = -(-high // BRICK)
+        span = brick_high - brick_low
+        grid = np.full((2, int(span.prod()), BRICK ** 3), np.nan, dtype=np.float32)
+
+        if span.prod() > 0:
+            bi, bj, bk = np.meshgrid(*(np.arange(lo, hi) for lo, hi in zip(brick_low, brick_high)), indexing='ij')
+            positions = self._find(level, ((bi * brick_shape[1] + bj) * brick_shape[2] + bk).reshape(-1).astype(np.uint64))
+            targets = np.flatnonzero(positions >= 0)
+            positions = positions[targets]
+            _, starts, masks, values = self._bricks(level)
+            counts = (starts[positions + 1] - starts[positions]).astype(np.int64)
+            # the stored voxels of every brick are contiguous, so they are gathered with one index array
+            offsets = np.repeat(starts[positions].astype(np.int64) - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+            stored = values[np.arange(counts.sum()) + offsets]
+            keep = np.unpackbits(masks[positions], axis=1).astype(bool)
+            brick_values = np.full((len(targets), BRICK ** 3), np.nan, dtype=np.float32)
+            brick_values[keep] = stored["result"]
+            grid[0, targets] = brick_values
+            brick_values[keep] = stored["rel_error"]
+            grid[1, targets] = brick_values
+
+        grid = grid.reshape(2, *span, BRICK, BRICK, BRICK).transpose(0, 1, 4, 2, 5, 3, 6).reshape(2, *(span * BRICK))
+        crop = low - brick_low * BRICK
+        return np.ascontiguousarray(grid[:, crop[0]:crop[0] + high[0] - low[0], crop[1]:crop[1] + high[1] - low[1], crop[2]:crop[2] + high[2] - low[2]])
+
+    def region(self, level=0, lower=None, upper=None):
+        """
+        Returns the voxels of a level that overlap a box.
+
+        Parameters
+        ----------
+        level : int
+            see read
+        lower, upper : tuple
+            x, y, z corners of the box, in the units of the tally (None for the whole level)
+
+        Returns
+        -------
+        PyramidGrid
+            the boundaries and dense grid of the voxels
+        """
+        boundaries = self.boundaries(level)
+        low = [0, 0, 0] if lower is None else [max(np.searchsorted(b, value, side='right') - 1, 0) for b, value in zip(boundaries, lower)]
+        high = [len(b) - 1 for b in boundaries] if upper is None else [np.searchsorted(b, value, side='left') for b, value in zip(boundaries, upper)]
+        high = [max(h, l) for l, h in zip(low, high)]
+        return PyramidGrid([b[l:h + 1] for b, l, h in zip(boundaries, low, high)], self.read(level, low, high))
+
+    def query(self, points, level=0):
+        """
+        Returns the result and relative error of the voxel of a level containing each point (NaN outside the mesh or where it was pruned).
+
+        Parameters
+        ----------
+        points : numpy.ndarray
+            (n, 3) x, y, z positions, in the units of the tally
+        level : int
+            see read
+
+        Returns
+        -------
+        tuple
+            (n,) results and (n,) relative errors
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        boundaries = self.boundaries(level)
+        brick_shape = -(-np.array(self.levels[level]["shape"]) // BRICK)
+        _, starts, masks, values = self._bricks(level)
+        result = np.full(len(points), np.nan)
+        rel_error = np.full(len(points), np.nan)
+        for start in range(0, len(points), QUERY_BATCH):
+            batch = np.arange(start, min(start + QUERY_BATCH, len(points)))
+            i, j, k = (voxel_indices(b, points[batch, axis]) for axis, b in enumerate(boundaries))
+            inside = (i >= 0) & (j >= 0) & (k >= 0)
+            batch, i, j, k = batch[inside], i[inside], j[inside], k[inside]
+            keys = ((i // BRICK * brick_shape[1] + j // BRICK) * brick_shape[2] + k // BRICK).astype(np.uint64)
+            positions = self._find(level, keys)
+            found = positions >= 0
+            batch, positions = batch[found], positions[found]
+            local = ((i[found] % BRICK) * BRICK + j[found] % BRICK) * BRICK + k[found] % BRICK
+            bits = np.unpackbits(masks[positions], axis=1)
+            rows = np.arange(len(positions))
+            stored = bits[rows, local].astype(bool)
+            # the stored voxels of a brick are in order, so a voxel's value comes after the ones of the stored voxels before it
+            rank = np.cumsum(bits, axis=1, dtype=np.int16)[rows, local] - 1
+            voxels = values[starts[positions[stored]].astype(np.int64) + rank[stored]]
+            result[batch[stored]] = voxels["result"]
+            rel_error[batch[stored]] = voxels["rel_error"]
+        return result, rel_error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = "MCNP mesh tally to multiresolution pyramid converter")
+    parser.add_argument("tallyFile", type = str, help = ".csv or .npz written by mcnp_to_csv, or a grid .npy built by tally_grid")
+    parser.add_argument("pyramidFile", type = str, help = "output pyramid filename (.tpyr)")
+    parser.add_argument("--levels", type = int, default = 3, help = "number of coarser levels, each twice as coarse as the one before (3 builds 2x, 4x, 8x)")
+    parser.add_argument("--threshold", type = float, default = 0.0, help = "don't store voxels whose result is smaller than this")
+
+    args = parser.parse_args()
+
+    pyramid = build_pyramid(args.tallyFile, args.pyramidFile, args.levels, args.threshold)
+    for record in pyramid.levels:
+        dense = 2 * 4 * int(np.prod(record["shape"]))
+        print(f"level {record['factor']}x: {record['voxels']} of {int(np.prod(record['shape']))} voxels stored in {record['bricks']} bricks "
+              f"({(record['voxels'] * VALUE_DTYPE.itemsize + record['bricks'] * (BRICK ** 3 // 8 + 16)) / (1 << 20):.1f} MB, {dense / (1 << 20):.1f} MB dense)")
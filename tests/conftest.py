@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "stl_to_obj"), str(ROOT / "benchmarks")]
+
+# the bpy dependent modules import Blender's stand-in when Blender isn't installed
+import blender_standin # noqa: E402
+blender_standin.install()
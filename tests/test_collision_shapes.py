@@ -0,0 +1,32 @@
+import warnings
+
+import numpy as np
+
+import collision_shapes
+
+def disk(radius, thickness, segments):
+    angles = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    ring = np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+    return np.concatenate([np.column_stack([ring, np.zeros(segments)]), np.column_stack([ring, np.full(segments, thickness)])])
+
+def test_thin_disk_hull_is_capped():
+    # clustering a thin disk flattens its hull before it has few enough points
+    for thickness in [0.05, 0.001]:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            shape, triangles = collision_shapes.convex_shape(disk(1, thickness, 400))
+        assert len(shape["points"]) // 3 <= collision_shapes.MAX_HULL_POINTS
+        assert triangles > 0
+
+def test_flat_hull_is_capped():
+    shape, triangles = collision_shapes.convex_shape(disk(1, 0, 400))
+    assert len(shape["points"]) // 3 == collision_shapes.MAX_HULL_POINTS
+    assert triangles == 0
+
+def test_convex_hull_contains_points():
+    points = np.random.default_rng(0).normal(size=(5000, 3))
+    hull_points, hull_triangles = collision_shapes.convex_hull(points)
+    corners = hull_points[hull_triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    assert (points @ normals.T - np.sum(normals * corners[:, 0], axis=1)).max() < 1e-9
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import pytest
+
+import manifest
+import textures
+import stl_to_tscn
+
+STL_TO_OBJ = Path(__file__).resolve().parent.parent / "stl_to_obj"
+
+def load(tmp_path, lines):
+    textures.load_textures(STL_TO_OBJ / "textures.json")
+    (tmp_path / "input.jsonl").write_text("\n".join(lines) + "\n")
+    header, rows = manifest.open_manifest(tmp_path / "input.jsonl")
+    return manifest.load_meshes(header, rows, tmp_path, {"uv_map": list(stl_to_tscn.UV_MAPS), "mesh_format": stl_to_tscn.MESH_FORMATS},
+                                [(("lods", "lod_distances"), stl_to_tscn.parse_lods)])
+
+def test_decimated_collision_mode_is_valid(tmp_path):
+    meshes = load(tmp_path, ['{"header": {"input_folder": ".", "output_folder": "Out"}}',
+                             '{"stl_file": "walls.stl", "uv_map": "cube", "texture": "Plaster", "collisions": true, "collision_mode": "decimated:0.25"}'])
+    assert meshes[0]["collision_mode"] == "decimated:0.25"
+
+def test_invalid_parameters_are_reported_together(tmp_path):
+    with pytest.raises(ValueError) as error:
+        load(tmp_path, ['{"header": {"input_folder": ".", "output_folder": "Out"}}',
+                        '{"stl_file": "walls.stl", "uv_map": "cube", "texture": "Plaster", "collision_mode": "decimated:2"}',
+                        '{"stl_file": "floor.stl", "uv_map": "cube", "texture": "Plaster", "lods": [1.0, 0.5], "lod_distances": []}',
+                        '{"stl_file": "ceiling.stl", "uv_map": "cube", "texture": "Plaster", "tiles": "grid:2x2"}'])
+    message = str(error.value)
+    assert "input.jsonl line 2: invalid collision_mode decimated:2" in message
+    assert "input.jsonl line 3: invalid lod_distances" in message
+    assert "input.jsonl line 4: invalid tiles grid:2x2" in message
+
+def test_defaults_keep_dots_in_directory_names():
+    defaults = manifest.load_defaults({"defaults": {"./shields/": {"uv_map": "cube"}, ".hidden": {"uv_map": "smart"}, "v1.": {"uv_map": "sphere"}}})
+    assert manifest.directory_defaults(defaults, "shields/a.stl") == {"uv_map": "cube"}
+    assert manifest.directory_defaults(defaults, ".hidden/a.stl") == {"uv_map": "smart"}
+    assert manifest.directory_defaults(defaults, "v1./a.stl") == {"uv_map": "sphere"}
@@ -0,0 +1,22 @@
+import numpy as np
+
+import stl_io
+import synthetic
+
+def test_weld_matches_unique_rows():
+    corners = np.random.default_rng(0).integers(-4, 4, (3000, 3)).astype(np.float32)
+    corners[::5] *= -1.0
+    positions, indices = stl_io.weld(corners)
+    expected, inverse = np.unique(corners + np.float32(0), axis=0, return_inverse=True)
+    assert np.array_equal(positions, expected)
+    assert np.array_equal(indices, inverse.reshape(-1, 3))
+    assert indices.dtype == np.uint32
+    # -0.0 and 0.0 are welded together
+    assert not np.any(np.signbit(positions) & (positions == 0))
+
+def test_binary_stl_round_trip(tmp_path):
+    corners = np.random.default_rng(1).random((300, 3)).astype(np.float32)
+    synthetic.write_binary_stl(tmp_path / "part.stl", corners.reshape(-1, 3, 3))
+    [solid] = stl_io.read_stl(tmp_path / "part.stl")
+    assert solid.triangle_count == 100
+    assert np.array_equal(solid.positions[solid.indices].reshape(-1, 3), corners)
@@ -0,0 +1,38 @@
+import numpy as np
+
+import tally_grid
+from mcnp_to_csv import VoxelArrays
+
+BOUNDARIES = [np.array([0.0, 1.0, 2.0]), np.array([0.0, 1.0]), np.array([0.0, 1.0])]
+
+# x, y, z, result, relative error of the two voxels
+ROWS = np.array([[0.5, 0.5, 0.5, 1.5, 0.1], [1.5, 0.5, 0.5, 2.5, 0.2]])
+
+def write_csv(path, rows):
+    with open(path, 'w') as f:
+        for axis in BOUNDARIES:
+            f.write(','.join(str(b) for b in axis) + '\n')
+        for row in rows:
+            f.write(','.join(str(value) for value in row) + '\n')
+
+def check_grid(grid):
+    result, rel_error = grid.query(ROWS[:, :3])
+    assert np.allclose(result, ROWS[:, 3])
+    assert np.allclose(rel_error, ROWS[:, 4])
+
+def test_csv_with_volume_columns(tmp_path):
+    # MCNP6 tallies have Volume and Rslt*Vol after the relative error
+    write_csv(tmp_path / "tally.csv", np.column_stack([ROWS, np.ones(2), ROWS[:, 3]]))
+    check_grid(tally_grid.build_grid(tmp_path / "tally.csv", tmp_path / "grid"))
+
+def test_npz_in_chunks(tmp_path, monkeypatch):
+    voxels = VoxelArrays(tmp_path)
+    voxels.add(ROWS)
+    voxels.save(tmp_path / "tally.npz", BOUNDARIES)
+    voxels.close()
+    monkeypatch.setattr(tally_grid, "CSV_CHUNK_ROWS", 1)
+    _, rows = tally_grid.read_npz_rows(tmp_path / "tally.npz")
+    chunks = list(rows)
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert np.allclose(np.concatenate(chunks), ROWS)
+    check_grid(tally_grid.build_grid(tmp_path / "tally.npz", tmp_path / "grid"))
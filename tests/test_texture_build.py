@@ -0,0 +1,20 @@
+import pytest
+
+import texture_build
+
+def test_keep_maps_every_source_format():
+    assert texture_build.output_format("Metal_Color.tga", "keep") == (".tga", "TARGA")
+    assert texture_build.output_format("Metal_Color.BMP", "keep") == (".BMP", "BMP")
+    assert texture_build.output_format("Metal_Color.tga", "webp") == (".webp", "WEBP")
+    with pytest.raises(ValueError, match="can't keep the format of Metal_Color.gif"):
+        texture_build.output_format("Metal_Color.gif", "keep")
+
+def test_unknown_source_format_fails_before_writing(tmp_path):
+    source = tmp_path / "source" / "Metal"
+    source.mkdir(parents=True)
+    for filename in ["Metal_Color.jpg", "Metal_Normal.gif"]:
+        (source / filename).write_bytes(b"image")
+    result = texture_build.build_texture(tmp_path / "source", tmp_path / "output", "Metal",
+                                         {"albedo": "Metal_Color.jpg", "normal": "Metal_Normal.gif"})
+    assert result["error"].startswith("ValueError: can't keep the format of Metal_Normal.gif")
+    assert not (tmp_path / "output" / texture_build.BUILD_FOLDER).exists()
@@ -0,0 +1,18 @@
+import os
+
+from worker_pool import run_pool
+
+def crash_on_two(x):
+    # kills its worker like a Blender segfault would
+    if x == 2:
+        os._exit(1)
+    if x == 3:
+        raise ValueError("bad input")
+    return x * 10
+
+def test_dead_worker_only_fails_its_own_task():
+    results = run_pool(crash_on_two, [(x,) for x in range(6)], 2, lambda error: error)
+    assert results[:2] == [0, 10]
+    assert results[2].startswith("BrokenProcessPool")
+    assert results[3] == "ValueError: bad input"
+    assert results[4:] == [40, 50]